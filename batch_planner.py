@@ -0,0 +1,210 @@
+# Deduplicating batch planner for files that repeat the same ZIP codes.
+# Invoice files repeat a few thousand ZIPs across millions of rows, so resolving the
+# location, matching the rate and parsing the rate components per row repeats the
+# same work. The planner factorizes each chunk's ZIP column into its distinct ZIPs
+# and an index array, does the ZIP work once per distinct ZIP (remembered for the
+# whole file when the ZIP is well-formed; malformed ones are planned again in every
+# chunk, so the cache holds at most one entry per 5-digit ZIP), and broadcasts the
+# results back to the rows. Only the payment-dependent
+# arithmetic runs per row. Rows come out identical to batch_pricing.price_row.
+import time
+from array import array
+from decimal import Decimal
+
+from batch_pricing import error_row, format_rate
+from final import (
+    calculate_remittance,
+    get_locations_from_zips,
+    match_tax_rate,
+    parse_tax_components,
+    validate_monthly_payment,
+    validate_zip_code,
+)
+from rate_table import build_rate_table
+
+
+# Function to factorize values into (distinct values in first-seen order, index array)
+# so that values[i] == uniques[codes[i]]
+def factorize(values):
+    positions = {}
+    uniques = []
+    codes = array('I')
+    for value in values:
+        code = positions.get(value)
+        if code is None:
+            code = positions[value] = len(uniques)
+            uniques.append(value)
+        codes.append(code)
+    return uniques, codes
+
+
+# Function to expand one value per distinct key back to one value per row
+def broadcast(values, codes):
+    return [values[code] for code in codes]
+
+
+# Everything about a ZIP that does not depend on the payment. row is an output row
+# template: a finished error row, or the location and rate columns of a priced row.
+class ZipPlan:
+    __slots__ = ('row', 'location', 'tax_rate', 'rate_decimal', 'components')
+
+    def __init__(self, row, location=None, tax_rate=None, components=None):
+        self.row = row
+        self.location = location
+        self.tax_rate = tax_rate
+        self.components = components
+        self.rate_decimal = Decimal(tax_rate.strip('%')) / 100 if tax_rate else None
+
+
+# Running totals for a planned run: rows and planned ZIPs seen, how many of them had a
+# rate, and time spent resolving locations, matching rates and pricing rows
+class PlanStats:
+    def __init__(self):
+        self.rows = 0
+        # Distinct ZIPs planned; a malformed ZIP counts once for every chunk it is in
+        self.unique_zips = 0
+        self.rated_rows = 0
+        self.rated_zips = 0
+        self.location_seconds = 0.0
+        self.rate_seconds = 0.0
+        self.row_seconds = 0.0
+
+    # Rows per planned ZIP
+    @property
+    def dedup_ratio(self):
+        return self.rows / self.unique_zips if self.unique_zips else 0.0
+
+    # Estimated time a per-row loop would have spent matching rates and parsing components
+    # again: the average planning time per ZIP for every row that reused a plan
+    @property
+    def saved_seconds(self):
+        if not self.unique_zips:
+            return 0.0
+        return (self.rows - self.unique_zips) * self.rate_seconds / self.unique_zips
+
+    def as_dict(self):
+        return {
+            'rows': self.rows,
+            'unique_zips': self.unique_zips,
+            'dedup_ratio': self.dedup_ratio,
+            'rated_rows': self.rated_rows,
+            'rated_zips': self.rated_zips,
+            'location_seconds': self.location_seconds,
+            'rate_seconds': self.rate_seconds,
+            'row_seconds': self.row_seconds,
+            'saved_seconds': self.saved_seconds,
+        }
+
+    def summary(self):
+        return (f"{self.rows} rows, {self.unique_zips} planned ZIPs ({self.dedup_ratio:.1f} rows per ZIP): "
+                f"locations {self.location_seconds:.3f} s, rates and components {self.rate_seconds:.3f} s, "
+                f"rows {self.row_seconds:.3f} s; about {self.saved_seconds:.3f} s of per-row rate work saved")
+
+
+# Prices chunks of (zip, payment) rows doing the ZIP work once per distinct ZIP
+class BatchPlanner:
+    def __init__(self, tax_data):
+        self.rate_table = build_rate_table(tax_data)
+        self.plans = {}
+        self.stats = PlanStats()
+
+    # Plans for a chunk's distinct ZIPs, resolving the ones not planned yet with one batch
+    # query. Only well-formed ASCII ZIPs are remembered, which bounds the cache however
+    # many distinct malformed values a file holds.
+    def _plan_zips(self, zip_codes):
+        plans = self.plans
+        new_zips = [zip_code for zip_code in zip_codes if zip_code not in plans]
+        if not new_zips:
+            return [plans[zip_code] for zip_code in zip_codes]
+
+        started = time.perf_counter()
+        valid_zips = [zip_code for zip_code in new_zips if validate_zip_code(zip_code)]
+        locations = dict(zip(valid_zips, get_locations_from_zips(valid_zips)))
+        planned = time.perf_counter()
+        self.stats.location_seconds += planned - started
+        new_plans = {zip_code: self._plan_zip(zip_code, locations.get(zip_code)) for zip_code in new_zips}
+        self.stats.rate_seconds += time.perf_counter() - planned
+        self.stats.unique_zips += len(new_zips)
+        self.stats.rated_zips += sum(1 for plan in new_plans.values() if plan.tax_rate is not None)
+
+        for zip_code in valid_zips:
+            if zip_code.isascii():
+                plans[zip_code] = new_plans[zip_code]
+        return [plans.get(zip_code) or new_plans[zip_code] for zip_code in zip_codes]
+
+    # The ZIP-only checks of price_row, in the same order
+    def _plan_zip(self, zip_code, location_info):
+        if not validate_zip_code(zip_code):
+            return ZipPlan(error_row(zip_code, '', "Invalid ZIP code"))
+
+        if not location_info:
+            return ZipPlan(error_row(zip_code, '', f"No information found for ZIP code {zip_code}"))
+
+        if location_info['state'] != 'CALIFORNIA':
+            return ZipPlan(error_row(zip_code, '', "Not a California ZIP code", location_info))
+
+        tax_rate, match, _ = match_tax_rate(location_info['city'], location_info['county'], self.rate_table)
+        if not tax_rate:
+            return ZipPlan(error_row(zip_code, '', f"No tax rate found for {location_info['city']}, {location_info['county']}", location_info))
+
+        state_rate, city_rate, county_rate = components = parse_tax_components(tax_rate)
+        if state_rate is None or city_rate is None or county_rate is None:
+            return ZipPlan(error_row(zip_code, '', "Error calculating tax components", location_info))
+
+        row = {
+            'zip': zip_code,
+            'payment': '',
+            'city': location_info['city'],
+            'county': location_info['county'],
+            'state': location_info['state'],
+            'tax_rate': tax_rate,
+            'match': match,
+            'state_rate': format_rate(state_rate),
+            'city_rate': format_rate(city_rate),
+            'county_rate': format_rate(county_rate),
+            'total_tax': '',
+            'state_remittance': '',
+            'city_remittance': '',
+            'county_remittance': '',
+            'error': ''
+        }
+        return ZipPlan(row, location_info, tax_rate, components)
+
+    # The payment-dependent part of price_row for one row of a planned ZIP
+    def _price(self, plan, zip_code, payment):
+        row = plan.row.copy()
+        if plan.tax_rate is None:
+            row['payment'] = payment
+            return row
+
+        if not validate_monthly_payment(payment):
+            return error_row(zip_code, payment, "Invalid payment amount", plan.location)
+
+        monthly_payment = Decimal(payment)
+        # Same arithmetic as calculate_taxes, with the rate parsed once per ZIP
+        total_tax = monthly_payment * plan.rate_decimal
+        state_remittance, city_remittance, county_remittance = calculate_remittance(total_tax, *plan.components)
+
+        row['payment'] = f"{monthly_payment:.2f}"
+        row['total_tax'] = f"{total_tax:.2f}"
+        row['state_remittance'] = f"{state_remittance:.2f}"
+        row['city_remittance'] = f"{city_remittance:.2f}"
+        row['county_remittance'] = f"{county_remittance:.2f}"
+        return row
+
+    # Price one chunk of (zip, payment) rows, returning output rows in input order
+    def price_chunk(self, chunk):
+        zip_codes, codes = factorize(zip_code for zip_code, _ in chunk)
+        zip_plans = self._plan_zips(zip_codes)
+
+        started = time.perf_counter()
+        plans = broadcast(zip_plans, codes)
+        rows = [
+            self._price(plan, zip_code, payment)
+            for plan, (zip_code, payment) in zip(plans, chunk)
+        ]
+        self.stats.rows += len(chunk)
+        self.stats.rated_rows += sum(1 for plan in plans if plan.tax_rate is not None)
+        self.stats.row_seconds += time.perf_counter() - started
+        return rows
+
@@ -0,0 +1,399 @@
+# Non-interactive batch pricing for the remittance pipeline.
+# Streams (zip, payment) rows from a CSV or Parquet file in fixed-size chunks,
+# runs the same steps as final.py's main loop and writes one result row per input row.
+import argparse
+import csv
+import json
+import operator
+import os
+import sys
+from contextlib import nullcontext
+from decimal import Decimal
+from json.encoder import encode_basestring_ascii as escape_json_string
+
+from final import (
+    calculate_remittance,
+    calculate_taxes,
+    get_locations_from_zips,
+    match_tax_rate,
+    parse_tax_components,
+    validate_monthly_payment,
+    validate_zip_code,
+)
+from instrumentation import METRICS, profiled
+from rate_cache import load_saved_page, load_tax_data
+
+DEFAULT_CHUNK_SIZE = 50000
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+# match is the name_matching tier that found the rate; 'unincorporated' and 'county'
+# mean the city itself was not found and a county-level rate was used instead
+OUTPUT_FIELDS = [
+    'zip', 'payment', 'city', 'county', 'state', 'tax_rate', 'match', 'state_rate', 'city_rate', 'county_rate',
+    'total_tax', 'state_remittance', 'city_remittance', 'county_remittance', 'error'
+]
+
+# The layout of final.format_output plus the matching tier, filled from an output row with one format call
+TEXT_TEMPLATE = '\n'.join([
+    "Location ZIP: {zip}",
+    "Payment amount: ${payment}",
+    "City: {city}",
+    "County: {county}",
+    "State: {state}",
+    "Total tax rate: {tax_rate}",
+    "Rate matched by: {match}",
+    "State tax rate: {state_rate}",
+    "City tax rate: {city_rate}",
+    "County tax rate: {county_rate}",
+    "Total tax to be paid: ${total_tax}",
+    "Remittance amount to state: ${state_remittance}",
+    "Remittance amount to city: ${city_remittance}",
+    "Remittance amount to county: ${county_remittance}",
+])
+TEXT_ERROR_TEMPLATE = "Location ZIP: {zip}\nError: {error}"
+
+
+# Function to tell whether a path names a Parquet file
+def is_parquet(path):
+    return str(path).lower().endswith(('.parquet', '.pq'))
+
+
+# Function to read (zip, payment, *extra columns) rows from a CSV file in chunks
+def read_csv_chunks(path, chunk_size, zip_column, payment_column, extra_columns=()):
+    columns = (zip_column, payment_column) + tuple(extra_columns)
+    with open(path, newline='') as handle:
+        chunk = []
+        for record in csv.DictReader(handle):
+            chunk.append(tuple((record.get(column) or '').strip() for column in columns))
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+# Function to read (zip, payment, *extra columns) rows from a Parquet file in chunks
+def read_parquet_chunks(path, chunk_size, zip_column, payment_column, extra_columns=()):
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Reading Parquet input requires pyarrow (pip install pyarrow).")
+
+    columns = [zip_column, payment_column] + list(extra_columns)
+    parquet_file = pq.ParquetFile(path)
+    for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=columns):
+        values = [batch.column(column).to_pylist() for column in columns]
+        yield [
+            tuple('' if value is None else str(value).strip() for value in row)
+            for row in zip(*values)
+        ]
+
+
+# Function to read input chunks from either supported file format
+def read_chunks(path, chunk_size=DEFAULT_CHUNK_SIZE, zip_column='zip', payment_column='payment', extra_columns=()):
+    if is_parquet(path):
+        return read_parquet_chunks(path, chunk_size, zip_column, payment_column, extra_columns)
+    return read_csv_chunks(path, chunk_size, zip_column, payment_column, extra_columns)
+
+
+# Function to format a rate component the way format_output prints it
+def format_rate(rate):
+    return f"{rate * 100:.2f}%" if rate else 'None'
+
+
+# Function to build an output row that only carries an error message
+def error_row(zip_code, payment, message, location_info=None):
+    row = dict.fromkeys(OUTPUT_FIELDS, '')
+    row['zip'] = zip_code
+    row['payment'] = payment
+    if location_info:
+        row['city'] = location_info['city']
+        row['county'] = location_info['county']
+        row['state'] = location_info['state']
+    row['error'] = message
+    return row
+
+
+# Function to price a single row once its location (and optionally its rate and the tier
+# that matched it) has been resolved
+def price_row(zip_code, payment, location_info, tax_data, tax_rate=None, match=''):
+    if not validate_zip_code(zip_code):
+        return error_row(zip_code, payment, "Invalid ZIP code")
+
+    if not location_info:
+        return error_row(zip_code, payment, f"No information found for ZIP code {zip_code}")
+
+    if location_info['state'] != 'CALIFORNIA':
+        return error_row(zip_code, payment, "Not a California ZIP code", location_info)
+
+    if tax_rate is None:
+        tax_rate, match, _ = match_tax_rate(location_info['city'], location_info['county'], tax_data)
+    if not tax_rate:
+        return error_row(zip_code, payment, f"No tax rate found for {location_info['city']}, {location_info['county']}", location_info)
+
+    state_rate, city_rate, county_rate = parse_tax_components(tax_rate)
+    if state_rate is None or city_rate is None or county_rate is None:
+        return error_row(zip_code, payment, "Error calculating tax components", location_info)
+
+    if not validate_monthly_payment(payment):
+        return error_row(zip_code, payment, "Invalid payment amount", location_info)
+
+    monthly_payment = Decimal(payment)
+    total_tax = calculate_taxes(monthly_payment, tax_rate)
+    state_remittance, city_remittance, county_remittance = calculate_remittance(total_tax, state_rate, city_rate, county_rate)
+
+    return {
+        'zip': zip_code,
+        'payment': f"{monthly_payment:.2f}",
+        'city': location_info['city'],
+        'county': location_info['county'],
+        'state': location_info['state'],
+        'tax_rate': tax_rate,
+        'match': match or '',
+        'state_rate': format_rate(state_rate),
+        'city_rate': format_rate(city_rate),
+        'county_rate': format_rate(county_rate),
+        'total_tax': f"{total_tax:.2f}",
+        'state_remittance': f"{state_remittance:.2f}",
+        'city_remittance': f"{city_remittance:.2f}",
+        'county_remittance': f"{county_remittance:.2f}",
+        'error': ''
+    }
+
+
+# Function to price one chunk of rows, resolving its valid ZIPs with one batch query
+def price_chunk(chunk, tax_data):
+    valid_zips = sorted({zip_code for zip_code, _ in chunk if validate_zip_code(zip_code)})
+    locations = dict(zip(valid_zips, get_locations_from_zips(valid_zips)))
+
+    return [
+        price_row(zip_code, payment, locations.get(zip_code), tax_data)
+        for zip_code, payment in chunk
+    ]
+
+
+# Function to open a text output file, or stdout for '-', with a large write buffer
+def open_output(path, newline=None):
+    if path == '-':
+        return sys.stdout, False
+    return open(path, 'w', newline=newline, encoding='utf-8', buffering=WRITE_BUFFER_SIZE), True
+
+
+# Writer that appends priced chunks to a CSV file
+class CsvResultWriter:
+    def __init__(self, path, fields=OUTPUT_FIELDS):
+        self.handle, self.owned = open_output(path, newline='')
+        self.values = operator.itemgetter(*fields)
+        self.writer = csv.writer(self.handle)
+        self.writer.writerow(fields)
+
+    def write(self, rows):
+        self.writer.writerows(map(self.values, rows))
+
+    def close(self):
+        if self.owned:
+            self.handle.close()
+        else:
+            self.handle.flush()
+
+
+# Writer that appends priced chunks as one JSON object per line. Output values are
+# strings, so each line is one %-format of a precompiled template over the escaped
+# values; a row holding anything else goes through the full JSON encoder.
+class JsonLinesResultWriter:
+    def __init__(self, path, fields=OUTPUT_FIELDS):
+        self.handle, self.owned = open_output(path)
+        self.values = operator.itemgetter(*fields)
+        self.template = '{' + ','.join(f'{escape_json_string(field)}:%s' for field in fields) + '}'
+        self.fields = list(fields)
+        self.encode = json.JSONEncoder(separators=(',', ':')).encode
+
+    def line(self, row):
+        try:
+            return self.template % tuple(map(escape_json_string, self.values(row)))
+        except TypeError:
+            return self.encode({field: row[field] for field in self.fields})
+
+    def write(self, rows):
+        if rows:
+            self.handle.write('\n'.join(map(self.line, rows)))
+            self.handle.write('\n')
+
+    def close(self):
+        if self.owned:
+            self.handle.close()
+        else:
+            self.handle.flush()
+
+
+# Writer that appends priced chunks in final.py's human-readable layout, one block per row
+class TextResultWriter:
+    def __init__(self, path, fields=OUTPUT_FIELDS):
+        self.handle, self.owned = open_output(path)
+
+    def write(self, rows):
+        if rows:
+            self.handle.write('\n\n'.join([
+                (TEXT_ERROR_TEMPLATE if row['error'] else TEXT_TEMPLATE).format_map(row) for row in rows
+            ]))
+            self.handle.write('\n\n')
+
+    def close(self):
+        if self.owned:
+            self.handle.close()
+        else:
+            self.handle.flush()
+
+
+# Writer that appends priced chunks to an Arrow table file, one record batch per chunk
+class ArrowResultWriter:
+    def __init__(self, path, fields=OUTPUT_FIELDS):
+        try:
+            import pyarrow as pa
+        except ImportError:
+            raise ImportError(f"Writing {self.format_name} output requires pyarrow (pip install pyarrow).")
+
+        self.pa = pa
+        self.fields = list(fields)
+        self.schema = pa.schema([(field, pa.string()) for field in self.fields])
+        self.writer = self.open(path)
+
+    format_name = 'Arrow'
+
+    def open(self, path):
+        return self.pa.ipc.new_file(path, self.schema)
+
+    def write(self, rows):
+        columns = [self.pa.array([row[field] for row in rows], self.pa.string()) for field in self.fields]
+        self.writer.write_table(self.pa.Table.from_arrays(columns, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+# Writer that appends priced chunks to a Parquet file as row groups
+class ParquetResultWriter(ArrowResultWriter):
+    format_name = 'Parquet'
+
+    def open(self, path):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Writing Parquet output requires pyarrow (pip install pyarrow).")
+        return pq.ParquetWriter(path, self.schema)
+
+
+WRITERS = {
+    'csv': CsvResultWriter,
+    'jsonl': JsonLinesResultWriter,
+    'text': TextResultWriter,
+    'arrow': ArrowResultWriter,
+    'parquet': ParquetResultWriter,
+}
+
+# Formats written through a file path by pyarrow, so they cannot go to stdout
+FILE_ONLY_FORMATS = ('arrow', 'parquet')
+
+FORMAT_EXTENSIONS = {
+    '.jsonl': 'jsonl', '.ndjson': 'jsonl', '.txt': 'text', '.arrow': 'arrow', '.feather': 'arrow',
+    '.parquet': 'parquet', '.pq': 'parquet',
+}
+
+
+# Function to pick an output format from a path's extension, defaulting to CSV
+def format_for_path(path):
+    return FORMAT_EXTENSIONS.get(os.path.splitext(str(path))[1].lower(), 'csv')
+
+
+# Function to pick the output format for a path, raising ValueError for an unknown
+# format or for a file-only format sent to stdout ('-')
+def output_format_for(path, output_format=None):
+    name = output_format or format_for_path(path)
+    if name not in WRITERS:
+        raise ValueError(f"Unknown output format {name!r}; use one of {', '.join(WRITERS)}")
+    if path == '-' and name in FILE_ONLY_FORMATS:
+        raise ValueError(f"{name} output cannot be written to stdout; give an output file")
+    return name
+
+
+# Function to open the result writer for a format, or for the output path's extension
+def open_writer(path, fields=OUTPUT_FIELDS, output_format=None):
+    return WRITERS[output_format_for(path, output_format)](path, fields)
+
+
+# Function to price a whole input file chunk by chunk, keeping memory bounded
+def price_file(input_path, output_path, tax_data, chunk_size=DEFAULT_CHUNK_SIZE, zip_column='zip', payment_column='payment',
+               output_format=None, nearest_within_km=None, planner=None):
+    # Run through the streaming pipeline, which batches reads, ZIP resolution and writes per chunk
+    from pipeline import run_pipeline
+
+    return run_pipeline(input_path, output_path, tax_data, chunk_size, zip_column, payment_column,
+                        output_format=output_format, nearest_within_km=nearest_within_km,
+                        planner=planner)
+
+
+# Function to parse the command-line arguments for a batch run
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Price (zip, payment) rows from a CSV or Parquet file.")
+    parser.add_argument('input', help="input .csv or .parquet file")
+    parser.add_argument('output', help="output file (.csv, .jsonl, .txt, .arrow or .parquet), or - for stdout")
+    parser.add_argument('--format', choices=list(WRITERS), help="output format (default: from the output extension)")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help="rows priced per chunk")
+    parser.add_argument('--zip-column', default='zip', help="name of the ZIP code column")
+    parser.add_argument('--payment-column', default='payment', help="name of the payment column")
+    parser.add_argument('--rates-page', help="read rates from a saved CDTFA page instead of the rate cache")
+    # The batch planner does not apply the nearest-jurisdiction fallback, so the two exclude each other
+    zip_work = parser.add_mutually_exclusive_group()
+    zip_work.add_argument('--nearest-within', type=float, metavar='KM',
+                          help="price ZIPs without a city/county as the nearest rated ZIP up to KM away")
+    zip_work.add_argument('--dedup', action='store_true', help="resolve each distinct ZIP once and report the savings")
+    parser.add_argument('--metrics', help="record per-stage timings and write them here (.prom/.txt for Prometheus text, else JSON)")
+    parser.add_argument('--profile', help="profile the run and write the profile to this file")
+    parser.add_argument('--profile-mode', choices=['cprofile', 'sample'], default='cprofile',
+                        help="cProfile (exact, slower) or stack sampling (cheap, folded stacks)")
+    args = parser.parse_args(argv)
+    try:
+        output_format_for(args.output, args.format)
+    except ValueError as e:
+        parser.error(str(e))
+    return args
+
+
+# Main function
+def main(argv=None):
+    args = parse_args(argv)
+
+    # Keep status messages out of the results when they go to stdout
+    status = sys.stderr if args.output == '-' else sys.stdout
+    print("Loading tax rates...", file=status)
+    tax_data = load_saved_page(args.rates_page) if args.rates_page else load_tax_data()
+    if not tax_data:
+        print("No tax data was extracted. Exiting...", file=status)
+        return 1
+
+    if args.metrics:
+        METRICS.enable()
+
+    planner = None
+    if args.dedup:
+        from batch_planner import BatchPlanner
+        planner = BatchPlanner(tax_data)
+
+    with profiled(args.profile, args.profile_mode) if args.profile else nullcontext():
+        total_rows, error_rows = price_file(
+            args.input, args.output, tax_data,
+            chunk_size=args.chunk_size, zip_column=args.zip_column, payment_column=args.payment_column,
+            output_format=args.format, nearest_within_km=args.nearest_within, planner=planner
+        )
+    print(f"Priced {total_rows} rows ({error_rows} with errors) into {args.output}.", file=status)
+    if planner is not None:
+        print(planner.stats.summary(), file=status)
+
+    if args.metrics:
+        METRICS.write(args.metrics)
+        METRICS.report()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,82 @@
+# Memory benchmark for the compact rate and location records.
+# Compares the memory held by the old list of (location, county, rate) tuples with
+# RateColumns, and by one dict per resolved ZIP with Location records. Runs offline
+# on the saved fixture page (rows repeated to approximate a large rate set) and the
+# local pgeocode dataset.
+import argparse
+import gc
+import tracemalloc
+
+from bench_rate_parser import load_page
+from mock_cdtfa_server import DEFAULT_PAGE
+from rate_parser import iter_tax_rates
+from records import RateColumns
+
+
+# Function to measure the memory still held by whatever build() returns
+def retained(build):
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return size
+
+
+# Function to resolve ZIPs into one dict each, the way the resolver did before Location records
+def resolve_as_dicts(resolver, zip_codes):
+    from zip_resolver import clean_column, normalize_zip
+
+    frame = resolver.nominatim.query_postal_code([normalize_zip(zip_code) for zip_code in zip_codes])
+    cities = clean_column(frame['place_name'], first_part=True)
+    counties = clean_column(frame['county_name'])
+    states = clean_column(frame['state_name'])
+    return [
+        {'city': city, 'county': county, 'state': state}
+        for city, county, state in zip(cities, counties, states)
+    ]
+
+
+# Function to print one comparison line
+def report(label, count, old_bytes, new_bytes):
+    saving = (1 - new_bytes / old_bytes) * 100 if old_bytes else 0.0
+    print(f"{label:<10} {count:>8} {old_bytes / 2 ** 20:>10.2f} {new_bytes / 2 ** 20:>10.2f} "
+          f"{old_bytes / count:>9.0f} {new_bytes / count:>9.0f} {saving:>7.1f}%")
+
+
+# Main function
+def main():
+    parser = argparse.ArgumentParser(description="Compare memory held by tuple/dict records and the compact records.")
+    parser.add_argument('--page', default=DEFAULT_PAGE, help="saved CDTFA page to parse")
+    parser.add_argument('--repeat', type=int, default=400, help="times to repeat each table row")
+    parser.add_argument('--zips', type=int, default=50000, help="ZIP lookups to hold (drawn from California ZIPs)")
+    args = parser.parse_args()
+
+    page = load_page(args.page, args.repeat)
+    rows = list(iter_tax_rates(page))
+
+    print(f"{'records':<10} {'count':>8} {'old MiB':>10} {'new MiB':>10} {'old B/row':>9} {'new B/row':>9} {'saving':>8}")
+    report('rates', len(rows),
+           retained(lambda: list(iter_tax_rates(page))),
+           retained(lambda: RateColumns(iter_tax_rates(page))))
+
+    from zip_resolver import ZipResolver, list_postal_codes
+
+    resolver = ZipResolver('US')
+    california = [code for code in list_postal_codes('CA') if code.isdigit() and len(code) == 5]
+    if not california:
+        print("The local pgeocode dataset has no California ZIP codes; skipping locations.")
+        return 0
+    zip_codes = (california * (args.zips // len(california) + 1))[:args.zips]
+    resolver.resolve_many(zip_codes[:1])
+
+    report('locations', len(zip_codes),
+           retained(lambda: resolve_as_dicts(resolver, zip_codes)),
+           retained(lambda: resolver.resolve_many(zip_codes)))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,60 @@
+# Benchmark comparing the CDTFA page extraction engines on a saved fixture page.
+# The fixture's table rows can be repeated to approximate the size of the live page.
+import argparse
+import re
+import time
+import tracemalloc
+
+from mock_cdtfa_server import DEFAULT_PAGE
+from rate_parser import ENGINES
+
+ROW_PATTERN = re.compile(rb'<tr>\s*<td>.*?</tr>', re.S)
+
+
+# Function to load the fixture page, repeating each table's data rows to grow it
+def load_page(path, repeat=1):
+    with open(path, 'rb') as handle:
+        page = handle.read()
+    if repeat > 1:
+        page = ROW_PATTERN.sub(lambda match: match.group(0) * repeat, page)
+    return page
+
+
+# Function to time one engine: best wall time over several runs plus peak traced memory
+def measure(engine, page, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        engine(page)
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    rows = engine(page)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return rows, min(timings), peak
+
+
+# Main function
+def main():
+    parser = argparse.ArgumentParser(description="Compare CDTFA rate page parsers.")
+    parser.add_argument('--page', default=DEFAULT_PAGE, help="saved CDTFA page to parse")
+    parser.add_argument('--repeat', type=int, default=35, help="times to repeat each table row")
+    parser.add_argument('--runs', type=int, default=5, help="timed runs per engine")
+    args = parser.parse_args()
+
+    page = load_page(args.page, args.repeat)
+    reference = None
+
+    print(f"Page size: {len(page) / 1024:.0f} KiB")
+    print(f"{'engine':<10} {'rows':>7} {'best ms':>9} {'peak KiB':>9}  matches bs4")
+    for name, engine in ENGINES.items():
+        rows, best, peak = measure(engine, page, args.runs)
+        if reference is None:
+            reference = rows
+        print(f"{name:<10} {len(rows):>7} {best * 1000:>9.1f} {peak / 1024:>9.0f}  {rows == reference}")
+
+
+if __name__ == "__main__":
+    main()
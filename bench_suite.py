@@ -0,0 +1,249 @@
+# Reproducible benchmark suite for the lookup-and-remittance path.
+# Runs offline: the scrape is served by the local CDTFA stand-in from the saved
+# fixture page, and ZIPs come from the local pgeocode dataset. Results are written
+# as JSON so runs from different versions can be compared.
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from decimal import Decimal
+
+from mock_cdtfa_server import DEFAULT_PAGE, start_server
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Measured in a fresh interpreter so imports and dataset loads are really cold
+COLD_START_SCRIPT = r'''
+import json, sys, time
+phases = {}
+start = time.perf_counter()
+import final
+phases['import_final'] = time.perf_counter() - start
+mark = time.perf_counter()
+tax_data = final.scrape_tax_rates(sys.argv[1])
+phases['scrape_tax_rates'] = time.perf_counter() - mark
+mark = time.perf_counter()
+rate_table = final.build_rate_table(tax_data)
+phases['build_rate_table'] = time.perf_counter() - mark
+mark = time.perf_counter()
+final.get_location_from_zip(sys.argv[2])
+phases['first_zip_lookup'] = time.perf_counter() - mark
+phases['total'] = time.perf_counter() - start
+print(json.dumps(phases))
+'''
+
+
+# Function to summarize a list of latencies (seconds) as microsecond percentiles
+def percentiles(samples):
+    ordered = sorted(samples)
+
+    def at(fraction):
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1e6
+
+    return {
+        'count': len(ordered),
+        'mean_us': statistics.fmean(ordered) * 1e6,
+        'p50_us': at(0.50),
+        'p90_us': at(0.90),
+        'p99_us': at(0.99),
+        'max_us': ordered[-1] * 1e6,
+    }
+
+
+# Function to time a callable once per argument tuple
+def time_calls(function, arguments):
+    timings = []
+    for args in arguments:
+        start = time.perf_counter()
+        function(*args)
+        timings.append(time.perf_counter() - start)
+    return percentiles(timings)
+
+
+# Function to measure cold start in a fresh interpreter
+def measure_cold_start(url, zip_code, runs):
+    results = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-c', COLD_START_SCRIPT, url, zip_code],
+            cwd=ROOT, check=True, capture_output=True, text=True
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    return {phase: min(result[phase] for result in results) for phase in results[0]}
+
+
+# Function to pick the California ZIPs the benchmark draws from
+def sample_zips(limit):
+    from zip_resolver import list_postal_codes
+
+    zip_codes = [code for code in list_postal_codes('CA') if code.isdigit() and len(code) == 5]
+    return zip_codes[:limit]
+
+
+# Function to run every benchmark and collect the results
+def run_suite(page, lookups, batch_rows, cold_runs, seed):
+    import final
+    from batch_pricing import price_chunk
+
+    generator = random.Random(seed)
+    server = start_server(page)
+    try:
+        zip_codes = sample_zips(2000)
+        if not zip_codes:
+            raise SystemExit("The local pgeocode dataset has no California ZIP codes.")
+
+        results = {'cold_start_s': measure_cold_start(server.url, zip_codes[0], cold_runs)}
+
+        tax_data = final.scrape_tax_rates(server.url)
+        results['scrape_tax_rates'] = time_calls(final.scrape_tax_rates, [(server.url,)] * 5)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    rate_table = final.build_rate_table(tax_data)
+    final.get_location_from_zip(zip_codes[0])
+
+    zip_sample = [generator.choice(zip_codes) for _ in range(lookups)]
+    locations = [final.get_location_from_zip(zip_code) for zip_code in zip_sample]
+    priced = [
+        (zip_code, location_info, rate)
+        for zip_code, location_info in zip(zip_sample, locations) if location_info
+        for rate in [final.get_tax_rate(location_info['city'], location_info['county'], rate_table)] if rate
+    ]
+    if not priced:
+        raise SystemExit("None of the sampled ZIP codes has a rate in the fixture page.")
+
+    payments = [Decimal(generator.randrange(100, 500000)) / 100 for _ in range(len(priced))]
+    components = [final.parse_tax_components(rate) for _, _, rate in priced]
+    totals = [final.calculate_taxes(payment, rate) for payment, (_, _, rate) in zip(payments, priced)]
+    remittances = [final.calculate_remittance(total, *parts) for total, parts in zip(totals, components)]
+
+    results['get_location_from_zip'] = time_calls(final.get_location_from_zip, [(zip_code,) for zip_code in zip_sample])
+    results['get_tax_rate'] = time_calls(final.get_tax_rate, [
+        (location_info['city'], location_info['county'], rate_table) for location_info in locations if location_info
+    ])
+    results['get_tax_rate_linear_scan'] = time_calls(final.get_tax_rate, [
+        (location_info['city'], location_info['county'], tax_data) for location_info in locations if location_info
+    ])
+    results['parse_tax_components'] = time_calls(final.parse_tax_components, [(rate,) for _, _, rate in priced])
+    results['calculate_taxes'] = time_calls(final.calculate_taxes, [
+        (payment, rate) for payment, (_, _, rate) in zip(payments, priced)
+    ])
+    results['format_output'] = time_calls(final.format_output, [
+        (zip_code, payment, location_info, total, rate, *parts, *amounts)
+        for (zip_code, location_info, rate), payment, total, parts, amounts
+        in zip(priced, payments, totals, components, remittances)
+    ])
+
+    rows = [(generator.choice(zip_codes), f"{generator.randrange(100, 500000) / 100:.2f}") for _ in range(batch_rows)]
+    start = time.perf_counter()
+    price_chunk(rows, rate_table)
+    elapsed = time.perf_counter() - start
+
+    # Traced separately because tracemalloc slows the run it measures
+    tracemalloc.start()
+    price_chunk(rows, rate_table)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    results['batch'] = {
+        'rows': batch_rows,
+        'seconds': elapsed,
+        'rows_per_second': batch_rows / elapsed,
+        'traced_peak_mib': peak / 2 ** 20,
+    }
+    results['peak_rss_mib'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return results
+
+
+# Function to describe the environment a run was taken in
+def run_metadata(args):
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True
+        ).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'commit': commit,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'lookups': args.lookups,
+        'batch_rows': args.batch_rows,
+        'seed': args.seed,
+    }
+
+
+# Function to flatten nested results into {'section.metric': value}
+def flatten(results, prefix=''):
+    flat = {}
+    for key, value in results.items():
+        name = f'{prefix}{key}'
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + '.'))
+        elif isinstance(value, (int, float)):
+            flat[name] = value
+    return flat
+
+
+# Function to print the current results next to a saved baseline
+def print_comparison(results, baseline):
+    current = flatten(results)
+    previous = flatten(baseline.get('results', baseline))
+    print(f"{'metric':<45} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, value in current.items():
+        if name in previous and previous[name]:
+            change = (value - previous[name]) / previous[name] * 100
+            print(f"{name:<45} {previous[name]:>12.3f} {value:>12.3f} {change:>+7.1f}%")
+
+
+# Function to print a readable summary of one run
+def print_summary(results):
+    cold = results['cold_start_s']
+    print(f"Cold start: {cold['total'] * 1000:.0f} ms "
+          f"(import {cold['import_final'] * 1000:.0f} ms, scrape {cold['scrape_tax_rates'] * 1000:.0f} ms, "
+          f"first ZIP {cold['first_zip_lookup'] * 1000:.0f} ms)")
+    print(f"{'step':<26} {'p50 us':>10} {'p90 us':>10} {'p99 us':>10}")
+    for step, stats in results.items():
+        if isinstance(stats, dict) and 'p50_us' in stats:
+            print(f"{step:<26} {stats['p50_us']:>10.1f} {stats['p90_us']:>10.1f} {stats['p99_us']:>10.1f}")
+    batch = results['batch']
+    print(f"Batch: {batch['rows_per_second']:.0f} rows/s over {batch['rows']} rows, "
+          f"traced peak {batch['traced_peak_mib']:.1f} MiB, process peak RSS {results['peak_rss_mib']:.0f} MiB")
+
+
+# Main function
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the lookup-and-remittance path offline.")
+    parser.add_argument('--page', default=DEFAULT_PAGE, help="saved CDTFA page served to the scraper")
+    parser.add_argument('--lookups', type=int, default=2000, help="timed single lookups per step")
+    parser.add_argument('--batch-rows', type=int, default=100000, help="rows in the batch throughput run")
+    parser.add_argument('--cold-runs', type=int, default=3, help="fresh interpreters for the cold-start timing")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="write the results as JSON to this file")
+    parser.add_argument('--compare', help="JSON results of an earlier run to compare against")
+    args = parser.parse_args()
+
+    results = run_suite(args.page, args.lookups, args.batch_rows, args.cold_runs, args.seed)
+    print_summary(results)
+
+    if args.compare:
+        with open(args.compare) as handle:
+            print_comparison(results, json.load(handle))
+
+    if args.output:
+        with open(args.output, 'w') as handle:
+            json.dump({'metadata': run_metadata(args), 'results': results}, handle, indent=2)
+        print(f"Wrote results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,52 +1,104 @@
-import requests
-from bs4 import BeautifulSoup
-import pgeocode
+# requests, bs4 and pgeocode (which pulls in pandas) are imported inside the functions
+# that need them, so starting the program and serving cached rates stays fast
 from decimal import Decimal, InvalidOperation
+from instrumentation import METRICS, instrumented
+from name_matching import NO_MATCH, MatchResult
+from rate_table import RateTable, build_rate_table
+from records import RateColumns
+from startup_timing import StartupTimer
+
+CDTFA_RATES_URL = 'https://www.cdtfa.ca.gov/taxes-and-fees/rates.aspx'
+# Largest monthly payment accepted; anything above it is treated as a typo
+MAX_MONTHLY_PAYMENT = Decimal('1000000000')
+
+# Function to collect (location, county, rate) rows from the tables of a parsed page.
+# Every <tr> inside a table is one row in document order. A row's cells are the <td>s
+# it holds itself, not the ones of a table nested in a cell, while a cell's text does
+# include any nested table. Rows with fewer than three cells are skipped.
+def extract_tax_rates(soup):
+    tax_data = RateColumns()
+    for row in soup.find_all('tr'):
+        if row.find_parent('table') is None:
+            continue
+        cells = [cell for cell in row.find_all('td') if cell.find_parent('tr') is row]
+        if len(cells) > 2:
+            location = cells[0].get_text(strip=True).upper()
+            rate = cells[1].get_text(strip=True)
+            county = cells[2].get_text(strip=True).upper()
+            tax_data.append(location, county, rate)
+    return tax_data
+
+# Function to parse tax rates data from the HTML of the CDTFA page
+def parse_tax_rates(content):
+    from bs4 import BeautifulSoup
+
+    return extract_tax_rates(BeautifulSoup(content, 'html.parser'))
 
 # Function to scrape tax rates data from the CDTFA page
-def scrape_tax_rates():
-    url = 'https://www.cdtfa.ca.gov/taxes-and-fees/rates.aspx'
+@instrumented('scrape_tax_rates')
+def scrape_tax_rates(url=CDTFA_RATES_URL):
+    import requests
+
     response = requests.get(url)
 
     tax_data = []
     if response.status_code == 200:
-        soup = BeautifulSoup(response.content, 'html.parser')
-        tables = soup.find_all('table')
-        if tables:
-            for table in tables:
-                rows = table.find_all('tr')
-                for row in rows:
-                    cells = row.find_all('td')
-                    if len(cells) > 1:
-                        location = cells[0].get_text(strip=True).upper()
-                        rate = cells[1].get_text(strip=True)
-                        county = cells[2].get_text(strip=True).upper()
-                        tax_data.append((location, county, rate))
+        tax_data = parse_tax_rates(response.content)
     return tax_data
 
 # Function to get city, county, state using pgeocode
+@instrumented('get_location_from_zip', unmatched='unmatched_zips')
 def get_location_from_zip(zip_code):
-    nomi = pgeocode.Nominatim('US')
-    location_info = nomi.query_postal_code(zip_code)
+    from zip_resolver import get_resolver
 
-    if isinstance(location_info.place_name, float) or isinstance(location_info.county_name, float):
+    location_info = get_resolver().resolve(zip_code)
+
+    if location_info['city'] is None or location_info['county'] is None:
         return None
 
-    return {
-        'city': location_info.place_name.split(',')[0].upper() if location_info.place_name else None,
-        'county': location_info.county_name.upper() if location_info.county_name else None,
-        'state': location_info.state_name.upper() if location_info.state_name else None
-    }
+    return location_info
+
+# Function to get city, county, state for many ZIP codes with one pgeocode query
+@instrumented('get_locations_from_zips')
+def get_locations_from_zips(zip_codes):
+    from zip_resolver import get_resolver
+
+    locations = [
+        location_info if location_info['city'] is not None and location_info['county'] is not None else None
+        for location_info in get_resolver().resolve_many(zip_codes)
+    ]
+    METRICS.count('unmatched_zips', locations.count(None))
+    return locations
 
 # Function to match city and county with tax rates
+@instrumented('get_tax_rate', unmatched='unmatched_rates')
 def get_tax_rate(city, county, tax_data):
+    # Use the hash indexes when the caller passes a prebuilt rate table; names that
+    # differ only in spelling, abbreviations or punctuation still find their rate
+    if isinstance(tax_data, RateTable):
+        return tax_data.resolve(city, county)
+
     for entry in tax_data:
         location, county_name, rate = entry
         if city == location and county == county_name:
             return rate
     return None
 
+# Function to match city and county with tax rates, also reporting which tier matched:
+# a rate from a county's unincorporated area or the county-wide row is only a fallback
+@instrumented('match_tax_rate', unmatched='unmatched_rates')
+def match_tax_rate(city, county, tax_data):
+    if isinstance(tax_data, RateTable):
+        return tax_data.match(city, county)
+
+    for entry in tax_data:
+        location, county_name, rate = entry
+        if city == location and county == county_name:
+            return MatchResult(rate, 'exact', location)
+    return NO_MATCH
+
 # Function to calculate taxes dynamically from the scraped tax rate
+@instrumented('calculate_taxes')
 def calculate_taxes(monthly_payment, tax_rate):
     # Convert tax rate from percentage string to Decimal
     tax_rate_decimal = Decimal(tax_rate.strip('%')) / 100
@@ -54,6 +106,7 @@ def calculate_taxes(monthly_payment, tax_rate):
     return total_tax
 
 # Corrected function to calculate remittance amounts (state, city, county)
+@instrumented('calculate_remittance')
 def calculate_remittance(total_tax, state_rate, city_rate, county_rate):
     # State remittance is based on the state's tax rate
     state_remittance = total_tax * state_rate
@@ -67,6 +120,7 @@ def calculate_remittance(total_tax, state_rate, city_rate, county_rate):
     return state_remittance, city_remittance, county_remittance
 
 # New function to parse city and county tax rates from the scraped data
+@instrumented('parse_tax_components')
 def parse_tax_components(tax_rate):
     try:
         # Convert tax rate to Decimal
@@ -85,6 +139,7 @@ def parse_tax_components(tax_rate):
     return state_rate, city_rate, county_rate
 
 # Function to format the output, including remittance and tax rate details
+@instrumented('format_output')
 def format_output(zip_code, monthly_payment, location_info, total_tax, tax_rate, state_rate, city_rate, county_rate, state_remittance, city_remittance, county_remittance):
     output = [
         f"Location ZIP: {zip_code}",
@@ -112,20 +167,41 @@ def validate_monthly_payment(payment):
     try:
         # Convert the input to Decimal
         payment = Decimal(payment)
-        return payment > 0
-    except (InvalidOperation, ValueError):
+        # Infinity, NaN and amounts too large to tax without overflowing are not payments
+        return payment.is_finite() and 0 < payment <= MAX_MONTHLY_PAYMENT
+    except (InvalidOperation, ValueError, TypeError):
         return False
 
 # Main function
 def main():
-    # Step 1: Scrape tax rates from the website
-    print("Scraping tax rates from CDTFA website...")
-    tax_data = scrape_tax_rates()
+    # Set ZIP_CODES_STARTUP_REPORT=1 to print how long each startup phase takes
+    timer = StartupTimer.from_environment()
+
+    # Rates published while the program runs are swapped in place, without a restart
+    from rate_reload import RateReloader, format_change_report
+    rates = RateReloader()
+
+    def reload_rates(new_tax_data):
+        print()
+        print(format_change_report(rates.reload(new_tax_data)))
+
+    # Step 1: Load tax rates from the local snapshot, scraping the website only if there is none
+    with timer.phase('load_tax_data'):
+        from rate_cache import load_tax_data
+        print("Loading tax rates...")
+        tax_data = load_tax_data(on_update=reload_rates)
 
     if not tax_data:
         print("No tax data was extracted. Exiting...")
         return
 
+    # Index the scraped rates once so each lookup is O(1)
+    with timer.phase('build_rate_table'):
+        # A background refresh that already loaded rates has newer ones than the snapshot;
+        # the check and the load happen under the reloader's lock so neither overwrites the other
+        rates.reload_if_unset(tax_data)
+    timer.report()
+
     while True:
         # Step 2: Get ZIP code from user input
         user_zip = input("Enter ZIP code (or press 'x' to exit): ")
@@ -152,10 +228,12 @@ def main():
         print(f"City: {location_info['city']}, County: {location_info['county']}, State: {location_info['state']}")
 
         # Step 4: Match city and county with tax rates
-        tax_rate = get_tax_rate(location_info['city'], location_info['county'], tax_data)
+        tax_rate, match, _ = match_tax_rate(location_info['city'], location_info['county'], rates.rate_table)
         if not tax_rate:
             print(f"No tax rate found for {location_info['city']}, {location_info['county']}.")
             continue
+        if match in ('unincorporated', 'county'):
+            print(f"No rate is listed for {location_info['city']}; using the {match} rate for {location_info['county']} County.")
 
         # Step 5: Parse the tax components
         state_rate, city_rate, county_rate = parse_tax_components(tax_rate)
@@ -181,5 +259,9 @@ def main():
         # Step 9: Display the formatted output
         print("\n" + format_output(user_zip, user_payment, location_info, total_tax, tax_rate, state_rate, city_rate, county_rate, state_remittance, city_remittance, county_remittance) + "\n")
 
+    # Set ZIP_CODES_METRICS=1 to print how long each pricing stage took
+    if METRICS.enabled:
+        METRICS.report()
+
 if __name__ == "__main__":
     main()
@@ -1,6 +1,6 @@
 import requests
 from bs4 import BeautifulSoup
-import pgeocode
+from zip_resolver import get_nominatim
 import math  # Needed to check for NaN values
 
 # Function to scrape tax rates data from the CDTFA page
@@ -43,7 +43,7 @@ def scrape_tax_rates():
 
 # Function to get city and county using pgeocode
 def get_location_from_zip(zip_code):
-    nomi = pgeocode.Nominatim('us')
+    nomi = get_nominatim('US')
     location_info = nomi.query_postal_code(zip_code)
 
     # Handle NaN values (which can appear when pgeocode doesn't find a location)
@@ -95,9 +95,10 @@ def validate_monthly_payment(payment):
 
 # Main function
 def main():
-    # Step 1: Scrape tax rates from the website
-    print("Scraping tax rates from CDTFA...")
-    tax_data = scrape_tax_rates()
+    # Step 1: Load tax rates from the local snapshot, scraping the website only if there is none
+    from rate_cache import load_tax_data
+    print("Loading tax rates...")
+    tax_data = load_tax_data()
 
     if not tax_data:
         print("No tax data was extracted. Exiting...")
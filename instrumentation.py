@@ -0,0 +1,278 @@
+# Optional per-stage metrics and profiling for the pricing path.
+# The stages in final.py are marked with @instrumented. While metrics are disabled
+# (the default) each stage costs one flag check per call; METRICS.enable() (or
+# ZIP_CODES_METRICS=1) turns timing on for every caller at once. Latency histograms
+# and counters are exported as JSON or Prometheus text.
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+
+# Histogram bucket upper bounds in seconds, from 1 microsecond to 30 seconds
+DEFAULT_BUCKETS = (
+    0.000001, 0.0000025, 0.000005, 0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+DEFAULT_SAMPLE_INTERVAL = 0.005
+
+
+# Latency histogram with fixed buckets; the last count is for values above every bucket
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        index = bisect_left(self.buckets, seconds)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += seconds
+
+    # Upper bound of the bucket holding the given fraction of observations
+    def quantile(self, fraction):
+        if not self.count:
+            return None
+        target = fraction * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return float('inf')
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'sum_s': self.sum,
+            'mean_us': self.sum / self.count * 1e6 if self.count else None,
+            'p50_le_us': self._micros(self.quantile(0.5)),
+            'p90_le_us': self._micros(self.quantile(0.9)),
+            'p99_le_us': self._micros(self.quantile(0.99)),
+            'buckets': {str(bound): count for bound, count in zip(self.buckets, self.counts)},
+            'overflow': self.counts[-1],
+        }
+
+    @staticmethod
+    def _micros(seconds):
+        return None if seconds is None else seconds * 1e6
+
+
+# Registry of stage histograms, named counters and collectors of externally kept stats
+class Metrics:
+    def __init__(self, enabled=False, prefix='zip_codes'):
+        self.enabled = enabled
+        self.prefix = prefix
+        self.stages = {}
+        self.counters = Counter()
+        self.collectors = {}
+        self._lock = threading.Lock()
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def histogram(self, stage):
+        histogram = self.stages.get(stage)
+        if histogram is None:
+            with self._lock:
+                histogram = self.stages.setdefault(stage, Histogram())
+        return histogram
+
+    def count(self, name, amount=1):
+        if self.enabled:
+            with self._lock:
+                self.counters[name] += amount
+
+    # Register a function returning a (possibly nested) dict of numbers, e.g. cache stats
+    def add_collector(self, name, collect):
+        self.collectors[name] = collect
+
+    def reset(self):
+        with self._lock:
+            self.stages = {stage: Histogram(histogram.buckets) for stage, histogram in self.stages.items()}
+            self.counters.clear()
+
+    def collected(self):
+        values = {}
+        for name, collect in self.collectors.items():
+            values.update(flatten_numbers(collect(), name + '_'))
+        return values
+
+    def as_dict(self):
+        return {
+            'enabled': self.enabled,
+            'stages': {stage: histogram.as_dict() for stage, histogram in self.stages.items() if histogram.count},
+            'counters': dict(self.counters),
+            'collected': self.collected(),
+        }
+
+    # Metrics in the Prometheus text exposition format
+    def to_prometheus(self):
+        name = f'{self.prefix}_stage_duration_seconds'
+        lines = [f'# HELP {name} Time spent in each pricing stage.', f'# TYPE {name} histogram']
+        for stage, histogram in self.stages.items():
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {histogram.count}')
+            lines.append(f'{name}_sum{{stage="{stage}"}} {histogram.sum}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {histogram.count}')
+
+        for counter, value in sorted(self.counters.items()):
+            lines.append(f'# TYPE {self.prefix}_{counter}_total counter')
+            lines.append(f'{self.prefix}_{counter}_total {value}')
+        for gauge, value in sorted(self.collected().items()):
+            lines.append(f'# TYPE {self.prefix}_{gauge} gauge')
+            lines.append(f'{self.prefix}_{gauge} {value}')
+        return '\n'.join(lines) + '\n'
+
+    # Write the metrics to a file: Prometheus text for .prom/.txt, JSON otherwise
+    def write(self, path):
+        with open(path, 'w') as handle:
+            if path.endswith(('.prom', '.txt')):
+                handle.write(self.to_prometheus())
+            else:
+                json.dump(self.as_dict(), handle, indent=2)
+
+    # Print a per-stage latency table to stderr
+    def report(self, stream=None):
+        stream = stream or sys.stderr
+        print(f"{'stage':<24} {'calls':>8} {'mean us':>10} {'p50 us':>10} {'p99 us':>10}", file=stream)
+        for stage, histogram in self.stages.items():
+            if histogram.count:
+                stats = histogram.as_dict()
+                print(f"{stage:<24} {stats['count']:>8} {stats['mean_us']:>10.1f} "
+                      f"{stats['p50_le_us']:>10.1f} {stats['p99_le_us']:>10.1f}", file=stream)
+        for counter, value in sorted(self.counters.items()):
+            print(f"{counter:<24} {value:>8}", file=stream)
+
+
+# Function to flatten nested dicts into {'prefix_key_subkey': number}, skipping non-numbers
+def flatten_numbers(values, prefix=''):
+    flat = {}
+    for key, value in values.items():
+        name = f'{prefix}{key}'
+        if isinstance(value, dict):
+            flat.update(flatten_numbers(value, name + '_'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+METRICS = Metrics(enabled=bool(os.environ.get('ZIP_CODES_METRICS')))
+
+
+# Decorator registering a pricing stage for timing; falsy results also count towards the
+# `unmatched` counter. The wrapper calls straight through while metrics are disabled, so
+# callers that imported the stage by name are timed as soon as metrics are enabled.
+def instrumented(stage, unmatched=None):
+    def decorate(function):
+        histogram = METRICS.histogram(stage)
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not METRICS.enabled:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                result = function(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start)
+            if unmatched is not None and not result:
+                METRICS.count(unmatched)
+            return result
+
+        return wrapper
+    return decorate
+
+
+# Statistical profiler that samples one thread's stack at a fixed interval.
+# Much cheaper than cProfile on long batch runs; writes folded stacks for flame graphs.
+class SamplingProfiler:
+    def __init__(self, interval=DEFAULT_SAMPLE_INTERVAL, thread_id=None):
+        self.interval = interval
+        self.thread_id = thread_id or threading.get_ident()
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+                self.samples += 1
+
+    # Write "frame;frame;frame count" lines, the input format of flamegraph.pl and speedscope
+    def write_folded(self, path):
+        with open(path, 'w') as handle:
+            for stack, count in self.stacks.most_common():
+                handle.write(f'{stack} {count}\n')
+
+    # Functions most often on top of the stack, as (function, share of samples)
+    def top(self, limit=20):
+        leaves = Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(';', 1)[-1]] += count
+        return [(name, count / self.samples) for name, count in leaves.most_common(limit)] if self.samples else []
+
+
+# Context manager profiling the code inside it with cProfile ('cprofile') or the sampler ('sample').
+# The profile is written to path (pstats for cProfile, folded stacks for the sampler) and
+# a summary printed to stderr.
+@contextmanager
+def profiled(path=None, mode='cprofile', interval=DEFAULT_SAMPLE_INTERVAL):
+    if mode == 'cprofile':
+        import cProfile
+        import pstats
+
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield profile
+        finally:
+            profile.disable()
+            if path:
+                profile.dump_stats(path)
+            pstats.Stats(profile, stream=sys.stderr).sort_stats('cumulative').print_stats(20)
+    elif mode == 'sample':
+        sampler = SamplingProfiler(interval)
+        sampler.start()
+        try:
+            yield sampler
+        finally:
+            sampler.stop()
+            if path:
+                sampler.write_folded(path)
+            print(f"{sampler.samples} samples every {interval * 1000:.1f} ms; most frequent frames:", file=sys.stderr)
+            for name, share in sampler.top():
+                print(f"  {share * 100:5.1f}%  {name}", file=sys.stderr)
+    else:
+        raise ValueError(f"Unknown profile mode {mode!r}; use 'cprofile' or 'sample'")
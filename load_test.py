@@ -0,0 +1,325 @@
+# Load and soak test for the scrape and lookup path, run against the local CDTFA stand-in.
+# Lookups (ZIP -> location -> rate -> components -> tax -> remittance) are issued at a
+# fixed rate from a thread pool while a refresher scrapes the stand-in page on an
+# interval and hot-swaps the rates, as the service does. The stand-in can be made slow
+# or broken (see mock_cdtfa_server.py). Every report interval prints throughput, tail
+# latency, error rate and process memory, so leaks and slowdowns show up over a long run.
+#
+# The load is open-loop: each lookup is scheduled at its slot and its latency counts
+# from that slot, so a stalled system shows up as growing latency instead of as fewer
+# requests being sent.
+import argparse
+import json
+import random
+import resource
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+import final
+from bench_suite import percentiles, run_metadata, sample_zips
+from instrumentation import Histogram
+from mock_cdtfa_server import DEFAULT_PAGE, add_fault_arguments, fault_plan, start_server
+from rate_cache import load_saved_page
+from rate_reload import RateReloader
+
+DEFAULT_REPORT_INTERVAL = 5.0
+DEFAULT_REFRESH_INTERVAL = 10.0
+DEFAULT_QUEUE_PER_WORKER = 16
+
+
+# Function to read the process's current resident memory in MiB; falls back to the peak
+# where /proc is not available
+def current_rss_mib():
+    try:
+        with open('/proc/self/statm') as handle:
+            pages = int(handle.read().split()[1])
+        return pages * resource.getpagesize() / 2 ** 20
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+# Function to fit a least-squares line through (x, y) points; returns the slope
+def slope(points):
+    if len(points) < 2:
+        return 0.0
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    spread = sum((x - mean_x) ** 2 for x, _ in points)
+    if not spread:
+        return 0.0
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / spread
+
+
+# Results of the current report interval plus running totals for the whole run
+class LoadStats:
+    def __init__(self):
+        self.latency = Histogram()
+        self.totals = Counter()
+        self.errors = Counter()
+        self.window_latencies = []
+        self.window = Counter()
+        self.scrape_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, outcome, latency=None, error=None):
+        with self._lock:
+            self.totals[outcome] += 1
+            self.window[outcome] += 1
+            if error is not None:
+                self.errors[error] += 1
+            if latency is not None:
+                self.window_latencies.append(latency)
+        if latency is not None:
+            self.latency.observe(latency)
+
+    def record_scrape(self, outcome, seconds, error=None):
+        with self._lock:
+            self.scrape_seconds += seconds
+        self.record(outcome, error=error)
+
+    # Take this interval's results and start a new interval
+    def take_window(self):
+        with self._lock:
+            window, latencies = self.window, self.window_latencies
+            self.window, self.window_latencies = Counter(), []
+        return window, latencies
+
+
+# Drives lookups at a target rate while refreshing rates from the stand-in in the background
+class LoadTest:
+    def __init__(self, url, tax_data, zip_codes, qps, workers, refresh_interval=DEFAULT_REFRESH_INTERVAL, seed=0,
+                 max_queue=None):
+        self.url = url
+        self.zip_codes = zip_codes
+        self.qps = qps
+        self.workers = workers
+        self.max_queue = max_queue or workers * DEFAULT_QUEUE_PER_WORKER
+        self.refresh_interval = refresh_interval
+        self.random = random.Random(seed)
+        self.expected_rows = len(tax_data)
+        self.rates = RateReloader(tax_data)
+        self.stats = LoadStats()
+        self.windows = []
+        self._stop = threading.Event()
+
+    # One lookup through the whole chain; latency counts from its scheduled start
+    def lookup(self, zip_code, payment, scheduled):
+        try:
+            location_info = final.get_location_from_zip(zip_code)
+            if location_info is None:
+                self.stats.record('unmatched', time.perf_counter() - scheduled)
+                return
+            tax_rate = final.get_tax_rate(location_info['city'], location_info['county'], self.rates.rate_table)
+            if not tax_rate:
+                self.stats.record('unmatched', time.perf_counter() - scheduled)
+                return
+            components = final.parse_tax_components(tax_rate)
+            total_tax = final.calculate_taxes(payment, tax_rate)
+            final.calculate_remittance(total_tax, *components)
+        except Exception as e:
+            self.stats.record('error', time.perf_counter() - scheduled, f'lookup_{type(e).__name__}')
+            return
+        self.stats.record('ok', time.perf_counter() - scheduled)
+
+    # Scrape the stand-in and swap the rates in; empty or cut-off pages are rejected
+    def refresh(self):
+        started = time.perf_counter()
+        try:
+            tax_data = final.scrape_tax_rates(self.url)
+        except Exception as e:
+            self.stats.record_scrape('scrape_error', time.perf_counter() - started, f'scrape_{type(e).__name__}')
+            return
+        elapsed = time.perf_counter() - started
+        if not tax_data:
+            self.stats.record_scrape('scrape_error', elapsed, 'scrape_empty')
+        elif len(tax_data) < self.expected_rows:
+            self.stats.record_scrape('scrape_error', elapsed, 'scrape_partial')
+        else:
+            self.rates.reload(tax_data)
+            self.stats.record_scrape('scrape_ok', elapsed)
+
+    def _refresh_loop(self):
+        while not self._stop.wait(self.refresh_interval):
+            self.refresh()
+
+    # Close the current report interval, print it and keep it for the final report
+    def report_window(self, elapsed, interval):
+        window, latencies = self.stats.take_window()
+        lookups = window['ok'] + window['unmatched'] + window['error']
+        summary = {
+            'elapsed_s': elapsed,
+            'lookups': lookups,
+            'throughput_qps': lookups / interval if interval else 0.0,
+            'errors': window['error'],
+            'error_rate': window['error'] / lookups if lookups else 0.0,
+            'dropped': window['dropped'],
+            'scrapes': window['scrape_ok'] + window['scrape_error'],
+            'scrape_errors': window['scrape_error'],
+            'rss_mib': current_rss_mib(),
+            'latency': percentiles(latencies) if latencies else None,
+        }
+        self.windows.append(summary)
+
+        latency = summary['latency'] or {}
+        print(f"{elapsed:>7.1f}s {summary['throughput_qps']:>9.1f} {latency.get('p50_us', 0) / 1000:>9.2f} "
+              f"{latency.get('p99_us', 0) / 1000:>9.2f} {latency.get('max_us', 0) / 1000:>9.2f} "
+              f"{summary['error_rate'] * 100:>7.2f}% {summary['scrape_errors']:>3}/{summary['scrapes']:<3} "
+              f"{summary['rss_mib']:>8.1f}", flush=True)
+        return summary
+
+    # Issue lookups at self.qps for duration seconds; returns the final report
+    def run(self, duration, report_interval=DEFAULT_REPORT_INTERVAL):
+        # Warm the resolver and the rate path so the first interval is not all cold start
+        final.get_location_from_zip(self.zip_codes[0])
+        refresher = threading.Thread(target=self._refresh_loop, name='rate-refresher', daemon=True)
+        refresher.start()
+
+        # Cap on lookups waiting for a worker; past it new lookups are dropped and counted,
+        # so an overloaded run reports drops instead of building an ever longer backlog
+        in_flight = threading.Semaphore(self.max_queue)
+
+        def run_lookup(zip_code, payment, scheduled):
+            try:
+                self.lookup(zip_code, payment, scheduled)
+            finally:
+                in_flight.release()
+
+        print(f"{'time':>8} {'qps':>9} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9} {'errors':>8} {'scrape':>7} {'rss MiB':>8}")
+        rss_start = current_rss_mib()
+        started = time.perf_counter()
+        last_report = started
+        count = 0
+        with ThreadPoolExecutor(self.workers, thread_name_prefix='load') as executor:
+            while True:
+                scheduled = started + count / self.qps
+                now = time.perf_counter()
+                if now >= last_report + report_interval:
+                    self.report_window(now - started, now - last_report)
+                    last_report = now
+                if scheduled - started >= duration:
+                    break
+                if scheduled > now:
+                    time.sleep(scheduled - now)
+
+                count += 1
+                if not in_flight.acquire(blocking=False):
+                    self.stats.record('dropped')
+                    continue
+                zip_code = self.random.choice(self.zip_codes)
+                payment = Decimal(self.random.randrange(100, 500000)) / 100
+                executor.submit(run_lookup, zip_code, payment, scheduled)
+
+        self._stop.set()
+        refresher.join()
+        elapsed = time.perf_counter() - started
+        if elapsed > last_report - started + 0.5:
+            self.report_window(elapsed, time.perf_counter() - last_report)
+        return self.final_report(elapsed, rss_start)
+
+    def final_report(self, elapsed, rss_start):
+        totals = self.stats.totals
+        lookups = totals['ok'] + totals['unmatched'] + totals['error']
+        scrapes = totals['scrape_ok'] + totals['scrape_error']
+        # Ignore the first fifth of the run, where caches and allocator pools are still filling
+        settled = [(window['elapsed_s'], window['rss_mib']) for window in self.windows[len(self.windows) // 5:]]
+        latency = self.stats.latency.as_dict()
+        return {
+            'duration_s': elapsed,
+            'target_qps': self.qps,
+            'achieved_qps': lookups / elapsed if elapsed else 0.0,
+            'lookups': lookups,
+            'unmatched': totals['unmatched'],
+            'errors': totals['error'],
+            'error_rate': totals['error'] / lookups if lookups else 0.0,
+            'dropped': totals['dropped'],
+            'error_kinds': dict(self.stats.errors),
+            'scrapes': scrapes,
+            'scrape_errors': totals['scrape_error'],
+            'scrape_mean_ms': self.stats.scrape_seconds * 1000 / scrapes if scrapes else None,
+            'rate_version': self.rates.rate_table.version,
+            'latency_p50_le_ms': latency['p50_le_us'] / 1000 if latency['count'] else None,
+            'latency_p99_le_ms': latency['p99_le_us'] / 1000 if latency['count'] else None,
+            'latency_mean_ms': latency['mean_us'] / 1000 if latency['count'] else None,
+            'rss_start_mib': rss_start,
+            'rss_end_mib': current_rss_mib(),
+            'rss_growth_mib_per_min': slope(settled) * 60,
+            'windows': self.windows,
+        }
+
+
+# Function to print the final report and check it against the limits; returns failed checks
+def check_report(report, max_error_rate=None, max_p99_ms=None, max_growth=None):
+    print(f"\n{report['lookups']} lookups in {report['duration_s']:.1f} s: {report['achieved_qps']:.1f}/s "
+          f"(target {report['target_qps']}/s), {report['dropped']} dropped, {report['unmatched']} unmatched")
+    if report['latency_p99_le_ms'] is not None:
+        print(f"Latency: mean {report['latency_mean_ms']:.2f} ms, p50 <= {report['latency_p50_le_ms']:.2f} ms, "
+              f"p99 <= {report['latency_p99_le_ms']:.2f} ms")
+    print(f"Errors: {report['errors']} lookups ({report['error_rate'] * 100:.2f}%), "
+          f"{report['scrape_errors']} of {report['scrapes']} scrapes {report['error_kinds'] or ''}")
+    print(f"Memory: {report['rss_start_mib']:.1f} -> {report['rss_end_mib']:.1f} MiB RSS, "
+          f"{report['rss_growth_mib_per_min']:+.2f} MiB/min after warm-up")
+
+    failures = []
+    if max_error_rate is not None and report['error_rate'] > max_error_rate:
+        failures.append(f"error rate {report['error_rate']:.4f} above {max_error_rate}")
+    if max_p99_ms is not None and (report['latency_p99_le_ms'] or 0) > max_p99_ms:
+        failures.append(f"p99 latency {report['latency_p99_le_ms']:.2f} ms above {max_p99_ms} ms")
+    if max_growth is not None and report['rss_growth_mib_per_min'] > max_growth:
+        failures.append(f"memory growth {report['rss_growth_mib_per_min']:.2f} MiB/min above {max_growth}")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return failures
+
+
+# Main function
+def main():
+    parser = argparse.ArgumentParser(description="Load and soak test the pricing path against a local CDTFA stand-in.")
+    parser.add_argument('--page', default=DEFAULT_PAGE, help="recorded CDTFA page the stand-in serves")
+    parser.add_argument('--qps', type=float, default=200.0, help="target lookups per second")
+    parser.add_argument('--duration', type=float, default=60.0, help="seconds to run")
+    parser.add_argument('--workers', type=int, default=8, help="threads issuing lookups")
+    parser.add_argument('--max-queue', type=int, help="lookups allowed to wait for a worker before new ones are dropped "
+                        f"(default {DEFAULT_QUEUE_PER_WORKER} per worker)")
+    parser.add_argument('--refresh-interval', type=float, default=DEFAULT_REFRESH_INTERVAL,
+                        help="seconds between rate scrapes")
+    parser.add_argument('--report-interval', type=float, default=DEFAULT_REPORT_INTERVAL,
+                        help="seconds between progress lines")
+    parser.add_argument('--zips', type=int, default=2000, help="California ZIPs to draw lookups from")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-error-rate', type=float, help="fail if the lookup error rate is above this")
+    parser.add_argument('--max-p99-ms', type=float, help="fail if the p99 lookup latency is above this")
+    parser.add_argument('--max-growth', type=float, help="fail if RSS grows faster than this many MiB/min")
+    parser.add_argument('--output', help="write the report as JSON to this file")
+    add_fault_arguments(parser)
+    args = parser.parse_args()
+
+    zip_codes = sample_zips(args.zips)
+    if not zip_codes:
+        print("The local pgeocode dataset has no California ZIP codes.")
+        return 1
+
+    server = start_server(args.page, faults=fault_plan(args))
+    try:
+        test = LoadTest(server.url, load_saved_page(args.page), zip_codes, args.qps, args.workers,
+                        args.refresh_interval, args.seed, args.max_queue)
+        report = test.run(args.duration, args.report_interval)
+        report['server_requests'], report['server_faults'] = server.counts()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    failures = check_report(report, args.max_error_rate, args.max_p99_ms, args.max_growth)
+    if args.output:
+        metadata = run_metadata(argparse.Namespace(lookups=report['lookups'], batch_rows=0, seed=args.seed))
+        metadata.update(qps=args.qps, duration=args.duration, workers=args.workers)
+        with open(args.output, 'w') as handle:
+            json.dump({'metadata': metadata, 'results': report}, handle, indent=2)
+        print(f"Wrote the report to {args.output}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,186 @@
+# Bounded LRU memoization for ZIP -> location and (city, county) -> rate lookups.
+# Traffic is heavily skewed toward a few hundred ZIPs, so a small cache in front of
+# the resolvers answers most requests. Counters show how well a given size works.
+import threading
+import time
+from collections import OrderedDict
+
+from final import get_location_from_zip, get_locations_from_zips, match_tax_rate
+from name_matching import canonical_name
+from rate_reload import RateReloader
+from rate_table import normalize_name
+
+DEFAULT_LOCATION_CACHE_SIZE = 4096
+DEFAULT_RATE_CACHE_SIZE = 4096
+
+
+# Least-recently-used cache with optional TTL and version-stamped entries.
+# Entries stored under an older version are treated as misses, and changing the
+# version drops every entry at once.
+class LRUCache:
+    def __init__(self, maxsize=1024, ttl=None, version=None, clock=time.monotonic):
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.version = version
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    # Return (found, value) for a key, counting the hit or miss
+    def lookup(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, version, expires_at = entry
+                if version == self.version and (expires_at is None or self.clock() < expires_at):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return True, value
+                del self._entries[key]
+                self.expirations += 1
+            self.misses += 1
+            return False, None
+
+    def get(self, key, default=None):
+        found, value = self.lookup(key)
+        return value if found else default
+
+    # Store a value; version stamps it with the version it was computed under (default: current)
+    def put(self, key, value, version=None):
+        expires_at = None if self.ttl is None else self.clock() + self.ttl
+        with self._lock:
+            self._entries[key] = (value, self.version if version is None else version, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    # Return the cached value for a key, computing and storing it on a miss
+    def get_or_compute(self, key, compute, version=None):
+        found, value = self.lookup(key)
+        if not found:
+            value = compute()
+            self.put(key, value, version)
+        return value
+
+    # Drop the given keys, or every entry when keys is None
+    def invalidate(self, keys=None):
+        with self._lock:
+            if keys is None:
+                self.invalidations += len(self._entries)
+                self._entries.clear()
+                return
+            for key in keys:
+                if self._entries.pop(key, None) is not None:
+                    self.invalidations += 1
+
+    # Move the cache to a new version, dropping entries stored under the old one
+    def set_version(self, version):
+        if version != self.version:
+            self.invalidate()
+            self.version = version
+
+    # Move the cache to a new version, dropping only the entries drop(key) selects and
+    # keeping the rest; returns how many entries were dropped
+    def migrate(self, version, drop):
+        with self._lock:
+            dropped = [key for key, entry in self._entries.items() if entry[1] != self.version or drop(key)]
+            for key in dropped:
+                del self._entries[key]
+            for key, (value, _, expires_at) in self._entries.items():
+                self._entries[key] = (value, version, expires_at)
+            self.invalidations += len(dropped)
+            self.version = version
+            return len(dropped)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'invalidations': self.invalidations,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+
+# Memoized location and rate lookups bound to the currently loaded rate table
+class LookupCache:
+    def __init__(self, tax_data, location_size=DEFAULT_LOCATION_CACHE_SIZE, rate_size=DEFAULT_RATE_CACHE_SIZE,
+                 location_ttl=None, rate_ttl=None):
+        self.reloader = RateReloader(tax_data)
+        self.locations = LRUCache(location_size, location_ttl)
+        self.rates = LRUCache(rate_size, rate_ttl, version=self.rate_table.version)
+
+    @property
+    def rate_table(self):
+        return self.reloader.rate_table
+
+    # ZIP -> city/county/state dict (shared between callers, so treat it as read-only)
+    def location(self, zip_code):
+        return self.locations.get_or_compute(zip_code, lambda: get_location_from_zip(zip_code))
+
+    # Locations for many ZIPs, resolving every cache miss with one batch query
+    def locations_many(self, zip_codes):
+        results = {}
+        missing = []
+        for zip_code in zip_codes:
+            found, location_info = self.locations.lookup(zip_code)
+            if found:
+                results[zip_code] = location_info
+            else:
+                missing.append(zip_code)
+        for zip_code, location_info in zip(missing, get_locations_from_zips(missing) if missing else []):
+            self.locations.put(zip_code, location_info)
+            results[zip_code] = location_info
+        return [results[zip_code] for zip_code in zip_codes]
+
+    # (city, county) -> MatchResult (rate, tier, CDTFA location) from the current rate table
+    def match(self, city, county):
+        rate_table = self.rate_table
+        if rate_table.version != self.rates.version:
+            # A reload is swapping tables right now; answer from the new table without caching
+            return match_tax_rate(city, county, rate_table)
+        key = (normalize_name(city), normalize_name(county))
+        return self.rates.get_or_compute(key, lambda: match_tax_rate(city, county, rate_table), rate_table.version)
+
+    # (city, county) -> rate string from the current rate table
+    def tax_rate(self, city, county):
+        return self.match(city, county).rate
+
+    # Reload rates in place; only cached rates in counties the new scrape changed are dropped.
+    # Returns the change report.
+    def load_rate_table(self, tax_data):
+        return self.reloader.reload(tax_data, self._migrate_rates)
+
+    # Load the first rates, unless a reload already loaded some; returns the change report or None
+    def load_initial_rate_table(self, tax_data):
+        return self.reloader.reload_if_unset(tax_data, self._migrate_rates)
+
+    def _migrate_rates(self, rate_table, diff):
+        # Fuzzy, unincorporated and county-wide matches depend on every row in a county
+        counties = {canonical_name(county) for county in diff.counties()}
+        return self.rates.migrate(rate_table.version, lambda key: canonical_name(key[1]) in counties)
+
+    def stats(self):
+        return {
+            'rate_table_version': self.rate_table.version,
+            'locations': self.locations.stats(),
+            'rates': self.rates.stats(),
+        }
@@ -1,6 +1,6 @@
 import requests
 from bs4 import BeautifulSoup
-import pgeocode
+from zip_resolver import get_nominatim
 from decimal import Decimal
 
 # Function to scrape tax rates data from the CDTFA page
@@ -26,7 +26,7 @@ def scrape_tax_rates():
 
 # Function to get city, county, state using pgeocode
 def get_location_from_zip(zip_code):
-    nomi = pgeocode.Nominatim('US')
+    nomi = get_nominatim('US')
     location_info = nomi.query_postal_code(zip_code)
 
     if isinstance(location_info.place_name, float) or isinstance(location_info.county_name, float):
@@ -89,9 +89,10 @@ def validate_monthly_payment(payment):
 
 # Main function
 def main():
-    # Step 1: Scrape tax rates from the website
-    print("Scraping tax rates from CDTFA website...")
-    tax_data = scrape_tax_rates()
+    # Step 1: Load tax rates from the local snapshot, scraping the website only if there is none
+    from rate_cache import load_tax_data
+    print("Loading tax rates...")
+    tax_data = load_tax_data()
 
     if not tax_data:
         print("No tax data was extracted. Exiting...")
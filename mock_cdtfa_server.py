@@ -0,0 +1,173 @@
+# Local stand-in for the CDTFA rates page.
+# Serves a saved copy of the page with ETag/Last-Modified headers so the rate
+# cache and scrapers can be exercised without touching the live site. Faults can be
+# injected to mimic a slow or broken upstream: added latency, HTTP errors, and pages
+# cut off part-way through (sent as a complete, shorter response without validators).
+import argparse
+import hashlib
+import os
+import random
+import threading
+import time
+from collections import Counter
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_PAGE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'cdtfa_rates.html')
+
+
+# Faults to inject into responses, drawn independently for every request
+class FaultPlan:
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, error_status=503, truncate_rate=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.truncate_rate = truncate_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    # (delay in seconds, error status or None, whether to truncate the page) for one request
+    def draw(self):
+        with self._lock:
+            delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0.0)
+            status = self.error_status if self._random.random() < self.error_rate else None
+            truncate = status is None and self._random.random() < self.truncate_rate
+        return delay, status, truncate
+
+
+# Request handler that serves the page held by its server
+class CdtfaPageHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        server.record()
+        body, etag, last_modified = server.page
+
+        delay, status, truncate = server.faults.draw()
+        if delay:
+            time.sleep(delay)
+        if status is not None:
+            server.record(f'http_{status}')
+            self.send_response(status)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        if self.headers.get('If-None-Match') == etag or (
+            'If-None-Match' not in self.headers and self.headers.get('If-Modified-Since') == last_modified
+        ):
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Last-Modified', last_modified)
+            self.end_headers()
+            return
+
+        # A cut-off page is not the page the validators describe, so it is sent without them;
+        # otherwise a cache would keep the partial page and be answered 304 from then on
+        if truncate:
+            server.record('truncated')
+            body = body[:len(body) // 2]
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        if not truncate:
+            self.send_header('ETag', etag)
+            self.send_header('Last-Modified', last_modified)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+
+# HTTP server holding the current page body and its validators
+class CdtfaServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, page_path=DEFAULT_PAGE, quiet=True, faults=None):
+        super().__init__(address, CdtfaPageHandler)
+        self.quiet = quiet
+        self.request_count = 0
+        self.faults = faults or FaultPlan()
+        self.fault_counts = Counter()
+        # Handlers run on their own threads, so the counters are only changed under this lock
+        self._count_lock = threading.Lock()
+        self.set_page_file(page_path)
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}/taxes-and-fees/rates.aspx'
+
+    # Count a request, or a fault injected into one
+    def record(self, fault=None):
+        with self._count_lock:
+            if fault is None:
+                self.request_count += 1
+            else:
+                self.fault_counts[fault] += 1
+
+    # (request count, fault counts) as of one moment
+    def counts(self):
+        with self._count_lock:
+            return self.request_count, dict(self.fault_counts)
+
+    # Replace the served page, which changes its ETag and Last-Modified
+    def set_page(self, body):
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        self.page = (body, etag, formatdate(usegmt=True))
+
+    def set_page_file(self, page_path):
+        with open(page_path, 'rb') as handle:
+            self.set_page(handle.read())
+
+
+# Function to start the stand-in server on a background thread
+def start_server(page_path=DEFAULT_PAGE, host='127.0.0.1', port=0, quiet=True, faults=None):
+    server = CdtfaServer((host, port), page_path, quiet=quiet, faults=faults)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+# Function to add the fault injection options to a command-line parser
+def add_fault_arguments(parser):
+    parser.add_argument('--latency-ms', type=float, default=0.0, help="delay added to every response")
+    parser.add_argument('--jitter-ms', type=float, default=0.0, help="extra random delay of up to this much")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of requests answered with an HTTP error")
+    parser.add_argument('--error-status', type=int, default=503, help="status code of injected errors")
+    parser.add_argument('--truncate-rate', type=float, default=0.0, help="fraction of pages cut off half-way")
+    parser.add_argument('--fault-seed', type=int, help="seed for drawing faults, for repeatable runs")
+
+
+# Function to build the FaultPlan described by parsed fault options
+def fault_plan(args):
+    return FaultPlan(
+        latency=args.latency_ms / 1000, jitter=args.jitter_ms / 1000, error_rate=args.error_rate,
+        error_status=args.error_status, truncate_rate=args.truncate_rate, seed=args.fault_seed
+    )
+
+
+# Main function
+def main():
+    parser = argparse.ArgumentParser(description="Serve a saved CDTFA rates page locally.")
+    parser.add_argument('--page', default=DEFAULT_PAGE, help="saved HTML page to serve")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    add_fault_arguments(parser)
+    args = parser.parse_args()
+
+    server = CdtfaServer((args.host, args.port), args.page, quiet=False, faults=fault_plan(args))
+    print(f"Serving {args.page} at {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
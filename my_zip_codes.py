@@ -1,5 +1,5 @@
-import pgeocode
 from decimal import Decimal
+from zip_resolver import get_nominatim
 
 # Constants
 TAX_RATES = {
@@ -9,7 +9,7 @@ TAX_RATES = {
 }
 
 def get_location_info(zip_code):
-    nomi = pgeocode.Nominatim('US')
+    nomi = get_nominatim('US')
     result = nomi.query_postal_code(zip_code)
 
     if not result.empty:
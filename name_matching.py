@@ -0,0 +1,265 @@
+# Normalized, alias and fuzzy matching of pgeocode place names to CDTFA locations.
+# pgeocode and CDTFA spell places differently ("SAINT HELENA" vs "ST. HELENA",
+# "SONOMA" vs "SONOMA (CITY)"), so exact matching misses. The indexes here are
+# built once at rate-load time and queried in tiers, cheapest and safest first.
+import argparse
+import csv
+import re
+import unicodedata
+from collections import Counter, namedtuple
+
+from rate_table import is_unincorporated, normalize_name
+
+# Tiers in the order they are tried
+TIERS = ('exact', 'normalized', 'alias', 'fuzzy', 'unincorporated', 'county')
+
+ABBREVIATIONS = {
+    'ST': 'SAINT',
+    'STE': 'SAINTE',
+    'MT': 'MOUNT',
+    'FT': 'FORT',
+    'PT': 'POINT',
+    'PK': 'PARK',
+}
+
+# Known alternative names, normalized alternative -> normalized CDTFA name
+ALIASES = {
+    'SAN BUENAVENTURA': 'VENTURA',
+    'CITY OF INDUSTRY': 'INDUSTRY',
+}
+
+FUZZY_MIN_SIMILARITY = 0.85
+FUZZY_CANDIDATES = 5
+
+PARENTHETICAL = re.compile(r'\(([^)]*)\)')
+PUNCTUATION = re.compile(r"[^\w\s]")
+
+
+
+# Rate, the tier that matched and the CDTFA location; false when nothing matched
+class MatchResult(namedtuple('MatchResult', 'rate tier location')):
+    __slots__ = ()
+
+    def __bool__(self):
+        return self.rate is not None
+
+
+NO_MATCH = MatchResult(None, None, None)
+
+
+# Function to reduce a place name to a canonical key: no accents, punctuation,
+# "(CITY)" suffixes or "CITY OF" prefixes, and with abbreviations spelled out
+def canonical_name(name):
+    if not name:
+        return ''
+    name = unicodedata.normalize('NFKD', name)
+    name = ''.join(character for character in name if not unicodedata.combining(character))
+    name = PARENTHETICAL.sub(' ', name.upper())
+    words = PUNCTUATION.sub(' ', name).split()
+    if words[:2] == ['CITY', 'OF'] and len(words) > 2:
+        words = words[2:]
+    return ' '.join(ABBREVIATIONS.get(word, word) for word in words)
+
+
+# Function to pull alternative names out of a location's parentheses,
+# e.g. "VENTURA* (CITY OF SAN BUENAVENTURA)" -> ["SAN BUENAVENTURA"]
+def parenthetical_aliases(location):
+    aliases = []
+    for inner in PARENTHETICAL.findall(location.upper()):
+        alias = canonical_name(inner)
+        if alias and alias != 'CITY':
+            aliases.append(alias)
+    return aliases
+
+
+# Function to split a name into padded character trigrams
+def trigrams(name):
+    padded = f'  {name} '
+    return {padded[index:index + 3] for index in range(len(padded) - 2)}
+
+
+# Function to compute the Levenshtein edit distance between two strings
+def edit_distance(first, second):
+    if len(first) < len(second):
+        first, second = second, first
+    previous = list(range(len(second) + 1))
+    for row, first_char in enumerate(first, 1):
+        current = [row]
+        for column, second_char in enumerate(second, 1):
+            current.append(min(
+                previous[column] + 1,
+                current[column - 1] + 1,
+                previous[column - 1] + (first_char != second_char),
+            ))
+        previous = current
+    return previous[-1]
+
+
+# Function to turn an edit distance into a 0..1 similarity
+def similarity(first, second):
+    longest = max(len(first), len(second))
+    return 1.0 - edit_distance(first, second) / longest if longest else 1.0
+
+
+# Tiered matching index over the scraped (location, county, rate) rows
+class MatchIndex:
+    def __init__(self, rate_table, aliases=ALIASES):
+        self.rate_table = rate_table
+        self.aliases = aliases
+        self.by_canonical = {}
+        self.by_alias = {}
+        self.trigram_index = {}
+        self._add_rows(rate_table.rows)
+        self._add_aliases()
+
+    def _add_rows(self, rows, county_keys=None):
+        for location, county, rate in rows:
+            if is_unincorporated(normalize_name(location)):
+                continue
+            county_key = canonical_name(county)
+            if county_keys is not None and county_key not in county_keys:
+                continue
+            name = canonical_name(location)
+            entry = (rate, location)
+            self.by_canonical.setdefault((name, county_key), entry)
+            for alias in parenthetical_aliases(location):
+                self.by_alias.setdefault((alias, county_key), entry)
+
+            grams = self.trigram_index.setdefault(county_key, {})
+            for gram in trigrams(name):
+                grams.setdefault(gram, set()).add(name)
+
+    def _add_aliases(self, county_keys=None):
+        for alias, name in self.aliases.items():
+            for (known_name, county_key), entry in list(self.by_canonical.items()):
+                if known_name == name and (county_keys is None or county_key in county_keys):
+                    self.by_alias.setdefault((alias, county_key), entry)
+
+    # Index for an updated rate table that rebuilds only the given counties' entries, in the
+    # table's row order, and shares everything else with this index
+    def updated(self, rate_table, counties):
+        county_keys = {canonical_name(county) for county in counties}
+        index = MatchIndex.__new__(MatchIndex)
+        index.rate_table = rate_table
+        index.aliases = self.aliases
+        index.by_canonical = {key: entry for key, entry in self.by_canonical.items() if key[1] not in county_keys}
+        index.by_alias = {key: entry for key, entry in self.by_alias.items() if key[1] not in county_keys}
+        index.trigram_index = {
+            county_key: grams for county_key, grams in self.trigram_index.items() if county_key not in county_keys
+        }
+
+        canonical_counties = {}
+        rows = [
+            row for row in rate_table.rows
+            if canonical_counties.setdefault(row[1], canonical_name(row[1])) in county_keys
+        ]
+        index._add_rows(rows, county_keys)
+        index._add_aliases(county_keys)
+        return index
+
+    # Closest location name in the same county, if it is similar enough
+    def fuzzy(self, name, county_key):
+        grams = self.trigram_index.get(county_key)
+        if not grams or not name:
+            return None
+
+        shared = Counter()
+        for gram in trigrams(name):
+            for candidate in grams.get(gram, ()):
+                shared[candidate] += 1
+
+        best_name, best_score = None, FUZZY_MIN_SIMILARITY
+        for candidate, _ in shared.most_common(FUZZY_CANDIDATES):
+            score = similarity(name, candidate)
+            if score >= best_score:
+                best_name, best_score = candidate, score
+        return best_name
+
+    # Match a (city, county) pair, returning the rate, the tier that matched and the CDTFA location
+    def match(self, city, county):
+        rate = self.rate_table.lookup(city, county)
+        if rate is not None:
+            return MatchResult(rate, 'exact', normalize_name(city))
+
+        name = canonical_name(city)
+        county_key = canonical_name(county)
+
+        entry = self.by_canonical.get((name, county_key))
+        if entry is not None:
+            return MatchResult(entry[0], 'normalized', entry[1])
+
+        entry = self.by_alias.get((name, county_key))
+        if entry is not None:
+            return MatchResult(entry[0], 'alias', entry[1])
+
+        fuzzy_name = self.fuzzy(name, county_key)
+        if fuzzy_name is not None:
+            rate, location = self.by_canonical[(fuzzy_name, county_key)]
+            return MatchResult(rate, 'fuzzy', location)
+
+        rate = self.rate_table.lookup_unincorporated(county)
+        if rate is not None:
+            return MatchResult(rate, 'unincorporated', None)
+
+        rate = self.rate_table.lookup_county(county)
+        if rate is not None:
+            return MatchResult(rate, 'county', None)
+
+        return NO_MATCH
+
+
+# Function to resolve every California ZIP and record which tier priced it
+def match_report(rate_table, zip_codes=None):
+    from final import get_locations_from_zips
+    from zip_resolver import list_postal_codes
+
+    if zip_codes is None:
+        zip_codes = sorted(code for code in list_postal_codes('CA') if code.isdigit() and len(code) == 5)
+
+    report = []
+    for zip_code, location_info in zip(zip_codes, get_locations_from_zips(zip_codes)):
+        if not location_info:
+            report.append({'zip': zip_code, 'city': None, 'county': None, 'tier': 'no_location', 'location': None, 'rate': None})
+            continue
+        result = rate_table.match(location_info['city'], location_info['county'])
+        report.append({
+            'zip': zip_code,
+            'city': location_info['city'],
+            'county': location_info['county'],
+            'tier': result.tier or 'unmatched',
+            'location': result.location,
+            'rate': result.rate,
+        })
+    return report
+
+
+# Main function
+def main():
+    parser = argparse.ArgumentParser(description="Report which matching tier resolves each California ZIP.")
+    parser.add_argument('--rates-page', help="read rates from a saved CDTFA page instead of the rate cache")
+    parser.add_argument('--output', help="write the per-ZIP report as CSV to this file")
+    args = parser.parse_args()
+
+    from rate_cache import load_saved_page, load_tax_data
+    from rate_table import build_rate_table
+
+    tax_data = load_saved_page(args.rates_page) if args.rates_page else load_tax_data()
+    if not tax_data:
+        print("No tax data was extracted. Exiting...")
+        return 1
+
+    report = match_report(build_rate_table(tax_data))
+    counts = Counter(row['tier'] for row in report)
+    for tier in TIERS + ('unmatched', 'no_location'):
+        print(f"{tier:<15} {counts.get(tier, 0):>6}")
+
+    if args.output:
+        with open(args.output, 'w', newline='') as handle:
+            writer = csv.DictWriter(handle, fieldnames=['zip', 'city', 'county', 'tier', 'location', 'rate'])
+            writer.writeheader()
+            writer.writerows(report)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,221 @@
+# Nearest rated jurisdiction for ZIP codes pgeocode cannot place.
+# New and PO-box ZIPs often come back without a city or county, so they cannot be
+# priced, but most still have a latitude/longitude. This module keeps a KD-tree over
+# the centroids of California ZIPs whose city and county have a known rate, and maps
+# a ZIP (or any latitude/longitude) to the closest of them with the distance to it,
+# so callers can decide how far is too far. ZIPs without coordinates fall back to
+# the centroid of their 3-digit prefix (one postal sectional center). Only ZIPs that
+# are in the indexed state, or whose state is unknown, and that share a 3-digit prefix
+# with it are matched, so an out-of-state ZIP is never given a California rate.
+import argparse
+import math
+from collections import namedtuple
+
+from rate_table import build_rate_table
+
+EARTH_RADIUS_KM = 6371.0088
+DEFAULT_STATE_CODE = 'CA'
+DEFAULT_STATE_NAME = 'CALIFORNIA'
+
+NearestMatch = namedtuple('NearestMatch', 'zip location tax_rate distance_km source')
+
+
+# Function to map a latitude/longitude to a point on the unit sphere, so straight-line
+# distance between points orders them the same as great-circle distance
+def unit_vector(latitude, longitude):
+    latitude = math.radians(latitude)
+    longitude = math.radians(longitude)
+    return (
+        math.cos(latitude) * math.cos(longitude),
+        math.cos(latitude) * math.sin(longitude),
+        math.sin(latitude),
+    )
+
+
+# Function to convert a squared chord length on the unit sphere to kilometres along the surface
+def chord_to_km(squared_chord):
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(squared_chord) / 2))
+
+
+# Static 3-d KD-tree. The points are reordered so the median of every range is the
+# node splitting it, which needs no node objects: a search walks (lo, hi, axis) ranges.
+class KDTree:
+    def __init__(self, points, payloads):
+        self.points = [tuple(point) for point in points]
+        self.payloads = list(payloads)
+        order = list(range(len(self.points)))
+        self._build(order, 0, len(order), 0)
+        self.points = [self.points[index] for index in order]
+        self.payloads = [self.payloads[index] for index in order]
+
+    def __len__(self):
+        return len(self.points)
+
+    def _build(self, order, lo, hi, axis):
+        while hi - lo > 1:
+            points = self.points
+            order[lo:hi] = sorted(order[lo:hi], key=lambda index: points[index][axis])
+            mid = (lo + hi) // 2
+            self._build(order, lo, mid, (axis + 1) % 3)
+            lo, axis = mid + 1, (axis + 1) % 3
+
+    # (payload, squared distance) of the point closest to query, or (None, inf) when empty
+    def nearest(self, query):
+        points = self.points
+        best_index = -1
+        best = math.inf
+        stack = [(0, len(points), 0, 0.0)]
+        while stack:
+            lo, hi, axis, bound = stack.pop()
+            if lo >= hi or bound >= best:
+                continue
+            mid = (lo + hi) // 2
+            point = points[mid]
+            dx = query[0] - point[0]
+            dy = query[1] - point[1]
+            dz = query[2] - point[2]
+            distance = dx * dx + dy * dy + dz * dz
+            if distance < best:
+                best_index, best = mid, distance
+
+            offset = query[axis] - point[axis]
+            next_axis = (axis + 1) % 3
+            if offset < 0:
+                stack.append((mid + 1, hi, next_axis, offset * offset))
+                stack.append((lo, mid, next_axis, 0.0))
+            else:
+                stack.append((lo, mid, next_axis, offset * offset))
+                stack.append((mid + 1, hi, next_axis, 0.0))
+        return (self.payloads[best_index] if best_index >= 0 else None), best
+
+
+# Spatial index of rated ZIP centroids answering "which rated jurisdiction is closest?"
+class NearestJurisdiction:
+    def __init__(self, entries, resolver=None, prefix_centroids=None, state_name=DEFAULT_STATE_NAME):
+        # entries: (zip, latitude, longitude, location, tax_rate) for every rated ZIP
+        self.resolver = resolver
+        self.state_name = state_name
+        self.tree = KDTree(
+            (unit_vector(latitude, longitude) for _, latitude, longitude, _, _ in entries),
+            ((zip_code, location, tax_rate) for zip_code, _, _, location, tax_rate in entries),
+        )
+        self.prefix_centroids = prefix_centroids or {}
+
+    def __len__(self):
+        return len(self.tree)
+
+    def _match(self, point, source):
+        payload, squared_chord = self.tree.nearest(point)
+        if payload is None:
+            return None
+        zip_code, location, tax_rate = payload
+        return NearestMatch(zip_code, location, tax_rate, chord_to_km(squared_chord), source)
+
+    # Closest rated jurisdiction to a latitude/longitude
+    def nearest(self, latitude, longitude):
+        return self._match(unit_vector(latitude, longitude), 'point')
+
+    def nearest_many(self, coordinates):
+        return [self.nearest(latitude, longitude) for latitude, longitude in coordinates]
+
+    # Closest rated jurisdiction to a ZIP's centroid, or to its 3-digit prefix's centroid
+    # when the ZIP has no coordinates; None when neither is known, or when the ZIP is in
+    # another state or outside the indexed state's 3-digit prefixes
+    def for_zip(self, zip_code):
+        return self.for_zips([zip_code])[0]
+
+    def for_zips(self, zip_codes):
+        zip_codes = list(zip_codes)
+        states = [location_info['state'] for location_info in self.resolver.resolve_many(zip_codes)]
+        matches = []
+        for zip_code, state, coordinates in zip(zip_codes, states, self.resolver.coordinates_many(zip_codes)):
+            prefix = str(zip_code)[:3]
+            if state not in (None, self.state_name) or prefix not in self.prefix_centroids:
+                matches.append(None)
+            elif coordinates is not None:
+                matches.append(self._match(unit_vector(*coordinates), 'zip'))
+            else:
+                matches.append(self._match(self.prefix_centroids[prefix], 'zip3'))
+        return matches
+
+
+# Function to average the unit vectors of every centroid sharing a 3-digit ZIP prefix
+def prefix_centroids(centroids):
+    sums = {}
+    for zip_code, latitude, longitude in centroids:
+        x, y, z = unit_vector(latitude, longitude)
+        total = sums.setdefault(zip_code[:3], [0.0, 0.0, 0.0])
+        total[0] += x
+        total[1] += y
+        total[2] += z
+
+    centers = {}
+    for prefix, (x, y, z) in sums.items():
+        length = math.sqrt(x * x + y * y + z * z)
+        if length:
+            centers[prefix] = (x / length, y / length, z / length)
+    return centers
+
+
+# Function to build the index from every ZIP in a state whose city and county have a rate
+def build_nearest_jurisdiction(tax_data, resolver=None, state_code=DEFAULT_STATE_CODE):
+    if resolver is None:
+        from zip_resolver import get_resolver
+        resolver = get_resolver()
+
+    rate_table = build_rate_table(tax_data)
+    centroids = resolver.centroids(state_code)
+    locations = resolver.resolve_many([zip_code for zip_code, _, _ in centroids])
+
+    entries = []
+    state_name = next((location_info['state'] for location_info in locations if location_info['state']), DEFAULT_STATE_NAME)
+    for (zip_code, latitude, longitude), location_info in zip(centroids, locations):
+        if location_info['city'] is None or location_info['county'] is None:
+            continue
+        tax_rate = rate_table.resolve(location_info['city'], location_info['county'])
+        if tax_rate:
+            entries.append((zip_code, latitude, longitude, location_info, tax_rate))
+    return NearestJurisdiction(entries, resolver, prefix_centroids(centroids), state_name)
+
+
+# Function to print one match
+def print_match(label, match):
+    if match is None:
+        print(f"{label}: no rated jurisdiction found.")
+        return
+    location_info = match.location
+    print(f"{label}: {location_info['city']}, {location_info['county']} (ZIP {match.zip}, {match.tax_rate}) "
+          f"{match.distance_km:.1f} km away [{match.source}]")
+
+
+# Main function
+def main():
+    parser = argparse.ArgumentParser(description="Find the nearest rated California jurisdiction to ZIP codes or points.")
+    parser.add_argument('--rates-page', help="read rates from a saved CDTFA page instead of the rate cache")
+    commands = parser.add_subparsers(dest='command', required=True)
+    zips = commands.add_parser('zip', help="look up ZIP codes")
+    zips.add_argument('zips', nargs='+', help="5-digit ZIP codes")
+    point = commands.add_parser('point', help="look up a latitude/longitude")
+    point.add_argument('latitude', type=float)
+    point.add_argument('longitude', type=float)
+    args = parser.parse_args()
+
+    from rate_cache import load_saved_page, load_tax_data
+
+    tax_data = load_saved_page(args.rates_page) if args.rates_page else load_tax_data()
+    if not tax_data:
+        print("No tax data was extracted. Exiting...")
+        return 1
+
+    index = build_nearest_jurisdiction(tax_data)
+    print(f"Indexed {len(index)} rated ZIP centroids.")
+    if args.command == 'point':
+        print_match(f"{args.latitude}, {args.longitude}", index.nearest(args.latitude, args.longitude))
+    else:
+        for zip_code, match in zip(args.zips, index.for_zips(args.zips)):
+            print_match(zip_code, match)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
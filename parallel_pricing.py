@@ -0,0 +1,261 @@
+# Multi-process batch pricing sharded by ZIP code.
+# Rows are routed to workers by ZIP so each worker keeps a hot cache for its share of
+# ZIPs. Workers read locations, rates and components from the memory-mapped ZIP rate
+# table (see zip_rate_table.py), so every process shares the same page-cache copy
+# instead of receiving a pickled table. The table must be built from the current rates
+# (python zip_rate_table.py build after every rate refresh); a stale one is refused.
+# ZIPs the table does not hold are resolved in the parent, one batch query per chunk,
+# so workers never load pgeocode or pandas. Results are merged back in input order.
+import argparse
+import multiprocessing
+import os
+import queue
+import sys
+import time
+import traceback
+
+from batch_pricing import DEFAULT_CHUNK_SIZE, open_writer, price_row, read_chunks
+from final import get_locations_from_zips, validate_zip_code
+from records import Location
+from zip_rate_table import DEFAULT_TABLE_PATH, ZipRateTable
+
+PROGRESS_INTERVAL = 2.0
+# How long the parent waits for a result before checking that every worker is still alive
+WORKER_POLL_INTERVAL = 1.0
+
+
+# Function to pick the worker shard for a ZIP code
+def shard_for(zip_code, shard_count):
+    return int(zip_code) % shard_count if zip_code.isdigit() else 0
+
+
+# Pricer used inside a worker: locations and rates from the ZIP rate table, or the
+# location the parent resolved for a ZIP the table lacks
+class ShardPricer:
+    def __init__(self, table_path):
+        self.table = ZipRateTable(table_path)
+        self.resolved = {}
+
+    # Location dict, rate and matching tier for a ZIP, memoized for the worker's share of ZIPs
+    def resolve(self, zip_code, location_info=None):
+        resolved = self.resolved.get(zip_code)
+        if resolved is None:
+            record = self.table.lookup(zip_code)
+            if record is not None:
+                location_info = Location(record['city'], record['county'], record['state'])
+                resolved = (location_info, record['tax_rate'] or '', record['match'] or '')
+            else:
+                # Not a California ZIP with a known place; the table has no rate for it either
+                resolved = (location_info, '', '')
+            self.resolved[zip_code] = resolved
+        return resolved
+
+    def price(self, zip_code, payment, location_info=None):
+        if not validate_zip_code(zip_code):
+            return price_row(zip_code, payment, None, None)
+        location_info, tax_rate, match = self.resolve(zip_code, location_info)
+        return price_row(zip_code, payment, location_info, None, tax_rate, match)
+
+    def close(self):
+        self.table.close()
+
+
+# Resolves, in the parent, the locations of ZIPs the ZIP rate table does not hold
+class OutsideLocations:
+    def __init__(self, table_path):
+        self.table = ZipRateTable(table_path)
+        self.locations = {}
+
+    # Location (or None) of every table-less ZIP in a chunk, with one batch query for new ones.
+    # Only ASCII 5-digit ZIPs are remembered, so the map stays bounded.
+    def for_chunk(self, chunk):
+        locations = self.locations
+        missing = sorted(
+            zip_code for zip_code in {zip_code for zip_code, _ in chunk}
+            if zip_code not in locations and validate_zip_code(zip_code) and zip_code.isascii()
+            and zip_code not in self.table
+        )
+        if missing:
+            for zip_code, location_info in zip(missing, get_locations_from_zips(missing)):
+                locations[zip_code] = location_info
+        return locations
+
+    def close(self):
+        self.table.close()
+
+
+# Function run by each worker process: price shards until told to stop
+def worker_main(table_path, inbox, outbox):
+    pricer = None
+    try:
+        pricer = ShardPricer(table_path)
+        while True:
+            item = inbox.get()
+            if item is None:
+                break
+            chunk_id, positions, rows = item
+            outbox.put((chunk_id, positions, [pricer.price(*row) for row in rows]))
+    except Exception:
+        outbox.put(('error', traceback.format_exc(), None))
+    finally:
+        if pricer is not None:
+            pricer.close()
+
+
+# Reports rows priced and throughput to stderr at a fixed interval
+class Progress:
+    def __init__(self, enabled=True, interval=PROGRESS_INTERVAL, stream=None):
+        self.enabled = enabled
+        self.interval = interval
+        self.stream = stream or sys.stderr
+        self.started = time.perf_counter()
+        self.last_report = self.started
+        self.rows = 0
+
+    def advance(self, rows):
+        self.rows += rows
+        now = time.perf_counter()
+        if self.enabled and now - self.last_report >= self.interval:
+            self.last_report = now
+            self.report(now)
+
+    def report(self, now=None):
+        elapsed = (now or time.perf_counter()) - self.started
+        rate = self.rows / elapsed if elapsed else 0.0
+        print(f"Priced {self.rows} rows in {elapsed:.1f} s ({rate:.0f} rows/s)", file=self.stream)
+
+
+# Function to price a whole file across worker processes, writing rows in input order.
+# With tax_data, the table must have been built from those rates (ValueError otherwise).
+def price_file_parallel(input_path, output_path, table_path=DEFAULT_TABLE_PATH, workers=None,
+                        chunk_size=DEFAULT_CHUNK_SIZE, zip_column='zip', payment_column='payment', progress=True,
+                        tax_data=None):
+    if tax_data is not None:
+        with ZipRateTable(table_path) as table:
+            table.require_rates(tax_data)
+
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = 2 * workers
+    context = multiprocessing.get_context()
+
+    outbox = context.Queue()
+    inboxes = [context.Queue() for _ in range(workers)]
+    processes = [
+        context.Process(target=worker_main, args=(table_path, inbox, outbox), daemon=True)
+        for inbox in inboxes
+    ]
+    for process in processes:
+        process.start()
+
+    outside = OutsideLocations(table_path)
+    writer = open_writer(output_path)
+    tracker = Progress(progress)
+    in_flight = {}
+    next_to_write = 0
+    total_rows = 0
+    error_rows = 0
+
+    # Collect one shard result and write every chunk that is now complete and next in order
+    def collect():
+        nonlocal next_to_write, error_rows
+        while True:
+            try:
+                chunk_id, positions, results = outbox.get(timeout=WORKER_POLL_INTERVAL)
+                break
+            except queue.Empty:
+                # A worker killed by a signal or a crash in native code never reports back
+                for index, process in enumerate(processes):
+                    if not process.is_alive():
+                        raise RuntimeError(f"Pricing worker {index} (pid {process.pid}) exited with code {process.exitcode}")
+        if chunk_id == 'error':
+            raise RuntimeError(f"Pricing worker failed:\n{positions}")
+
+        pending = in_flight[chunk_id]
+        for position, row in zip(positions, results):
+            pending['rows'][position] = row
+        pending['shards'] -= 1
+
+        while next_to_write in in_flight and in_flight[next_to_write]['shards'] == 0:
+            rows = in_flight.pop(next_to_write)['rows']
+            writer.write(rows)
+            error_rows += sum(1 for row in rows if row['error'])
+            tracker.advance(len(rows))
+            next_to_write += 1
+
+    try:
+        for chunk_id, chunk in enumerate(read_chunks(input_path, chunk_size, zip_column, payment_column)):
+            while len(in_flight) >= max_in_flight:
+                collect()
+
+            locations = outside.for_chunk(chunk)
+            shards = [([], []) for _ in range(workers)]
+            for position, (zip_code, payment) in enumerate(chunk):
+                positions, rows = shards[shard_for(zip_code, workers)]
+                positions.append(position)
+                rows.append((zip_code, payment, locations.get(zip_code)))
+
+            shards = [(index, shard) for index, shard in enumerate(shards) if shard[0]]
+            in_flight[chunk_id] = {'rows': [None] * len(chunk), 'shards': len(shards)}
+            total_rows += len(chunk)
+            for index, (positions, rows) in shards:
+                inboxes[index].put((chunk_id, positions, rows))
+
+        while in_flight:
+            collect()
+    finally:
+        for inbox in inboxes:
+            inbox.put(None)
+        for process in processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        writer.close()
+        outside.close()
+
+    if progress:
+        tracker.report()
+    return total_rows, error_rows
+
+
+# Main function
+def main():
+    parser = argparse.ArgumentParser(description="Price a (zip, payment) file across worker processes.")
+    parser.add_argument('input', help="input .csv or .parquet file")
+    parser.add_argument('output', help="output .csv or .parquet file")
+    parser.add_argument('--table', default=DEFAULT_TABLE_PATH, help="ZIP rate table built by zip_rate_table.py")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help="rows read per chunk")
+    parser.add_argument('--zip-column', default='zip', help="name of the ZIP code column")
+    parser.add_argument('--payment-column', default='payment', help="name of the payment column")
+    parser.add_argument('--quiet', action='store_true', help="do not report progress")
+    parser.add_argument('--rates-page', help="check the table against a saved CDTFA page instead of the rate cache")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.table):
+        print(f"No ZIP rate table at {args.table}. Build it with: python zip_rate_table.py build")
+        return 1
+
+    from rate_cache import load_saved_page, load_tax_data
+
+    tax_data = load_saved_page(args.rates_page) if args.rates_page else load_tax_data()
+    if not tax_data:
+        print("No tax data was extracted. Exiting...")
+        return 1
+
+    try:
+        with ZipRateTable(args.table) as table:
+            table.require_rates(tax_data)
+    except ValueError as e:
+        print(e)
+        return 1
+
+    total_rows, error_rows = price_file_parallel(
+        args.input, args.output, args.table, workers=args.workers, chunk_size=args.chunk_size,
+        zip_column=args.zip_column, payment_column=args.payment_column, progress=not args.quiet
+    )
+    print(f"Priced {total_rows} rows ({error_rows} with errors) into {args.output}.")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,295 @@
+# Streaming pricing pipeline built from generator stages.
+#
+#   read -> validate -> resolve -> [nearest] -> rate -> compute -> write
+#
+# Every stage takes an iterator and yields items lazily, so a file of any size is
+# priced in memory bounded by the buffer size. Stages that work best in batches
+# (reading, ZIP resolution, writing) hold at most buffer_size rows. Because the
+# consumer pulls rows through the chain, a slow stage slows the ones before it
+# instead of letting rows pile up. Any stage can be swapped for another generator
+# with the same shape, or moved onto its own thread with threaded().
+import argparse
+import queue
+import sys
+import threading
+
+from batch_pricing import OUTPUT_FIELDS, WRITERS, error_row, open_writer, output_format_for, price_row, read_chunks
+from final import get_locations_from_zips, match_tax_rate, validate_zip_code
+from rate_table import build_rate_table
+
+DEFAULT_BUFFER_SIZE = 10000
+DEFAULT_QUEUE_SIZE = 4
+
+# Extra output columns naming the rated ZIP an unresolvable ZIP was priced as
+NEAREST_FIELDS = ['matched_zip', 'match_distance_km']
+
+
+# One input row moving through the pipeline; row holds the priced or error output
+class PricingItem:
+    __slots__ = ('zip', 'payment', 'location', 'tax_rate', 'match', 'nearest', 'row')
+
+    def __init__(self, zip_code, payment):
+        self.zip = zip_code
+        self.payment = payment
+        self.location = None
+        self.tax_rate = None
+        self.match = ''
+        self.nearest = None
+        self.row = None
+
+
+# Stage: read (zip, payment) rows from a CSV or Parquet file, buffer_size rows at a time
+def read_items(path, buffer_size=DEFAULT_BUFFER_SIZE, zip_column='zip', payment_column='payment'):
+    for chunk in read_chunks(path, buffer_size, zip_column, payment_column):
+        for zip_code, payment in chunk:
+            yield PricingItem(zip_code, payment)
+
+
+# Stage: wrap (zip, payment) pairs from any iterable
+def items_from_rows(rows):
+    for zip_code, payment in rows:
+        yield PricingItem(zip_code, payment)
+
+
+# Stage: reject malformed ZIP codes before they reach the resolver
+def validate(items):
+    for item in items:
+        if not validate_zip_code(item.zip):
+            item.row = error_row(item.zip, item.payment, "Invalid ZIP code")
+        yield item
+
+
+# Function to split an iterator into lists of at most size items
+def batched(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# Stage: resolve locations with one pgeocode query per buffer of rows
+def resolve(items, buffer_size=DEFAULT_BUFFER_SIZE):
+    for batch in batched(items, buffer_size):
+        zip_codes = sorted({item.zip for item in batch if item.row is None})
+        locations = dict(zip(zip_codes, get_locations_from_zips(zip_codes)))
+        for item in batch:
+            if item.row is None:
+                item.location = locations.get(item.zip)
+            yield item
+
+
+# Stage: give ZIPs the resolver could not place the location of the nearest rated ZIP,
+# when it is within max_distance_km. Out-of-state ZIPs get no match and keep their
+# "No information found" error row (see nearest_jurisdiction.py)
+def nearest_fallback(items, nearest, max_distance_km, buffer_size=DEFAULT_BUFFER_SIZE):
+    for batch in batched(items, buffer_size):
+        zip_codes = sorted({item.zip for item in batch if item.row is None and item.location is None})
+        matches = dict(zip(zip_codes, nearest.for_zips(zip_codes)))
+        for item in batch:
+            match = matches.get(item.zip) if item.row is None and item.location is None else None
+            if match is not None and match.distance_km <= max_distance_km:
+                item.location = match.location
+                item.nearest = match
+            yield item
+
+
+# Stage: look up the rate, and the tier that matched it, for each resolved California location
+def rate(items, tax_data):
+    for item in items:
+        location_info = item.location
+        if item.row is None and location_info and location_info['state'] == 'CALIFORNIA':
+            tax_rate, item.match, _ = match_tax_rate(location_info['city'], location_info['county'], tax_data)
+            item.tax_rate = tax_rate or ''
+        yield item
+
+
+# Stage: compute taxes and remittances into the output row
+def compute(items):
+    for item in items:
+        if item.row is None:
+            item.row = price_row(item.zip, item.payment, item.location, None, item.tax_rate, item.match)
+        yield item
+
+
+# Stage: fill the NEAREST_FIELDS columns, blank unless the row was priced as a nearby ZIP
+def mark_nearest(items):
+    for item in items:
+        match = item.nearest
+        item.row['matched_zip'] = match.zip if match is not None else ''
+        item.row['match_distance_km'] = f'{match.distance_km:.1f}' if match is not None else ''
+        yield item
+
+
+# Stage: price items through a batch_planner.BatchPlanner, which does the ZIP work once
+# per distinct ZIP instead of the per-row validate, resolve, rate and compute stages
+def planned(items, planner, buffer_size=DEFAULT_BUFFER_SIZE):
+    for batch in batched(items, buffer_size):
+        rows = planner.price_chunk([(item.zip, item.payment) for item in batch])
+        for item, row in zip(batch, rows):
+            item.row = row
+            yield item
+
+
+# Stage: drop the item wrapper, leaving output rows
+def output_rows(items):
+    for item in items:
+        yield item.row
+
+
+# Function to chain the pricing stages over an iterator of items, yielding output rows.
+# With a NearestJurisdiction index, unresolvable ZIPs are priced as the nearest rated
+# ZIP within max_distance_km. With a BatchPlanner, rows are priced by the planner.
+def price_stream(items, tax_data, buffer_size=DEFAULT_BUFFER_SIZE, nearest=None, max_distance_km=None, planner=None):
+    if planner is not None:
+        if nearest is not None:
+            raise ValueError("The batch planner does not support the nearest-jurisdiction fallback")
+        return output_rows(planned(items, planner, buffer_size))
+
+    tax_data = build_rate_table(tax_data)
+    items = resolve(validate(items), buffer_size)
+    if nearest is not None:
+        return output_rows(mark_nearest(compute(rate(nearest_fallback(items, nearest, max_distance_km, buffer_size), tax_data))))
+    return output_rows(compute(rate(items, tax_data)))
+
+
+# Marker a threaded stage puts on its queue when its input is exhausted or failed
+class _StageEnd:
+    def __init__(self, error=None):
+        self.error = error
+
+
+# Stage runner: drain an iterator on its own thread into a bounded queue. The thread
+# blocks once maxsize items wait, so a fast producer cannot run ahead of its consumer.
+def threaded(items, maxsize=DEFAULT_QUEUE_SIZE):
+    buffer = queue.Queue(maxsize)
+    stop = threading.Event()
+
+    # Put a value, giving up if the consumer has gone away
+    def offer(value):
+        while not stop.is_set():
+            try:
+                buffer.put(value, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def run():
+        try:
+            for item in items:
+                if not offer(item):
+                    return
+        except Exception as e:
+            offer(_StageEnd(e))
+        else:
+            offer(_StageEnd())
+
+    thread = threading.Thread(target=run, name='pipeline-stage', daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = buffer.get()
+            if isinstance(item, _StageEnd):
+                if item.error is not None:
+                    raise item.error
+                return
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
+# Stage: write output rows buffer_size at a time; returns (rows, rows with errors)
+def write_rows(rows, writer, buffer_size=DEFAULT_BUFFER_SIZE):
+    total_rows = 0
+    error_rows = 0
+    for batch in batched(rows, buffer_size):
+        writer.write(batch)
+        total_rows += len(batch)
+        error_rows += sum(1 for row in batch if row['error'])
+    return total_rows, error_rows
+
+
+# Function to price a whole file through the pipeline; returns (rows, rows with errors).
+# With threads, reading and pricing each run on their own thread, buffered in batches.
+# With nearest_within_km, unresolvable ZIPs are priced as the nearest rated ZIP that close;
+# with a planner, each distinct ZIP is resolved once (see batch_planner.py).
+def run_pipeline(input_path, output_path, tax_data, buffer_size=DEFAULT_BUFFER_SIZE, zip_column='zip',
+                 payment_column='payment', threads=False, output_format=None, nearest_within_km=None,
+                 planner=None):
+    nearest = None
+    fields = OUTPUT_FIELDS
+    if nearest_within_km is not None:
+        from nearest_jurisdiction import build_nearest_jurisdiction
+
+        nearest = build_nearest_jurisdiction(tax_data)
+        fields = OUTPUT_FIELDS + NEAREST_FIELDS
+
+    items = read_items(input_path, buffer_size, zip_column, payment_column)
+    if threads:
+        items = (item for batch in threaded(batched(items, buffer_size)) for item in batch)
+    rows = price_stream(items, tax_data, buffer_size, nearest, nearest_within_km, planner)
+    if threads:
+        rows = (row for batch in threaded(batched(rows, buffer_size)) for row in batch)
+
+    writer = open_writer(output_path, fields, output_format)
+    try:
+        return write_rows(rows, writer, buffer_size)
+    finally:
+        writer.close()
+
+
+# Main function
+def main():
+    parser = argparse.ArgumentParser(description="Price a (zip, payment) file through the streaming pipeline.")
+    parser.add_argument('input', help="input .csv or .parquet file")
+    parser.add_argument('output', help="output file (.csv, .jsonl, .txt, .arrow or .parquet), or - for stdout")
+    parser.add_argument('--format', choices=list(WRITERS), help="output format (default: from the output extension)")
+    parser.add_argument('--buffer-size', type=int, default=DEFAULT_BUFFER_SIZE, help="rows buffered per stage")
+    parser.add_argument('--zip-column', default='zip', help="name of the ZIP code column")
+    parser.add_argument('--payment-column', default='payment', help="name of the payment column")
+    parser.add_argument('--threads', action='store_true', help="run reading and pricing on their own threads")
+    # The batch planner does not apply the nearest-jurisdiction fallback, so the two exclude each other
+    zip_work = parser.add_mutually_exclusive_group()
+    zip_work.add_argument('--nearest-within', type=float, metavar='KM',
+                          help="price ZIPs without a city/county as the nearest rated ZIP up to KM away")
+    zip_work.add_argument('--dedup', action='store_true', help="resolve each distinct ZIP once and report the savings")
+    parser.add_argument('--rates-page', help="read rates from a saved CDTFA page instead of the rate cache")
+    args = parser.parse_args()
+    try:
+        output_format_for(args.output, args.format)
+    except ValueError as e:
+        parser.error(str(e))
+
+    from rate_cache import load_saved_page, load_tax_data
+
+    # Keep status messages out of the results when they go to stdout
+    status = sys.stderr if args.output == '-' else sys.stdout
+    print("Loading tax rates...", file=status)
+    tax_data = load_saved_page(args.rates_page) if args.rates_page else load_tax_data()
+    if not tax_data:
+        print("No tax data was extracted. Exiting...", file=status)
+        return 1
+
+    planner = None
+    if args.dedup:
+        from batch_planner import BatchPlanner
+        planner = BatchPlanner(tax_data)
+
+    total_rows, error_rows = run_pipeline(
+        args.input, args.output, tax_data, buffer_size=args.buffer_size, zip_column=args.zip_column,
+        payment_column=args.payment_column, threads=args.threads, output_format=args.format,
+        nearest_within_km=args.nearest_within, planner=planner
+    )
+    print(f"Priced {total_rows} rows ({error_rows} with errors) into {args.output}.", file=status)
+    if planner is not None:
+        print(planner.stats.summary(), file=status)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,181 @@
+# Persistent SQLite snapshot of the scraped CDTFA tax rates.
+# Loading the snapshot takes milliseconds, so the apps can answer immediately and
+# refresh the rates in the background with a conditional (ETag/Last-Modified) request.
+import os
+import sqlite3
+import threading
+import time
+
+from final import CDTFA_RATES_URL, parse_tax_rates
+from rate_table import tax_data_version
+from records import RateColumns
+
+SCHEMA_VERSION = 1
+DEFAULT_TTL = 24 * 60 * 60
+DEFAULT_TIMEOUT = 30
+DEFAULT_CACHE_PATH = os.environ.get(
+    'ZIP_CODES_RATE_CACHE',
+    os.path.join(os.path.expanduser('~'), '.cache', 'zip_codes', 'cdtfa_rates.sqlite')
+)
+
+
+# Versioned on-disk snapshot of the rate table with conditional refresh
+class RateCache:
+    def __init__(self, path=DEFAULT_CACHE_PATH, url=CDTFA_RATES_URL, ttl=DEFAULT_TTL, timeout=DEFAULT_TIMEOUT):
+        self.path = path
+        self.url = url
+        self.ttl = ttl
+        self.timeout = timeout
+        self._refresh_lock = threading.Lock()
+
+    def _connect(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = sqlite3.connect(self.path)
+        connection.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS rates (position INTEGER PRIMARY KEY, location TEXT, county TEXT, rate TEXT)'
+        )
+        return connection
+
+    # Load the stored snapshot, or None when there is no usable one
+    def load(self):
+        if not os.path.exists(self.path):
+            return None
+
+        connection = self._connect()
+        try:
+            meta = dict(connection.execute('SELECT key, value FROM meta'))
+            if meta.get('schema_version') != str(SCHEMA_VERSION) or meta.get('url') != self.url:
+                return None
+            rows = connection.execute('SELECT location, county, rate FROM rates ORDER BY position').fetchall()
+        finally:
+            connection.close()
+
+        if not rows:
+            return None
+
+        return {
+            'tax_data': RateColumns(rows),
+            'version': meta.get('version'),
+            'etag': meta.get('etag') or None,
+            'last_modified': meta.get('last_modified') or None,
+            'fetched_at': float(meta.get('fetched_at', 0))
+        }
+
+    # Replace the stored snapshot in one transaction
+    def save(self, tax_data, etag=None, last_modified=None):
+        version = tax_data_version(tax_data)
+        connection = self._connect()
+        try:
+            with connection:
+                connection.execute('DELETE FROM rates')
+                connection.executemany(
+                    'INSERT INTO rates (position, location, county, rate) VALUES (?, ?, ?, ?)',
+                    [(position, location, county, rate) for position, (location, county, rate) in enumerate(tax_data)]
+                )
+                self._write_meta(connection, {
+                    'schema_version': str(SCHEMA_VERSION),
+                    'url': self.url,
+                    'version': version,
+                    'etag': etag or '',
+                    'last_modified': last_modified or '',
+                    'fetched_at': repr(time.time())
+                })
+        finally:
+            connection.close()
+        return version
+
+    # Record that the stored snapshot was confirmed current just now
+    def touch(self):
+        connection = self._connect()
+        try:
+            with connection:
+                self._write_meta(connection, {'fetched_at': repr(time.time())})
+        finally:
+            connection.close()
+
+    def _write_meta(self, connection, values):
+        connection.executemany('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', values.items())
+
+    def is_stale(self, snapshot):
+        return snapshot is None or time.time() - snapshot['fetched_at'] >= self.ttl
+
+    # Fetch the page, sending the stored validators; returns the new rows or None when unchanged
+    def refresh(self, snapshot=None):
+        import requests
+
+        with self._refresh_lock:
+            if snapshot is None:
+                snapshot = self.load()
+
+            headers = {}
+            if snapshot is not None:
+                if snapshot['etag']:
+                    headers['If-None-Match'] = snapshot['etag']
+                if snapshot['last_modified']:
+                    headers['If-Modified-Since'] = snapshot['last_modified']
+
+            response = requests.get(self.url, headers=headers, timeout=self.timeout)
+
+            if response.status_code == 304 and snapshot is not None:
+                self.touch()
+                return None
+
+            if response.status_code != 200:
+                print(f"Failed to refresh tax rates. Status code: {response.status_code}")
+                return None
+
+            tax_data = parse_tax_rates(response.content)
+            if not tax_data:
+                print("No tax data was extracted from the refreshed page.")
+                return None
+
+            version = self.save(tax_data, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+            if snapshot is not None and version == snapshot['version']:
+                return None
+            return tax_data
+
+    # Refresh on a background thread, calling on_update with the new rows if they changed
+    def refresh_in_background(self, snapshot=None, on_update=None):
+        def run():
+            # Any failure (network, parsing, saving the snapshot) leaves the old snapshot in use
+            try:
+                tax_data = self.refresh(snapshot)
+                if tax_data is not None and on_update is not None:
+                    on_update(tax_data)
+            except Exception as e:
+                print(f"Background tax rate refresh failed: {type(e).__name__}: {e}")
+
+        thread = threading.Thread(target=run, name='rate-cache-refresh', daemon=True)
+        thread.start()
+        return thread
+
+
+# Function to get tax data fast: serve the snapshot and refresh it in the background when stale
+def load_tax_data(cache=None, on_update=None):
+    cache = cache or RateCache()
+    snapshot = cache.load()
+
+    if snapshot is None:
+        import requests
+
+        try:
+            cache.refresh()
+        except requests.RequestException as e:
+            print(f"Failed to retrieve the tax rates: {e}")
+            return []
+        snapshot = cache.load()
+        return snapshot['tax_data'] if snapshot else []
+
+    if cache.is_stale(snapshot):
+        cache.refresh_in_background(snapshot, on_update)
+
+    return snapshot['tax_data']
+
+
+# Function to read tax data from a saved copy of the CDTFA page, for offline runs
+def load_saved_page(path):
+    with open(path, 'rb') as handle:
+        return parse_tax_rates(handle.read())
@@ -0,0 +1,178 @@
+# Concurrent fetching of CDTFA rate sources over one pooled HTTP session.
+# Each source is fetched on its own worker thread with connect/read timeouts and
+# retries with exponential backoff. A failing source does not stop the others, and
+# every request records its timing so slow or flaky sources show up.
+import argparse
+import csv
+import io
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from final import CDTFA_RATES_URL, parse_tax_rates
+from records import RateColumns
+
+DEFAULT_CONNECT_TIMEOUT = 5
+DEFAULT_READ_TIMEOUT = 30
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 0.5
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+RateSource = namedtuple('RateSource', 'name url format')
+FetchResult = namedtuple('FetchResult', 'source ok status tax_data error elapsed attempts size')
+
+DEFAULT_SOURCES = [
+    RateSource('cdtfa_rates_page', CDTFA_RATES_URL, 'html'),
+]
+
+
+# Function to parse a downloaded CSV of rates with Location, Rate and County columns
+def parse_rate_csv(content):
+    if isinstance(content, bytes):
+        content = content.decode('utf-8-sig')
+    tax_data = []
+    for record in csv.DictReader(io.StringIO(content)):
+        fields = {key.strip().lower(): (value or '').strip() for key, value in record.items() if key}
+        if fields.get('location') and fields.get('rate'):
+            tax_data.append((fields['location'].upper(), fields.get('county', '').upper(), fields['rate']))
+    return tax_data
+
+
+PARSERS = {
+    'html': parse_tax_rates,
+    'csv': parse_rate_csv,
+}
+
+
+# Function to guess a source's format from its URL
+def guess_format(url):
+    return 'csv' if url.lower().split('?')[0].endswith('.csv') else 'html'
+
+
+# Fetcher sharing one connection-pooled session across concurrent source downloads
+class RateFetcher:
+    def __init__(self, sources=None, max_workers=None, connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout=DEFAULT_READ_TIMEOUT, retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF):
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        self.sources = list(sources or DEFAULT_SOURCES)
+        self.max_workers = max_workers or max(1, len(self.sources))
+        self.timeout = (connect_timeout, read_timeout)
+        self.requests = requests
+
+        retry = Retry(
+            total=retries, connect=retries, read=retries, status=retries,
+            backoff_factor=backoff, status_forcelist=RETRY_STATUSES,
+            allowed_methods=frozenset(['GET']), raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=self.max_workers, pool_maxsize=self.max_workers, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._lock = threading.Lock()
+        self.timings = []
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    # Fetch and parse one source, never raising for network, HTTP or parse errors
+    def fetch_one(self, source):
+        start = time.perf_counter()
+        status, attempts, size = None, 1, 0
+        try:
+            response = self.session.get(source.url, timeout=self.timeout)
+            status = response.status_code
+            size = len(response.content)
+            retries = getattr(response.raw, 'retries', None)
+            if retries is not None:
+                attempts += len(retries.history)
+            if status != 200:
+                return self._record(source, False, status, [], f"HTTP {status}", start, attempts, size)
+
+            try:
+                tax_data = PARSERS[source.format](response.content)
+            except Exception as e:
+                return self._record(source, False, status, [], f"Parse error: {type(e).__name__}: {e}", start, attempts, size)
+            if not tax_data:
+                return self._record(source, False, status, [], "No tax data was extracted", start, attempts, size)
+            return self._record(source, True, status, tax_data, None, start, attempts, size)
+        except self.requests.RequestException as e:
+            return self._record(source, False, status, [], f"{type(e).__name__}: {e}", start, attempts, size)
+
+    def _record(self, source, ok, status, tax_data, error, start, attempts, size):
+        result = FetchResult(source, ok, status, tax_data, error, time.perf_counter() - start, attempts, size)
+        with self._lock:
+            self.timings.append({
+                'source': source.name, 'url': source.url, 'status': status, 'ok': ok,
+                'elapsed_ms': result.elapsed * 1000, 'attempts': attempts, 'bytes': size,
+            })
+        return result
+
+    # Fetch every source concurrently; results come back in source order
+    def fetch_all(self):
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return list(executor.map(self.fetch_one, self.sources))
+
+
+# Function to merge the rows of successful results; earlier sources win on duplicates
+def merge_results(results):
+    tax_data = RateColumns()
+    seen = set()
+    for result in results:
+        for location, county, rate in result.tax_data:
+            if (location, county) not in seen:
+                seen.add((location, county))
+                tax_data.append(location, county, rate)
+    return tax_data
+
+
+# Function to fetch all sources and return (merged tax data, per-source results)
+def fetch_tax_data(sources=None, **options):
+    with RateFetcher(sources, **options) as fetcher:
+        results = fetcher.fetch_all()
+    return merge_results(results), results
+
+
+# Function to parse a --source NAME=URL[#format] argument
+def parse_source(value):
+    name, _, url = value.partition('=')
+    if not url:
+        raise argparse.ArgumentTypeError("Use NAME=URL")
+    url_format = guess_format(url)
+    for known in PARSERS:
+        if url.endswith('#' + known):
+            url, url_format = url[:-len(known) - 1], known
+    return RateSource(name, url, url_format)
+
+
+# Main function
+def main():
+    parser = argparse.ArgumentParser(description="Fetch every CDTFA rate source concurrently.")
+    parser.add_argument('--source', action='append', type=parse_source,
+                        help="rate source as NAME=URL (append #csv or #html to force a format); repeatable")
+    parser.add_argument('--connect-timeout', type=float, default=DEFAULT_CONNECT_TIMEOUT)
+    parser.add_argument('--read-timeout', type=float, default=DEFAULT_READ_TIMEOUT)
+    parser.add_argument('--retries', type=int, default=DEFAULT_RETRIES)
+    args = parser.parse_args()
+
+    tax_data, results = fetch_tax_data(
+        args.source, connect_timeout=args.connect_timeout, read_timeout=args.read_timeout, retries=args.retries
+    )
+    for result in results:
+        outcome = f"{len(result.tax_data)} rows" if result.ok else f"failed ({result.error})"
+        print(f"{result.source.name:<20} {outcome:<40} {result.elapsed * 1000:>8.1f} ms, {result.attempts} attempt(s)")
+    print(f"Merged {len(tax_data)} rows from {sum(result.ok for result in results)} of {len(results)} sources.")
+    return 0 if tax_data else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,319 @@
+# Effective-dated history of CDTFA rate tables for re-pricing past invoices.
+# Each snapshot is stored as the changes from the snapshot before it, so a rate that
+# stays the same for years is stored once. In memory every (city, county) keeps a
+# sorted list of the dates its rate changed, and an as-of query is a bisect into it.
+import argparse
+import os
+import sqlite3
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from datetime import date, datetime
+
+from batch_pricing import DEFAULT_CHUNK_SIZE, OUTPUT_FIELDS, error_row, open_writer, price_row, read_chunks
+from final import get_location_from_zip, get_locations_from_zips, validate_zip_code
+from name_matching import NO_MATCH, MatchResult
+from rate_table import RateTable, normalize_name, tax_data_version
+
+DEFAULT_HISTORY_PATH = os.environ.get(
+    'ZIP_CODES_RATE_HISTORY',
+    os.path.join(os.path.expanduser('~'), '.cache', 'zip_codes', 'rate_history.sqlite')
+)
+
+REPRICE_FIELDS = ['invoice_date', 'rates_effective'] + OUTPUT_FIELDS
+
+SNAPSHOT_TABLE_CACHE_SIZE = 8
+
+
+# Function to turn a date, datetime or 'YYYY-MM-DD' string into an ISO date string
+def parse_date(value):
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    return date.fromisoformat(str(value).strip()[:10]).isoformat()
+
+
+# Function to key (location, county, rate) rows by normalized (city, county); the first row wins
+def keyed_rows(tax_data):
+    rows = {}
+    for location, county, rate in tax_data:
+        rows.setdefault((normalize_name(location), normalize_name(county)), (location, county, rate))
+    return rows
+
+
+# Function to list the changes that turn one keyed snapshot into the next; None marks a removal
+def snapshot_changes(previous, current):
+    changes = [(key, row) for key, row in current.items() if previous.get(key) != row]
+    changes.extend((key, None) for key in previous if key not in current)
+    return changes
+
+
+# Rate snapshots keyed by effective date, with logarithmic as-of lookups
+class RateHistory:
+    def __init__(self, path=DEFAULT_HISTORY_PATH):
+        self.path = path
+        self.load()
+
+    def _connect(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = sqlite3.connect(self.path)
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS snapshots (effective_date TEXT PRIMARY KEY, version TEXT, row_count INTEGER)'
+        )
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS changes ('
+            'effective_date TEXT, city_key TEXT, county_key TEXT, location TEXT, county TEXT, rate TEXT, '
+            'PRIMARY KEY (effective_date, city_key, county_key))'
+        )
+        return connection
+
+    # Read every snapshot and build the in-memory interval index
+    def load(self):
+        self.dates = []
+        self.versions = {}
+        # (city_key, county_key) -> ([effective dates], [(location, county, rate) or None])
+        self.intervals = {}
+        # Effective date -> RateTable for the most recently used snapshots
+        self._tables = OrderedDict()
+        if not os.path.exists(self.path):
+            return
+
+        connection = self._connect()
+        try:
+            for effective_date, version in connection.execute(
+                'SELECT effective_date, version FROM snapshots ORDER BY effective_date'
+            ):
+                self.dates.append(effective_date)
+                self.versions[effective_date] = version
+            changes = connection.execute(
+                'SELECT effective_date, city_key, county_key, location, county, rate FROM changes ORDER BY effective_date'
+            ).fetchall()
+        finally:
+            connection.close()
+
+        for effective_date, city_key, county_key, location, county, rate in changes:
+            starts, values = self.intervals.setdefault((city_key, county_key), ([], []))
+            starts.append(effective_date)
+            values.append(None if rate is None else (location, county, rate))
+
+    def __len__(self):
+        return len(self.dates)
+
+    # Keyed rows in force on a date, replayed from the stored changes
+    def _rows_as_of(self, as_of):
+        rows = {}
+        for key, (starts, values) in self.intervals.items():
+            index = bisect_right(starts, as_of) - 1
+            if index >= 0 and values[index] is not None:
+                rows[key] = values[index]
+        return rows
+
+    # Store the rates that took effect on a date, replacing any snapshot already on that date
+    def add_snapshot(self, effective_date, tax_data):
+        effective_date = parse_date(effective_date)
+        current = keyed_rows(tax_data)
+        before = bisect_left(self.dates, effective_date)
+        after = bisect_right(self.dates, effective_date)
+        previous_date = self.dates[before - 1] if before else None
+        next_date = self.dates[after] if after < len(self.dates) else None
+
+        previous = self._rows_as_of(previous_date) if previous_date else {}
+        following = self._rows_as_of(next_date) if next_date else None
+
+        connection = self._connect()
+        try:
+            with connection:
+                connection.execute('DELETE FROM changes WHERE effective_date = ?', (effective_date,))
+                self._insert_changes(connection, effective_date, snapshot_changes(previous, current))
+                connection.execute(
+                    'INSERT OR REPLACE INTO snapshots (effective_date, version, row_count) VALUES (?, ?, ?)',
+                    (effective_date, tax_data_version(tax_data), len(current))
+                )
+                if following is not None:
+                    # The next snapshot is now stored relative to this one
+                    connection.execute('DELETE FROM changes WHERE effective_date = ?', (next_date,))
+                    self._insert_changes(connection, next_date, snapshot_changes(current, following))
+        finally:
+            connection.close()
+        self.load()
+
+    def _insert_changes(self, connection, effective_date, changes):
+        connection.executemany(
+            'INSERT INTO changes (effective_date, city_key, county_key, location, county, rate) VALUES (?, ?, ?, ?, ?, ?)',
+            [
+                (effective_date, city_key, county_key, *(row if row is not None else (None, None, None)))
+                for (city_key, county_key), row in changes
+            ]
+        )
+
+    # Effective date of the snapshot in force on a date, or None before the first snapshot
+    def snapshot_date(self, as_of):
+        index = bisect_right(self.dates, parse_date(as_of)) - 1
+        return self.dates[index] if index >= 0 else None
+
+    # Full rate table in force on a date, for tiered (normalized, alias, fuzzy, county) matching;
+    # the SNAPSHOT_TABLE_CACHE_SIZE most recently used tables are kept
+    def table_as_of(self, as_of):
+        effective_date = self.snapshot_date(as_of)
+        if effective_date is None:
+            return None
+        table = self._tables.get(effective_date)
+        if table is not None:
+            self._tables.move_to_end(effective_date)
+            return table
+        if len(self._tables) >= SNAPSHOT_TABLE_CACHE_SIZE:
+            self._tables.popitem(last=False)
+        table = RateTable(list(self._rows_as_of(effective_date).values()), self.versions[effective_date])
+        self._tables[effective_date] = table
+        return table
+
+    # Rate in force for a city and county on a date, as a MatchResult (rate, tier, CDTFA location)
+    def match_as_of(self, city, county, as_of):
+        as_of = parse_date(as_of)
+        interval = self.intervals.get((normalize_name(city), normalize_name(county)))
+        if interval is not None:
+            starts, values = interval
+            index = bisect_right(starts, as_of) - 1
+            if index >= 0 and values[index] is not None:
+                return MatchResult(values[index][2], 'exact', normalize_name(city))
+
+        # No exact match on that date: fall back to the tiered matching of that date's table
+        table = self.table_as_of(as_of)
+        return table.match(city, county) if table is not None else NO_MATCH
+
+    # Rate string in force for a city and county on a date, or None
+    def rate_as_of(self, city, county, as_of):
+        return self.match_as_of(city, county, as_of).rate
+
+    # Location dict and rate in force for a ZIP code on a date
+    def zip_rate_as_of(self, zip_code, as_of):
+        location_info = get_location_from_zip(zip_code)
+        if not location_info:
+            return None, None
+        return location_info, self.rate_as_of(location_info['city'], location_info['county'], as_of)
+
+    # Price (zip, payment, invoice date) rows, each at the rates in force on its date
+    def price_chunk(self, chunk):
+        valid_zips = sorted({zip_code for zip_code, _, _ in chunk if validate_zip_code(zip_code)})
+        locations = dict(zip(valid_zips, get_locations_from_zips(valid_zips)))
+        rates = {}
+        rows = []
+
+        for zip_code, payment, invoice_date in chunk:
+            try:
+                effective_date = self.snapshot_date(invoice_date)
+            except ValueError:
+                row = error_row(zip_code, payment, "Invalid invoice date")
+            else:
+                location_info = locations.get(zip_code)
+                if effective_date is None:
+                    row = error_row(zip_code, payment, "No rates on record for the invoice date", location_info)
+                else:
+                    tax_rate, match = None, ''
+                    if location_info and location_info['state'] == 'CALIFORNIA':
+                        key = (location_info['city'], location_info['county'], effective_date)
+                        if key not in rates:
+                            rates[key] = self.match_as_of(location_info['city'], location_info['county'], effective_date)
+                        tax_rate, match, _ = rates[key]
+                        tax_rate = tax_rate or ''
+                    row = price_row(zip_code, payment, location_info, None, tax_rate, match)
+                    row['rates_effective'] = effective_date
+            row['invoice_date'] = invoice_date
+            row.setdefault('rates_effective', '')
+            rows.append(row)
+        return rows
+
+    # Re-price a whole invoice file chunk by chunk; returns (rows, rows with errors)
+    def reprice_file(self, input_path, output_path, chunk_size=DEFAULT_CHUNK_SIZE, zip_column='zip',
+                     payment_column='payment', date_column='date'):
+        writer = open_writer(output_path, REPRICE_FIELDS)
+        total_rows = 0
+        error_rows = 0
+        try:
+            for chunk in read_chunks(input_path, chunk_size, zip_column, payment_column, (date_column,)):
+                rows = self.price_chunk(chunk)
+                writer.write(rows)
+                total_rows += len(rows)
+                error_rows += sum(1 for row in rows if row['error'])
+        finally:
+            writer.close()
+        return total_rows, error_rows
+
+
+# Main function
+def main():
+    parser = argparse.ArgumentParser(description="Store effective-dated rate snapshots and price at past rates.")
+    parser.add_argument('--history', default=DEFAULT_HISTORY_PATH, help="rate history database")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    add = commands.add_parser('add', help="store the rates that took effect on a date")
+    add.add_argument('effective_date', help="YYYY-MM-DD")
+    add.add_argument('--rates-page', help="saved CDTFA page to store instead of the current rates")
+
+    commands.add_parser('list', help="list stored snapshots")
+
+    lookup = commands.add_parser('lookup', help="rate in force on a date")
+    lookup.add_argument('date', help="YYYY-MM-DD")
+    lookup.add_argument('--zip', help="ZIP code")
+    lookup.add_argument('--city', help="city, with --county")
+    lookup.add_argument('--county', help="county, with --city")
+
+    reprice = commands.add_parser('reprice', help="price an invoice file at the rates in force on each row's date")
+    reprice.add_argument('input', help="input .csv or .parquet file with zip, payment and date columns")
+    reprice.add_argument('output', help="output .csv or .parquet file")
+    reprice.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help="rows priced per chunk")
+    reprice.add_argument('--zip-column', default='zip', help="name of the ZIP code column")
+    reprice.add_argument('--payment-column', default='payment', help="name of the payment column")
+    reprice.add_argument('--date-column', default='date', help="name of the invoice date column")
+    args = parser.parse_args()
+
+    history = RateHistory(args.history)
+
+    if args.command == 'add':
+        from rate_cache import load_saved_page, load_tax_data
+
+        tax_data = load_saved_page(args.rates_page) if args.rates_page else load_tax_data()
+        if not tax_data:
+            print("No tax data was extracted. Exiting...")
+            return 1
+        history.add_snapshot(args.effective_date, tax_data)
+        print(f"Stored {len(tax_data)} rates effective {parse_date(args.effective_date)}.")
+        return 0
+
+    if not history.dates:
+        print(f"No rate snapshots in {args.history}. Add one with: python rate_history.py add YYYY-MM-DD")
+        return 1
+
+    if args.command == 'list':
+        for effective_date in history.dates:
+            print(f"{effective_date}  {history.versions[effective_date]}")
+        return 0
+
+    if args.command == 'lookup':
+        if args.zip:
+            location_info, tax_rate = history.zip_rate_as_of(args.zip, args.date)
+            if not location_info:
+                print(f"No information found for ZIP code {args.zip}.")
+                return 1
+            city, county = location_info['city'], location_info['county']
+        elif args.city and args.county:
+            city, county = args.city, args.county
+            tax_rate = history.rate_as_of(city, county, args.date)
+        else:
+            parser.error("lookup needs --zip or both --city and --county")
+        effective_date = history.snapshot_date(args.date)
+        print(f"{city}, {county} on {parse_date(args.date)}: {tax_rate or 'no rate'} (rates effective {effective_date})")
+        return 0 if tax_rate else 1
+
+    total_rows, error_rows = history.reprice_file(
+        args.input, args.output, chunk_size=args.chunk_size, zip_column=args.zip_column,
+        payment_column=args.payment_column, date_column=args.date_column
+    )
+    print(f"Re-priced {total_rows} rows ({error_rows} with errors) into {args.output}.")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
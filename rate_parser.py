@@ -0,0 +1,189 @@
+# Alternative extraction engines for the CDTFA rates page.
+# The default engine in final.parse_tax_rates builds a full BeautifulSoup tree; the
+# engines here either stream the page through html.parser or only build the tables.
+import codecs
+from collections import deque
+from html.parser import HTMLParser
+
+import requests
+from bs4 import BeautifulSoup, SoupStrainer
+
+from final import CDTFA_RATES_URL, extract_tax_rates, parse_tax_rates
+from records import RateColumns
+
+# Elements whose text BeautifulSoup leaves out of get_text()
+SKIPPED_TEXT_TAGS = ('script', 'style', 'template')
+
+
+# Streaming parser that collects (location, county, rate) rows from table cells, with the
+# same rows as final.extract_tax_rates: a row's cells are the ones it holds itself, and
+# rows come out in the order they start even when a nested table's rows end first.
+# Cell text follows get_text(strip=True): every text node is stripped and the
+# non-empty pieces are joined, and text reaches every open (possibly nested) cell.
+class RateRowParser(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.rows = deque()
+        self.table_depth = 0
+        self.skip_depth = 0
+        # Open rows as (table depth, start order, cells), innermost last
+        self.open_rows = []
+        self.open_cells = []
+        self.text = []
+        self.started_rows = 0
+        # Ended rows (None when skipped) waiting for an earlier-started row to end
+        self.ended_rows = {}
+        self.next_row = 0
+
+    # Flush the pending text node into every open cell
+    def _end_text(self):
+        if not self.text:
+            return
+        piece = ''.join(self.text).strip()
+        self.text = []
+        if piece:
+            for cell in self.open_cells:
+                cell.append(piece)
+
+    def _end_row(self):
+        _, order, cells = self.open_rows.pop()
+        if not self.open_rows:
+            self.open_cells = []
+        elif self.open_cells:
+            row_cells = {id(cell) for cell in cells}
+            self.open_cells = [cell for cell in self.open_cells if id(cell) not in row_cells]
+        row = None
+        if len(cells) > 2:
+            location, rate, county = (''.join(cell) for cell in cells[:3])
+            row = (location.upper(), county.upper(), rate)
+
+        if order == self.next_row and not self.ended_rows:
+            self.next_row += 1
+            if row is not None:
+                self.rows.append(row)
+            return
+        self.ended_rows[order] = row
+        while self.next_row in self.ended_rows:
+            row = self.ended_rows.pop(self.next_row)
+            self.next_row += 1
+            if row is not None:
+                self.rows.append(row)
+
+    # Whether the innermost open row belongs to the innermost open table
+    def _in_row(self):
+        return bool(self.open_rows) and self.open_rows[-1][0] == self.table_depth
+
+    def handle_starttag(self, tag, attrs):
+        self._end_text()
+        if tag in SKIPPED_TEXT_TAGS:
+            self.skip_depth += 1
+        elif tag == 'table':
+            self.table_depth += 1
+        elif self.table_depth:
+            if tag == 'tr':
+                if self._in_row():
+                    self._end_row()
+                self.open_rows.append((self.table_depth, self.started_rows, []))
+                self.started_rows += 1
+            elif tag == 'td' and self.open_rows:
+                cell = []
+                self.open_rows[-1][2].append(cell)
+                self.open_cells.append(cell)
+
+    def handle_startendtag(self, tag, attrs):
+        self._end_text()
+
+    def handle_endtag(self, tag):
+        self._end_text()
+        if tag in SKIPPED_TEXT_TAGS:
+            self.skip_depth = max(self.skip_depth - 1, 0)
+        elif tag == 'td':
+            if self.open_cells:
+                self.open_cells.pop()
+        elif tag in ('tr', 'table'):
+            if self._in_row():
+                self._end_row()
+            if tag == 'table' and self.table_depth:
+                self.table_depth -= 1
+
+    def handle_data(self, data):
+        if self.open_cells and not self.skip_depth:
+            self.text.append(data)
+
+    def handle_comment(self, data):
+        self._end_text()
+
+    def handle_decl(self, decl):
+        self._end_text()
+
+    def handle_pi(self, data):
+        self._end_text()
+
+    def close(self):
+        super().close()
+        self._end_text()
+        while self.open_rows:
+            self._end_row()
+
+
+# Function to stream (location, county, rate) rows out of page chunks as they arrive
+def iter_tax_rates(chunks, encoding='utf-8'):
+    if isinstance(chunks, (bytes, str)):
+        chunks = [chunks]
+
+    decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+    parser = RateRowParser()
+    for chunk in chunks:
+        if isinstance(chunk, bytes):
+            chunk = decoder.decode(chunk)
+        parser.feed(chunk)
+        while parser.rows:
+            yield parser.rows.popleft()
+
+    parser.feed(decoder.decode(b'', final=True))
+    parser.close()
+    while parser.rows:
+        yield parser.rows.popleft()
+
+
+# Function to parse the page with the streaming engine
+def parse_tax_rates_streaming(content):
+    return RateColumns(iter_tax_rates(content))
+
+
+# Function to pick the fastest tree builder available for the strainer engine
+def strainer_features():
+    try:
+        import lxml  # noqa: F401
+    except ImportError:
+        return 'html.parser'
+    return 'lxml'
+
+
+# Function to parse the page with BeautifulSoup, building only the <table> elements
+def parse_tax_rates_strainer(content, features=None):
+    return extract_tax_rates(BeautifulSoup(content, features or strainer_features(), parse_only=SoupStrainer('table')))
+
+
+ENGINES = {
+    'bs4': parse_tax_rates,
+    'strainer': parse_tax_rates_strainer,
+    'stream': parse_tax_rates_streaming,
+}
+
+
+# Function to look up an extraction engine by name
+def get_engine(name):
+    try:
+        return ENGINES[name]
+    except KeyError:
+        raise ValueError(f"Unknown parser engine {name!r}; choose one of {', '.join(ENGINES)}")
+
+
+# Function to fetch the CDTFA page and yield rows while the body is still downloading
+def stream_tax_rates(url=CDTFA_RATES_URL, chunk_size=64 * 1024, timeout=30):
+    with requests.get(url, stream=True, timeout=timeout) as response:
+        if response.status_code != 200:
+            print(f"Failed to retrieve the page. Status code: {response.status_code}")
+            return
+        yield from iter_tax_rates(response.iter_content(chunk_size), response.encoding or 'utf-8')
@@ -0,0 +1,138 @@
+# In-place reloading of the CDTFA rate table when new quarterly rates are published.
+# A fresh scrape is diffed against the loaded table, and only the (city, county)
+# entries and per-county indexes it touches are rebuilt. The new table is built on
+# the side and swapped in with one assignment, so lookups in flight keep using the
+# old table and never see a half-updated one.
+import argparse
+import threading
+import time
+
+from rate_table import RateTable, build_rate_table, normalize_name, tax_data_version
+
+
+# Jurisdictions added, removed and changed between two scrapes, keyed by normalized (location, county)
+class RateDiff:
+    def __init__(self, old_version, new_version, added, removed, changed):
+        self.old_version = old_version
+        self.new_version = new_version
+        self.added = added
+        self.removed = removed
+        self.changed = changed
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.changed)
+
+    # Normalized names of every county with an added, removed or changed jurisdiction
+    def counties(self):
+        return {county for _, county in list(self.added) + list(self.removed) + list(self.changed)}
+
+
+# Function to diff a loaded rate table against freshly scraped (location, county, rate) rows
+def diff_tax_data(rate_table, tax_data):
+    current = {}
+    for location, county, rate in tax_data:
+        # The first row for a (city, county) wins, as it does in the rate table
+        current.setdefault((normalize_name(location), normalize_name(county)), rate)
+
+    previous = rate_table.by_city_county
+    added = {key: rate for key, rate in current.items() if key not in previous}
+    removed = {key: rate for key, rate in previous.items() if key not in current}
+    changed = {
+        key: (previous[key], rate) for key, rate in current.items()
+        if key in previous and previous[key] != rate
+    }
+    return RateDiff(rate_table.version, tax_data_version(tax_data), added, removed, changed)
+
+
+# Function to describe a diff as a change report
+def change_report(diff, elapsed, invalidated=0):
+    return {
+        'old_version': diff.old_version,
+        'new_version': diff.new_version,
+        'reloaded_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'added': [{'location': location, 'county': county, 'rate': rate}
+                  for (location, county), rate in sorted(diff.added.items())],
+        'removed': [{'location': location, 'county': county, 'rate': rate}
+                    for (location, county), rate in sorted(diff.removed.items())],
+        'changed': [{'location': location, 'county': county, 'old_rate': old_rate, 'new_rate': new_rate}
+                    for (location, county), (old_rate, new_rate) in sorted(diff.changed.items())],
+        'counties': sorted(diff.counties()),
+        'invalidated': invalidated,
+        'elapsed_ms': elapsed * 1000,
+    }
+
+
+# Function to format a change report for the console
+def format_change_report(report):
+    lines = [
+        f"Tax rates {report['old_version']} -> {report['new_version']}: "
+        f"{len(report['added'])} added, {len(report['removed'])} removed, {len(report['changed'])} changed "
+        f"in {len(report['counties'])} counties ({report['invalidated']} cached lookups dropped, "
+        f"{report['elapsed_ms']:.1f} ms)"
+    ]
+    for entry in report['added']:
+        lines.append(f"  + {entry['location']}, {entry['county']}: {entry['rate']}")
+    for entry in report['removed']:
+        lines.append(f"  - {entry['location']}, {entry['county']}: {entry['rate']}")
+    for entry in report['changed']:
+        lines.append(f"  ~ {entry['location']}, {entry['county']}: {entry['old_rate']} -> {entry['new_rate']}")
+    return '\n'.join(lines)
+
+
+# Holds the live rate table and swaps in updated ones. Reloads are serialized, while
+# readers just take self.rate_table and keep that table for the whole lookup.
+class RateReloader:
+    def __init__(self, tax_data=()):
+        self.rate_table = build_rate_table(tax_data)
+        self.last_report = None
+        self._lock = threading.Lock()
+
+    # Diff new rows against the live table, swap in the updated table and return the change report.
+    # on_swap(rate_table, diff) runs right after the swap and returns how many cached lookups it dropped.
+    def reload(self, tax_data, on_swap=None):
+        with self._lock:
+            return self._reload(tax_data, on_swap)
+
+    # Load rows only when no rates were loaded yet, checked under the reload lock so a startup
+    # snapshot never replaces newer rates a background refresh is swapping in; returns the
+    # change report, or None when rates were already loaded
+    def reload_if_unset(self, tax_data, on_swap=None):
+        with self._lock:
+            if self.last_report is not None:
+                return None
+            return self._reload(tax_data, on_swap)
+
+    def _reload(self, tax_data, on_swap):
+        start = time.perf_counter()
+        if isinstance(tax_data, RateTable):
+            tax_data = tax_data.rows
+        diff = diff_tax_data(self.rate_table, tax_data)
+        invalidated = 0
+        if diff:
+            rate_table = self.rate_table.updated(tax_data, diff)
+            self.rate_table = rate_table
+            if on_swap is not None:
+                invalidated = on_swap(rate_table, diff)
+        elif diff.new_version != self.rate_table.version:
+            # Same rates in a different row order: rebuild only the reordered counties
+            self.rate_table = self.rate_table.updated(tax_data, diff)
+        self.last_report = change_report(diff, time.perf_counter() - start, invalidated)
+        return self.last_report
+
+
+# Main function
+def main():
+    parser = argparse.ArgumentParser(description="Show what changed between two saved CDTFA rate pages.")
+    parser.add_argument('old_page', help="saved CDTFA page with the currently loaded rates")
+    parser.add_argument('new_page', help="saved CDTFA page with the new rates")
+    args = parser.parse_args()
+
+    from rate_cache import load_saved_page
+
+    reloader = RateReloader(load_saved_page(args.old_page))
+    print(format_change_report(reloader.reload(load_saved_page(args.new_page))))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
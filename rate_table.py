@@ -0,0 +1,143 @@
+# Hash-indexed view of the scraped CDTFA tax rates.
+# Built once from the (location, county, rate) tuples returned by scrape_tax_rates
+# so every lookup is a dict access instead of a scan over the whole table.
+import hashlib
+from decimal import Decimal
+
+from records import rate_columns
+
+# Rates stored as integers count units of 1e-7 (8.250% -> 825000)
+RATE_SCALE_DIGITS = 7
+RATE_SCALE = 10 ** RATE_SCALE_DIGITS
+
+
+# Function to normalize a city or county name for use as an index key
+def normalize_name(name):
+    if not name:
+        return ''
+    return ' '.join(name.upper().split())
+
+
+# Function to convert a rate fraction (Decimal('0.0825')) to integer rate units
+def rate_to_units(rate):
+    units = rate.scaleb(RATE_SCALE_DIGITS)
+    if units != units.to_integral_value():
+        raise ValueError(f"Rate {rate} has more precision than the rate unit scale allows")
+    return int(units)
+
+
+# Function to convert integer rate units back to a Decimal rate fraction
+def units_to_rate(units):
+    return Decimal(units).scaleb(-RATE_SCALE_DIGITS)
+
+
+# Function to compute a content version for a list of (location, county, rate) rows
+def tax_data_version(tax_data):
+    digest = hashlib.sha1()
+    for location, county, rate in tax_data:
+        digest.update(f'{location}\t{county}\t{rate}\n'.encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+# Function to tell whether a scraped location row covers a county's unincorporated area
+def is_unincorporated(location):
+    return 'UNINCORPORATED' in location
+
+
+# Function to group (location, county, rate) rows by normalized county, keeping row order
+def rows_by_county(rows):
+    grouped = {}
+    for row in rows:
+        grouped.setdefault(normalize_name(row[1]), []).append(tuple(row))
+    return grouped
+
+
+# Rate table with O(1) lookups keyed by normalized (city, county)
+class RateTable:
+    def __init__(self, tax_data, version=None):
+        self.rows = rate_columns(tax_data)
+        self.version = version or tax_data_version(self.rows)
+        self.by_city_county = {}
+
+        for location, county, rate in self.rows:
+            # The first matching row wins, the same as the old linear scan
+            self.by_city_county.setdefault((normalize_name(location), normalize_name(county)), rate)
+
+        self._index_counties(self.by_city_county)
+        self._build_matcher()
+
+    # Build the county-only and unincorporated-area indexes from the (city, county) index
+    def _index_counties(self, by_city_county, counties=None):
+        if counties is None:
+            self.by_county = {}
+            self.unincorporated = {}
+        for (city_key, county_key), rate in by_city_county.items():
+            if counties is not None and county_key not in counties:
+                continue
+            if is_unincorporated(city_key):
+                self.unincorporated.setdefault(county_key, rate)
+            elif city_key in (county_key, county_key + ' COUNTY'):
+                self.by_county.setdefault(county_key, rate)
+
+    # Normalized, alias and fuzzy indexes for names that do not match exactly
+    def _build_matcher(self):
+        from name_matching import MatchIndex
+        self.matcher = MatchIndex(self)
+
+    # New table for a fresh scrape, reusing this table's index and rebuilding only the
+    # counties whose rows changed, in the new row order so first-row-wins picks the same
+    # rows a fresh build would; this table is left untouched for readers
+    def updated(self, tax_data, diff):
+        table = RateTable.__new__(RateTable)
+        table.rows = rate_columns(tax_data)
+        table.version = diff.new_version
+
+        old_counties = rows_by_county(self.rows)
+        new_counties = rows_by_county(table.rows)
+        counties = set(diff.counties())
+        counties.update(county for county, rows in new_counties.items() if old_counties.get(county) != rows)
+        counties.update(county for county in old_counties if county not in new_counties)
+
+        table.by_city_county = {key: rate for key, rate in self.by_city_county.items() if key[1] not in counties}
+        for county in counties:
+            for location, _, rate in new_counties.get(county, ()):
+                table.by_city_county.setdefault((normalize_name(location), county), rate)
+
+        table.by_county = {county: rate for county, rate in self.by_county.items() if county not in counties}
+        table.unincorporated = {county: rate for county, rate in self.unincorporated.items() if county not in counties}
+        table._index_counties(table.by_city_county, counties)
+        table.matcher = self.matcher.updated(table, counties)
+        return table
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    # Exact (city, county) match, same result as get_tax_rate's scan
+    def lookup(self, city, county):
+        return self.by_city_county.get((normalize_name(city), normalize_name(county)))
+
+    # Rate for a county as a whole, when the CDTFA table lists one
+    def lookup_county(self, county):
+        return self.by_county.get(normalize_name(county))
+
+    # Rate for the unincorporated area of a county
+    def lookup_unincorporated(self, county):
+        return self.unincorporated.get(normalize_name(county))
+
+    # Tiered match (exact, normalized, alias, fuzzy, unincorporated, county) with the tier used
+    def match(self, city, county):
+        return self.matcher.match(city, county)
+
+    # Rate from the tiered match, or None
+    def resolve(self, city, county):
+        return self.match(city, county).rate
+
+
+# Function to build the rate table from scraped tax data
+def build_rate_table(tax_data):
+    if isinstance(tax_data, RateTable):
+        return tax_data
+    return RateTable(tax_data)
@@ -0,0 +1,105 @@
+# Compact record types for scraped rates and resolved locations.
+# A list of (location, county, rate) tuples costs a tuple and three strings per row,
+# and a dict per ZIP lookup costs a hash table each. RateColumns stores each distinct
+# string once and the rows as three arrays of integer string IDs; Location is a
+# __slots__ record that still reads like the old dict (location_info['city']).
+import sys
+from array import array
+from collections.abc import Mapping
+
+
+# Function to intern a name so equal names share one string object; None stays None
+def intern_name(value):
+    return None if value is None else sys.intern(value)
+
+
+# City/county/state of a ZIP code. Reads like the dict it replaces: location_info['city'],
+# .get(), dict(location_info) and == against a dict all work.
+class Location(Mapping):
+    __slots__ = ('city', 'county', 'state')
+
+    FIELDS = ('city', 'county', 'state')
+
+    def __init__(self, city, county, state):
+        self.city = intern_name(city)
+        self.county = intern_name(county)
+        self.state = intern_name(state)
+
+    def __getitem__(self, key):
+        if key not in Location.FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __iter__(self):
+        return iter(Location.FIELDS)
+
+    def __len__(self):
+        return len(Location.FIELDS)
+
+    def __reduce__(self):
+        return Location, (self.city, self.county, self.state)
+
+    def __repr__(self):
+        return f"Location(city={self.city!r}, county={self.county!r}, state={self.state!r})"
+
+
+# Column-oriented (location, county, rate) rows with every distinct string stored once.
+# Iterating and indexing yield plain (location, county, rate) tuples, so it drops in
+# wherever the scraped list of tuples was used.
+class RateColumns:
+    __slots__ = ('strings', 'string_ids', 'locations', 'counties', 'rates')
+
+    def __init__(self, rows=()):
+        self.strings = []
+        self.string_ids = {}
+        self.locations = array('I')
+        self.counties = array('I')
+        self.rates = array('I')
+        for location, county, rate in rows:
+            self.append(location, county, rate)
+
+    # Integer ID of a string, adding it to the string pool on first use
+    def string_id(self, value):
+        string_id = self.string_ids.get(value)
+        if string_id is None:
+            string_id = len(self.strings)
+            self.strings.append(sys.intern(value))
+            self.string_ids[value] = string_id
+        return string_id
+
+    def append(self, location, county, rate):
+        self.locations.append(self.string_id(location))
+        self.counties.append(self.string_id(county))
+        self.rates.append(self.string_id(rate))
+
+    def __len__(self):
+        return len(self.rates)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return RateColumns(self.row(position) for position in range(*index.indices(len(self))))
+        return self.row(index)
+
+    def row(self, index):
+        strings = self.strings
+        return strings[self.locations[index]], strings[self.counties[index]], strings[self.rates[index]]
+
+    def __iter__(self):
+        strings = self.strings
+        for location_id, county_id, rate_id in zip(self.locations, self.counties, self.rates):
+            yield strings[location_id], strings[county_id], strings[rate_id]
+
+    def __eq__(self, other):
+        if isinstance(other, (RateColumns, list, tuple)):
+            return len(self) == len(other) and all(row == tuple(other_row) for row, other_row in zip(self, other))
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"RateColumns({len(self)} rows, {len(self.strings)} distinct strings)"
+
+
+# Function to get rate rows in columnar form, reusing them when they already are
+def rate_columns(tax_data):
+    return tax_data if isinstance(tax_data, RateColumns) else RateColumns(tax_data)
@@ -0,0 +1,159 @@
+# Vectorized, exact-decimal remittance engine for bulk pricing.
+# Payments are held as int64 cents and rates as int64 rate units (1e-7, see
+# rate_table.RATE_SCALE), so whole arrays are priced at once with integer math.
+# Every amount is rounded half-even to the cent, which is exactly what printing the
+# Decimal results of calculate_taxes/calculate_remittance with :.2f does.
+import argparse
+import random
+from decimal import Decimal
+
+import numpy as np
+
+from rate_table import RATE_SCALE, rate_to_units
+
+INT64_MAX = np.iinfo(np.int64).max
+
+# State share used by parse_tax_components, in rate units
+STATE_RATE_UNITS = rate_to_units(Decimal('0.0725'))
+
+# payment (1e-2) * rate (1e-7) is in 1e-9 units; another rate factor makes it 1e-16
+TOTAL_TAX_DIVISOR = RATE_SCALE
+SPLIT = RATE_SCALE
+REMITTANCE_DIVISOR = RATE_SCALE * RATE_SCALE
+
+
+# Function to convert payments (Decimal, str, int) into an int64 array of cents
+def encode_payments(payments):
+    cents = []
+    for payment in payments:
+        value = Decimal(str(payment)).scaleb(2)
+        if value != value.to_integral_value() or value < 0:
+            raise ValueError(f"Payment {payment} is not a non-negative whole number of cents")
+        cents.append(int(value))
+    return np.array(cents, dtype=np.int64)
+
+
+# Function to convert CDTFA rate strings ('8.250%') into an int64 array of rate units
+def encode_rates(tax_rates):
+    cache = {}
+    units = []
+    for tax_rate in tax_rates:
+        value = cache.get(tax_rate)
+        if value is None:
+            value = rate_to_units(Decimal(tax_rate.strip('%')) / 100)
+            cache[tax_rate] = value
+        units.append(value)
+    return np.array(units, dtype=np.int64)
+
+
+# Function to split total rates into state/city/county units like parse_tax_components.
+# The county share is half the city share, so it is returned doubled to stay integral.
+def split_rate_components(total_units):
+    state = np.full_like(total_units, STATE_RATE_UNITS)
+    city = np.where(total_units > STATE_RATE_UNITS, total_units - STATE_RATE_UNITS, 0)
+    return state, city, city
+
+
+# Function to round non-negative quotient/remainder pairs half-even
+def round_half_even(quotient, remainder, divisor):
+    twice = remainder * 2
+    round_up = (twice > divisor) | ((twice == divisor) & (quotient % 2 == 1))
+    return quotient + round_up
+
+
+# Function to compute round(amount * rate / divisor) exactly without int64 overflow.
+# amount is split into high and low parts so no intermediate exceeds int64.
+def scaled_product(amount, rate, divisor):
+    high, low = np.divmod(amount, SPLIT)
+    low_quotient, low_remainder = np.divmod(low * rate, SPLIT)
+    quotient, remainder = np.divmod(high * rate + low_quotient, divisor // SPLIT)
+    return round_half_even(quotient, remainder * SPLIT + low_remainder, divisor)
+
+
+# Function to check that a batch stays inside the range the integer math is exact for
+def check_range(payment_cents, total_units):
+    if payment_cents.size == 0:
+        return
+    if payment_cents.min() < 0 or total_units.min() < 0:
+        raise ValueError("Payments and rates must be non-negative")
+    largest_rate = max(int(total_units.max()), STATE_RATE_UNITS, 1)
+    limit = min(INT64_MAX // largest_rate, INT64_MAX // largest_rate // largest_rate * SPLIT // 2)
+    if int(payment_cents.max()) > limit:
+        raise OverflowError("Payment too large for exact int64 remittance math")
+
+
+# Function to price whole arrays at once; every returned amount is an int64 array of cents
+def compute_remittances(payment_cents, total_units):
+    payment_cents = np.asarray(payment_cents, dtype=np.int64)
+    total_units = np.asarray(total_units, dtype=np.int64)
+    check_range(payment_cents, total_units)
+
+    state_units, city_units, county_units_doubled = split_rate_components(total_units)
+    exact_tax = payment_cents * total_units
+    quotient, remainder = np.divmod(exact_tax, TOTAL_TAX_DIVISOR)
+
+    return {
+        'total_tax': round_half_even(quotient, remainder, TOTAL_TAX_DIVISOR),
+        'state_remittance': scaled_product(exact_tax, state_units, REMITTANCE_DIVISOR),
+        'city_remittance': scaled_product(exact_tax, city_units, REMITTANCE_DIVISOR),
+        'county_remittance': scaled_product(exact_tax, county_units_doubled, 2 * REMITTANCE_DIVISOR),
+    }
+
+
+# Function to format an array of cents the way format_output prints amounts ('70.12')
+def format_cents(cents):
+    return [f"{value // 100}.{value % 100:02d}" for value in np.asarray(cents).tolist()]
+
+
+# Function to price one row through the existing Decimal functions, formatted to cents
+def decimal_remittances(payment, tax_rate):
+    from final import calculate_remittance, calculate_taxes, parse_tax_components
+
+    total_tax = calculate_taxes(Decimal(payment), tax_rate)
+    state_rate, city_rate, county_rate = parse_tax_components(tax_rate)
+    state_remittance, city_remittance, county_remittance = calculate_remittance(total_tax, state_rate, city_rate, county_rate)
+    return tuple(f"{amount:.2f}" for amount in (total_tax, state_remittance, city_remittance, county_remittance))
+
+
+# Function to fuzz the engine against the Decimal path; returns the mismatching rows
+def check_equivalence(samples=100000, seed=0):
+    generator = random.Random(seed)
+    payments = []
+    tax_rates = []
+    for _ in range(samples):
+        digits = generator.choice((3, 5, 7, 9, 11))
+        payments.append(f"{generator.randrange(10 ** digits) / 100:.2f}")
+        tax_rates.append(f"{generator.randrange(0, 15000) / 1000:.3f}%")
+
+    # Amounts ending in exact half-cents exercise the tie-breaking rule
+    payments[:4] = ['0.20', '1.00', '6.00', '0.60']
+    tax_rates[:4] = ['7.500%', '7.250%', '10.250%', '8.375%']
+
+    results = compute_remittances(encode_payments(payments), encode_rates(tax_rates))
+    formatted = list(zip(*(format_cents(results[name]) for name in
+                           ('total_tax', 'state_remittance', 'city_remittance', 'county_remittance'))))
+
+    return [
+        (payment, tax_rate, expected, actual)
+        for payment, tax_rate, actual in zip(payments, tax_rates, formatted)
+        for expected in [decimal_remittances(payment, tax_rate)]
+        if expected != actual
+    ]
+
+
+# Main function
+def main():
+    parser = argparse.ArgumentParser(description="Check the vectorized remittance engine against the Decimal path.")
+    parser.add_argument('--samples', type=int, default=100000, help="random (payment, rate) pairs to compare")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    mismatches = check_equivalence(args.samples, args.seed)
+    for payment, tax_rate, expected, actual in mismatches[:20]:
+        print(f"Mismatch for payment {payment} at {tax_rate}: Decimal {expected}, engine {actual}")
+    print(f"Compared {args.samples} rows: {len(mismatches)} mismatches.")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,140 @@
+# Startup-time reporting for the command-line apps.
+# StartupTimer records named phases (set ZIP_CODES_STARTUP_REPORT=1 to print them
+# from final.py), and running this module measures a cold start in a fresh
+# interpreter with per-import timings from `python -X importtime`.
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Startup path of final.main up to the first prompt, run in a fresh interpreter
+STARTUP_SCRIPT = r'''
+import json, sys, time
+from startup_timing import StartupTimer
+timer = StartupTimer()
+with timer.phase('import_final'):
+    import final
+with timer.phase('load_tax_data'):
+    if sys.argv[1]:
+        from rate_cache import load_saved_page
+        tax_data = load_saved_page(sys.argv[1])
+    else:
+        from rate_cache import load_tax_data
+        tax_data = load_tax_data()
+with timer.phase('build_rate_table'):
+    rate_table = final.build_rate_table(tax_data)
+if sys.argv[2]:
+    with timer.phase('first_zip_lookup'):
+        final.get_location_from_zip(sys.argv[2])
+print(json.dumps(timer.as_dict()))
+'''
+
+
+# Records how long each named startup phase takes
+class StartupTimer:
+    def __init__(self, enabled=True, stream=None):
+        self.enabled = enabled
+        self.stream = stream
+        self.started = time.perf_counter()
+        self.phases = {}
+
+    @classmethod
+    def from_environment(cls):
+        return cls(enabled=bool(os.environ.get('ZIP_CODES_STARTUP_REPORT')))
+
+    @contextmanager
+    def phase(self, name):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+    def as_dict(self):
+        return {
+            'phases_ms': {name: seconds * 1000 for name, seconds in self.phases.items()},
+            'total_ms': (time.perf_counter() - self.started) * 1000,
+        }
+
+    # Print the recorded phases to stderr
+    def report(self):
+        if not self.enabled:
+            return
+        stream = self.stream or sys.stderr
+        timings = self.as_dict()
+        for name, milliseconds in timings['phases_ms'].items():
+            print(f"startup {name}: {milliseconds:.1f} ms", file=stream)
+        print(f"startup total: {timings['total_ms']:.1f} ms", file=stream)
+
+
+# Function to parse `python -X importtime` output into (module, self_us, cumulative_us) rows
+def parse_importtime(stderr):
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        imports.append((name.strip(), int(self_us), int(cumulative_us)))
+    return imports
+
+
+# Function to measure one cold start of the CLI in a fresh interpreter
+def measure_startup(rates_page=None, zip_code=None):
+    command = [sys.executable, '-X', 'importtime', '-c', STARTUP_SCRIPT, rates_page or '', zip_code or '']
+    start = time.perf_counter()
+    completed = subprocess.run(command, cwd=ROOT, capture_output=True, text=True)
+    wall_ms = (time.perf_counter() - start) * 1000
+    if completed.returncode != 0:
+        raise RuntimeError(f"Startup run failed:\n{completed.stderr[-2000:]}")
+
+    timings = json.loads(completed.stdout.strip().splitlines()[-1])
+    timings['process_wall_ms'] = wall_ms
+    timings['imports'] = [
+        {'module': name, 'self_ms': self_us / 1000, 'cumulative_ms': cumulative_us / 1000}
+        for name, self_us, cumulative_us in parse_importtime(completed.stderr)
+    ]
+    return timings
+
+
+# Function to print a startup report with the slowest imports
+def print_report(timings, top):
+    print(f"Process wall time: {timings['process_wall_ms']:.1f} ms")
+    for name, milliseconds in timings['phases_ms'].items():
+        print(f"  {name:<20} {milliseconds:>8.1f} ms")
+    print(f"Slowest imports (cumulative):")
+    for record in sorted(timings['imports'], key=lambda record: record['cumulative_ms'], reverse=True)[:top]:
+        print(f"  {record['module']:<40} {record['cumulative_ms']:>8.1f} ms")
+
+
+# Main function
+def main():
+    parser = argparse.ArgumentParser(description="Report cold-start time of the tax CLI per phase and per import.")
+    parser.add_argument('--rates-page', help="load rates from a saved CDTFA page instead of the rate cache")
+    parser.add_argument('--zip', help="also time the first lookup of this ZIP code")
+    parser.add_argument('--top', type=int, default=15, help="number of slowest imports to list")
+    parser.add_argument('--budget-ms', type=float, help="exit with status 1 when the process wall time exceeds this")
+    parser.add_argument('--json', action='store_true', help="print the full report as JSON")
+    args = parser.parse_args()
+
+    timings = measure_startup(args.rates_page, args.zip)
+    if args.json:
+        print(json.dumps(timings, indent=2))
+    else:
+        print_report(timings, args.top)
+
+    if args.budget_ms is not None and timings['process_wall_ms'] > args.budget_ms:
+        print(f"Startup took {timings['process_wall_ms']:.1f} ms, over the {args.budget_ms:.0f} ms budget.")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
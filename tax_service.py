@@ -0,0 +1,266 @@
+# Long-running HTTP/JSON pricing service.
+# Loads the rate table and ZIP resolver once at startup and answers pricing requests
+# over a small asyncio HTTP/1.1 server with keep-alive, using only the standard library.
+#
+#   GET  /health                       -> {"status": "ok", "rates": <row count>}
+#   GET  /stats                        -> lookup cache hit/miss/eviction counters
+#   GET  /metrics                      -> per-stage latency histograms and counters (Prometheus text;
+#                                         ?format=json for JSON), recorded when started with --metrics
+#   GET  /tax?zip=92019&payment=850    -> one priced result
+#   POST /tax        {"zip": ..., "payment": ...}
+#   POST /tax/batch  {"items": [{"zip": ..., "payment": ...}, ...]}
+import argparse
+import asyncio
+import json
+import traceback
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlsplit
+
+from batch_pricing import price_row
+from final import validate_zip_code
+from instrumentation import METRICS
+from lookup_cache import DEFAULT_LOCATION_CACHE_SIZE, LookupCache
+from rate_cache import load_saved_page, load_tax_data
+from rate_reload import format_change_report
+from zip_resolver import get_resolver
+
+MAX_BODY_SIZE = 16 * 1024 * 1024
+MAX_BATCH_SIZE = 100000
+
+
+# Error raised by a handler to answer with an HTTP error status
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+# Function to pull (zip, payment) out of a JSON object or query-string values
+def request_item(values):
+    if not isinstance(values, dict):
+        raise HttpError(HTTPStatus.BAD_REQUEST, "Each item must be an object with 'zip' and 'payment'")
+    zip_code = values.get('zip')
+    payment = values.get('payment')
+    if zip_code is None or payment is None:
+        raise HttpError(HTTPStatus.BAD_REQUEST, "Both 'zip' and 'payment' are required")
+    return str(zip_code).strip(), str(payment).strip()
+
+
+# Function to turn a priced row into the JSON result returned to clients
+def result_payload(row):
+    payload = {key: value for key, value in row.items() if value != ''}
+    payload.setdefault('error', None)
+    return payload
+
+
+# Pricing service holding the loaded rate table behind memoized lookups
+class TaxService:
+    def __init__(self, tax_data, cache_size=DEFAULT_LOCATION_CACHE_SIZE):
+        self.lookups = LookupCache(tax_data, location_size=cache_size, rate_size=cache_size)
+        METRICS.add_collector('lookup_cache', self.lookups.stats)
+
+    @property
+    def tax_data(self):
+        return self.lookups.rate_table
+
+    # Swap in newly scraped rates in place; only cached rates in changed counties are dropped
+    def reload_rates(self, tax_data, quiet=False):
+        report = self.lookups.load_rate_table(tax_data)
+        if not quiet:
+            print(format_change_report(report))
+        return report
+
+    # Load the postal dataset now so the first request does not pay for it
+    def warm_up(self):
+        get_resolver().warm_up()
+
+    def price_one(self, zip_code, payment):
+        location_info = self.lookups.location(zip_code) if validate_zip_code(zip_code) else None
+        return self.price_located(zip_code, payment, location_info)
+
+    # Price a batch through the same memoized lookups, resolving its uncached ZIPs with one query
+    def price_many(self, items):
+        valid_zips = sorted({zip_code for zip_code, _ in items if validate_zip_code(zip_code)})
+        locations = dict(zip(valid_zips, self.lookups.locations_many(valid_zips)))
+        return [self.price_located(zip_code, payment, locations.get(zip_code)) for zip_code, payment in items]
+
+    def price_located(self, zip_code, payment, location_info):
+        tax_rate, match = None, ''
+        if location_info and location_info['state'] == 'CALIFORNIA':
+            tax_rate, match, _ = self.lookups.match(location_info['city'], location_info['county'])
+            tax_rate = tax_rate or ''
+        return result_payload(price_row(zip_code, payment, location_info, self.tax_data, tax_rate, match))
+
+    # Route one request and return (status, JSON-serializable body)
+    async def dispatch(self, method, target, body):
+        url = urlsplit(target)
+        loop = asyncio.get_running_loop()
+
+        if url.path == '/health':
+            if method != 'GET':
+                raise HttpError(HTTPStatus.METHOD_NOT_ALLOWED, "Use GET")
+            return HTTPStatus.OK, {'status': 'ok', 'rates': len(self.tax_data)}
+
+        if url.path == '/stats':
+            if method != 'GET':
+                raise HttpError(HTTPStatus.METHOD_NOT_ALLOWED, "Use GET")
+            return HTTPStatus.OK, self.lookups.stats()
+
+        if url.path == '/metrics':
+            if method != 'GET':
+                raise HttpError(HTTPStatus.METHOD_NOT_ALLOWED, "Use GET")
+            if parse_qs(url.query).get('format') == ['json']:
+                return HTTPStatus.OK, METRICS.as_dict()
+            return HTTPStatus.OK, METRICS.to_prometheus()
+
+        if url.path == '/tax':
+            if method == 'GET':
+                query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+                zip_code, payment = request_item(query)
+            elif method == 'POST':
+                zip_code, payment = request_item(self.decode_json(body))
+            else:
+                raise HttpError(HTTPStatus.METHOD_NOT_ALLOWED, "Use GET or POST")
+            result = await loop.run_in_executor(None, self.price_one, zip_code, payment)
+            status = HTTPStatus.OK if result['error'] is None else HTTPStatus.UNPROCESSABLE_ENTITY
+            return status, result
+
+        if url.path == '/tax/batch':
+            if method != 'POST':
+                raise HttpError(HTTPStatus.METHOD_NOT_ALLOWED, "Use POST")
+            document = self.decode_json(body)
+            items = document.get('items') if isinstance(document, dict) else document
+            if not isinstance(items, list):
+                raise HttpError(HTTPStatus.BAD_REQUEST, "Expected a list of items")
+            if len(items) > MAX_BATCH_SIZE:
+                raise HttpError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f"At most {MAX_BATCH_SIZE} items per batch")
+            items = [request_item(item) for item in items]
+            results = await loop.run_in_executor(None, self.price_many, items)
+            return HTTPStatus.OK, {'results': results}
+
+        raise HttpError(HTTPStatus.NOT_FOUND, f"No route for {url.path}")
+
+    def decode_json(self, body):
+        try:
+            return json.loads(body or b'null')
+        except ValueError:
+            raise HttpError(HTTPStatus.BAD_REQUEST, "Request body is not valid JSON")
+
+    # Serve requests on one connection until the client closes it
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+
+                keep_alive = True
+                request = None
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                    headers = {}
+                    while True:
+                        line = await reader.readline()
+                        if line in (b'\r\n', b'\n', b''):
+                            break
+                        name, _, value = line.decode('latin-1').partition(':')
+                        headers[name.strip().lower()] = value.strip()
+
+                    connection = headers.get('connection', '').lower()
+                    keep_alive = connection == 'keep-alive' if version == 'HTTP/1.0' else connection != 'close'
+
+                    length = int(headers.get('content-length', 0))
+                    if length < 0:
+                        raise ValueError("Negative Content-Length")
+                    if length > MAX_BODY_SIZE:
+                        keep_alive = False
+                        raise HttpError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "Request body is too large")
+                    body = await reader.readexactly(length) if length else b''
+                    request = (method, target, body)
+                except HttpError as e:
+                    status, payload = e.status, {'error': e.message}
+                except ValueError:
+                    keep_alive = False
+                    status, payload = HTTPStatus.BAD_REQUEST, {'error': "Malformed HTTP request"}
+
+                if request is not None:
+                    try:
+                        status, payload = await self.dispatch(*request)
+                    except HttpError as e:
+                        status, payload = e.status, {'error': e.message}
+                    except Exception:
+                        # A bug in a handler answers this request with a 500 and keeps serving
+                        traceback.print_exc()
+                        status, payload = HTTPStatus.INTERNAL_SERVER_ERROR, {'error': "Internal server error"}
+
+                self.write_response(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    # Write a JSON response, or a plain-text one when the payload is a string
+    def write_response(self, writer, status, payload, keep_alive):
+        if isinstance(payload, str):
+            body, content_type = payload.encode('utf-8'), 'text/plain; version=0.0.4'
+        else:
+            body, content_type = json.dumps(payload).encode('utf-8'), 'application/json'
+        head = (
+            f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode('latin-1') + body)
+
+    async def start(self, host='127.0.0.1', port=8080):
+        return await asyncio.start_server(self.handle_connection, host, port)
+
+
+# Function to run the service until interrupted
+async def serve(service, host, port):
+    server = await service.start(host, port)
+    address = server.sockets[0].getsockname()
+    print(f"Serving tax pricing on http://{address[0]}:{address[1]}")
+    async with server:
+        await server.serve_forever()
+
+
+# Main function
+def main():
+    parser = argparse.ArgumentParser(description="Serve tax pricing over HTTP/JSON.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--rates-page', help="read rates from a saved CDTFA page instead of the rate cache")
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_LOCATION_CACHE_SIZE, help="entries per lookup cache")
+    parser.add_argument('--metrics', action='store_true', help="record per-stage timings for GET /metrics")
+    args = parser.parse_args()
+
+    if args.metrics:
+        METRICS.enable()
+
+    # A background refresh of a stale rate snapshot is swapped into the running service
+    service = TaxService([], cache_size=args.cache_size)
+
+    print("Loading tax rates...")
+    tax_data = load_saved_page(args.rates_page) if args.rates_page else load_tax_data(on_update=service.reload_rates)
+    if not tax_data:
+        print("No tax data was extracted. Exiting...")
+        return 1
+
+    # Skip the startup snapshot when a background refresh has already swapped in newer rates
+    service.lookups.load_initial_rate_table(tax_data)
+    service.warm_up()
+    try:
+        asyncio.run(serve(service, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
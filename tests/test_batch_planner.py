@@ -0,0 +1,43 @@
+import batch_planner
+from batch_planner import BatchPlanner
+from mock_cdtfa_server import DEFAULT_PAGE
+from pipeline import items_from_rows, price_stream
+from rate_cache import load_saved_page
+
+ROWS = [
+    ('92019', '100.00'), ('92020', '42.20'), ('92019', '7.5'), ('10001', '10.00'), ('96162', '10.00'),
+    ('9201', '10.00'), ('ABCDE', '10.00'), ('92019', 'abc'), ('99999', '10.00'), ('92020', '0.01'),
+]
+
+
+def test_planned_rows_match_the_per_row_pipeline():
+    tax_data = load_saved_page(DEFAULT_PAGE)
+    planner = BatchPlanner(tax_data)
+    planned = list(price_stream(items_from_rows(ROWS * 3), tax_data, buffer_size=4, planner=planner))
+    assert planned == list(price_stream(items_from_rows(ROWS * 3), tax_data, buffer_size=4))
+
+
+def test_only_well_formed_zips_are_remembered():
+    planner = BatchPlanner(load_saved_page(DEFAULT_PAGE))
+    for number in range(50):
+        planner.price_chunk([(f'bad-{number}', '10.00'), ('92019', '10.00'), ('١٢٣٤٥', '10.00')])
+    assert set(planner.plans) == {'92019'}
+    assert planner.stats.rows == 150
+    assert planner.stats.unique_zips == 101
+
+
+def test_rate_work_runs_once_per_distinct_zip(monkeypatch):
+    calls = []
+    match_tax_rate = batch_planner.match_tax_rate
+
+    def counting_match_tax_rate(city, county, tax_data):
+        calls.append((city, county))
+        return match_tax_rate(city, county, tax_data)
+
+    monkeypatch.setattr(batch_planner, 'match_tax_rate', counting_match_tax_rate)
+    planner = BatchPlanner(load_saved_page(DEFAULT_PAGE))
+    planner.price_chunk(ROWS)
+    planner.price_chunk(ROWS)
+    assert calls == [('EL CAJON', 'SAN DIEGO')] * 2
+    stats = planner.stats
+    assert stats.saved_seconds == (stats.rows - stats.unique_zips) * stats.rate_seconds / stats.unique_zips
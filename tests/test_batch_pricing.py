@@ -0,0 +1,132 @@
+import csv
+import json
+
+import pytest
+
+from batch_pricing import (
+    OUTPUT_FIELDS,
+    JsonLinesResultWriter,
+    format_for_path,
+    open_writer,
+    output_format_for,
+    parse_args,
+    price_row,
+)
+from records import Location
+
+EL_CAJON = Location('EL CAJON', 'SAN DIEGO', 'CALIFORNIA')
+
+
+@pytest.mark.parametrize('payment', ['Infinity', '-Infinity', 'NaN', 'sNaN', '1e400000000', '0', '-5', 'abc', ''])
+def test_invalid_payments_are_row_errors(payment):
+    row = price_row('92019', payment, EL_CAJON, None, '8.250%')
+    assert row['error'] == "Invalid payment amount"
+    assert row['total_tax'] == ''
+
+
+def test_valid_payment_is_priced():
+    row = price_row('92019', '42.20', EL_CAJON, None, '8.250%')
+    assert row['error'] == ''
+    assert row['total_tax'] == '3.48'
+
+
+def test_dedup_and_nearest_fallback_are_rejected_together(capsys):
+    with pytest.raises(SystemExit) as raised:
+        parse_args(['in.csv', 'out.csv', '--dedup', '--nearest-within', '5'])
+    assert raised.value.code == 2
+    assert "not allowed with argument" in capsys.readouterr().err
+    assert parse_args(['in.csv', 'out.csv', '--dedup']).dedup
+
+
+PRICED = price_row('92019', '42.20', EL_CAJON, None, '8.250%', 'exact')
+ERROR = price_row('92019', 'abc', EL_CAJON, None, '8.250%', 'exact')
+
+
+@pytest.mark.parametrize('path, name', [
+    ('out.csv', 'csv'), ('out', 'csv'), ('out.jsonl', 'jsonl'), ('OUT.NDJSON', 'jsonl'), ('out.txt', 'text'),
+    ('out.arrow', 'arrow'), ('out.feather', 'arrow'), ('out.parquet', 'parquet'), ('out.pq', 'parquet'), ('-', 'csv'),
+])
+def test_format_is_chosen_by_extension(path, name):
+    assert format_for_path(path) == name
+    assert output_format_for(path) == name
+
+
+def test_csv_writer(tmp_path):
+    path = str(tmp_path / 'out.csv')
+    writer = open_writer(path)
+    writer.write([PRICED])
+    writer.write([ERROR])
+    writer.close()
+    with open(path, newline='') as handle:
+        assert list(csv.DictReader(handle)) == [PRICED, ERROR]
+    with open(path, newline='') as handle:
+        assert next(csv.reader(handle)) == OUTPUT_FIELDS
+
+
+def test_json_lines_writer(tmp_path):
+    path = str(tmp_path / 'out.csv')
+    odd = dict(PRICED, total_tax=3.48)
+    writer = open_writer(path, output_format='jsonl')
+    assert isinstance(writer, JsonLinesResultWriter)
+    writer.write([PRICED, ERROR, odd])
+    writer.close()
+    with open(path) as handle:
+        lines = handle.read().splitlines()
+    assert [json.loads(line) for line in lines] == [PRICED, ERROR, odd]
+    assert list(json.loads(lines[0])) == OUTPUT_FIELDS
+
+
+def test_text_writer(tmp_path):
+    path = str(tmp_path / 'out.txt')
+    writer = open_writer(path)
+    writer.write([PRICED, ERROR])
+    writer.close()
+    with open(path) as handle:
+        blocks = handle.read().split('\n\n')
+    assert blocks[0].splitlines()[:3] == ["Location ZIP: 92019", "Payment amount: $42.20", "City: EL CAJON"]
+    assert "Rate matched by: exact" in blocks[0] and "Total tax to be paid: $3.48" in blocks[0]
+    assert blocks[1] == "Location ZIP: 92019\nError: Invalid payment amount"
+    assert blocks[2:] == ['']
+
+
+def test_csv_to_stdout(capsys):
+    writer = open_writer('-')
+    writer.write([PRICED])
+    writer.close()
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0] == ','.join(OUTPUT_FIELDS)
+    assert lines[1].startswith('92019,42.20,EL CAJON,')
+
+
+@pytest.mark.parametrize('name', ['arrow', 'parquet'])
+def test_file_only_formats_are_refused_for_stdout(name, tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    with pytest.raises(ValueError, match="cannot be written to stdout"):
+        open_writer('-', output_format=name)
+    with pytest.raises(SystemExit) as raised:
+        parse_args(['in.csv', '-', '--format', name])
+    assert raised.value.code == 2
+    assert "cannot be written to stdout" in capsys.readouterr().err
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_unknown_format_is_refused():
+    with pytest.raises(ValueError, match="Unknown output format 'xml'"):
+        open_writer('out.csv', output_format='xml')
+
+
+@pytest.mark.parametrize('name, suffix', [('arrow', '.arrow'), ('parquet', '.parquet')])
+def test_arrow_and_parquet_writers(name, suffix, tmp_path):
+    pa = pytest.importorskip('pyarrow')
+    path = str(tmp_path / ('out' + suffix))
+    writer = open_writer(path)
+    writer.write([PRICED])
+    writer.write([ERROR])
+    writer.close()
+    if name == 'arrow':
+        table = pa.ipc.open_file(path).read_all()
+    else:
+        import pyarrow.parquet as pq
+        table = pq.read_table(path)
+    assert table.column_names == OUTPUT_FIELDS
+    assert table.to_pylist() == [PRICED, ERROR]
@@ -0,0 +1,43 @@
+from batch_pricing import match_tax_rate
+from instrumentation import METRICS, instrumented
+
+
+def test_stages_imported_by_name_are_timed_once_metrics_are_enabled():
+    histogram = METRICS.histogram('match_tax_rate')
+    rows = [('EL CAJON', 'SAN DIEGO', '8.250%')]
+    was_enabled = METRICS.enabled
+    METRICS.disable()
+    try:
+        before = histogram.count
+        match_tax_rate('EL CAJON', 'SAN DIEGO', rows)
+        assert histogram.count == before
+
+        METRICS.enable()
+        unmatched = METRICS.counters['unmatched_rates']
+        assert match_tax_rate('EL CAJON', 'SAN DIEGO', rows).tier == 'exact'
+        assert not match_tax_rate('NOWHERE', 'SAN DIEGO', rows)
+        assert histogram.count == before + 2
+        assert METRICS.counters['unmatched_rates'] == unmatched + 1
+
+        METRICS.disable()
+        match_tax_rate('EL CAJON', 'SAN DIEGO', rows)
+        assert histogram.count == before + 2
+    finally:
+        METRICS.enabled = was_enabled
+
+
+def test_decorating_always_returns_the_same_wrapper():
+    def stage(value):
+        return value
+
+    wrapper = instrumented('test_stage')(stage)
+    assert wrapper is not stage and wrapper.__wrapped__ is stage
+    was_enabled = METRICS.enabled
+    try:
+        METRICS.enable()
+        assert wrapper(3) == 3
+        METRICS.disable()
+        assert wrapper(4) == 4
+    finally:
+        METRICS.enabled = was_enabled
+    assert METRICS.histogram('test_stage').count == 1
@@ -0,0 +1,114 @@
+import pytest
+
+from lookup_cache import LookupCache, LRUCache
+
+ROWS = [
+    ('EL CAJON', 'SAN DIEGO', '8.250%'),
+    ('SAN DIEGO COUNTY UNINCORPORATED', 'SAN DIEGO', '7.750%'),
+    ('SACRAMENTO', 'SACRAMENTO', '8.750%'),
+]
+
+
+# Clock the tests move by hand
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = LRUCache(maxsize=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+    assert 'b' not in cache
+    assert cache.get('a') == 1 and cache.get('c') == 3
+    cache.put('a', 10)
+    cache.put('d', 4)
+    assert 'c' not in cache and cache.get('a') == 10
+    stats = cache.stats()
+    assert (stats['size'], stats['evictions'], stats['hits'], stats['misses']) == (2, 2, 4, 0)
+
+
+def test_entries_expire_after_the_ttl():
+    clock = FakeClock()
+    cache = LRUCache(maxsize=4, ttl=10, clock=clock)
+    cache.put('a', 1)
+    clock.now = 9.9
+    assert cache.lookup('a') == (True, 1)
+    clock.now = 10.0
+    assert cache.lookup('a') == (False, None)
+    assert 'a' not in cache
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['expirations']) == (1, 1, 1)
+    assert stats['hit_rate'] == 0.5
+
+
+def test_get_or_compute_counts_and_caches():
+    cache = LRUCache(maxsize=4)
+    calls = []
+    assert cache.get_or_compute('a', lambda: calls.append('a') or 1) == 1
+    assert cache.get_or_compute('a', lambda: calls.append('a') or 2) == 1
+    assert calls == ['a']
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_changing_the_version_drops_every_entry():
+    cache = LRUCache(maxsize=4, version='v1')
+    cache.put('a', 1)
+    cache.put('b', 2)
+    # Computed under an older version: stored, but never served
+    cache.put('c', 3, version='v0')
+    assert cache.lookup('c') == (False, None)
+    cache.set_version('v1')
+    assert len(cache) == 2
+    cache.set_version('v2')
+    assert len(cache) == 0
+    assert cache.stats()['invalidations'] == 2
+    assert cache.stats()['expirations'] == 1
+
+
+def test_migrate_keeps_entries_that_are_not_dropped():
+    cache = LRUCache(maxsize=4, version='v1')
+    cache.put(('EL CAJON', 'SAN DIEGO'), '8.250%')
+    cache.put(('SACRAMENTO', 'SACRAMENTO'), '8.750%')
+    cache.put(('OLD', 'SACRAMENTO'), '1.000%', version='v0')
+    assert cache.migrate('v2', lambda key: key[1] == 'SAN DIEGO') == 2
+    assert cache.version == 'v2'
+    assert cache.get(('SACRAMENTO', 'SACRAMENTO')) == '8.750%'
+    assert ('EL CAJON', 'SAN DIEGO') not in cache
+    assert cache.stats()['invalidations'] == 2
+
+
+def test_maxsize_must_be_positive():
+    with pytest.raises(ValueError):
+        LRUCache(maxsize=0)
+
+
+def test_reload_drops_cached_rates_only_in_changed_counties():
+    lookups = LookupCache(ROWS)
+    assert lookups.tax_rate('El Cajon', 'San Diego') == '8.250%'
+    assert lookups.tax_rate('Sacramento', 'Sacramento') == '8.750%'
+    old_version = lookups.rates.version
+
+    report = lookups.load_rate_table([('EL CAJON', 'SAN DIEGO', '8.500%')] + ROWS[1:])
+    assert report['invalidated'] == 1
+    assert lookups.rates.version == lookups.rate_table.version != old_version
+    assert ('SACRAMENTO', 'SACRAMENTO') in lookups.rates
+    assert lookups.tax_rate('El Cajon', 'San Diego') == '8.500%'
+    stats = lookups.stats()
+    assert stats['rate_table_version'] == lookups.rate_table.version
+    assert (stats['rates']['hits'], stats['rates']['misses']) == (0, 3)
+
+
+def test_locations_are_memoized():
+    lookups = LookupCache(ROWS)
+    first = lookups.location('92019')
+    assert first['city'] == 'EL CAJON'
+    assert lookups.location('92019') is first
+    assert lookups.locations_many(['92019', '95814']) == [first, lookups.location('95814')]
+    stats = lookups.stats()['locations']
+    assert (stats['hits'], stats['misses']) == (3, 2)
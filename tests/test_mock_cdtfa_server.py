@@ -0,0 +1,46 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from mock_cdtfa_server import FaultPlan, start_server
+from rate_cache import RateCache
+
+
+def test_truncated_pages_carry_no_validators(tmp_path):
+    server = start_server(faults=FaultPlan(truncate_rate=1.0))
+    try:
+        full_page, etag, _ = server.page
+        response = requests.get(server.url, timeout=5)
+        assert response.status_code == 200
+        assert len(response.content) < len(full_page)
+        assert 'ETag' not in response.headers and 'Last-Modified' not in response.headers
+
+        # A client already holding the full page is still told it is unchanged
+        assert requests.get(server.url, headers={'If-None-Match': etag}, timeout=5).status_code == 304
+
+        # The cache keeps the partial page without validators, so the next refresh is
+        # unconditional and picks up the whole page once the upstream recovers
+        cache = RateCache(str(tmp_path / 'rates.sqlite'), url=server.url)
+        partial = cache.refresh()
+        assert cache.load()['etag'] is None
+        server.faults = FaultPlan()
+        full = cache.refresh()
+        assert full is not None and len(full) > len(partial)
+        assert cache.load()['etag'] == etag
+        assert server.fault_counts['truncated'] == 2
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_counts_are_exact_under_concurrent_requests():
+    server = start_server(faults=FaultPlan(error_rate=0.5, seed=1))
+    try:
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            statuses = list(executor.map(lambda _: requests.get(server.url, timeout=5).status_code, range(200)))
+        request_count, fault_counts = server.counts()
+        assert request_count == len(statuses) == 200
+        assert fault_counts == {'http_503': statuses.count(503)}
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,94 @@
+import pytest
+
+from batch_pricing import price_row
+from mock_cdtfa_server import DEFAULT_PAGE
+from name_matching import FUZZY_MIN_SIMILARITY, NO_MATCH, canonical_name, similarity
+from rate_cache import load_saved_page
+from rate_table import RateTable
+from records import Location
+from tax_service import TaxService
+
+ROWS = [
+    ('ST. HELENA', 'NAPA', '8.250%'),
+    ('NAPA COUNTY UNINCORPORATED', 'NAPA', '7.750%'),
+    ('SONOMA (CITY)', 'SONOMA', '8.750%'),
+    ('SONOMA COUNTY UNINCORPORATED', 'SONOMA', '8.250%'),
+    ('VENTURA', 'VENTURA', '8.750%'),
+    ('EL PASO DE ROBLES (PASO ROBLES)', 'SAN LUIS OBISPO', '8.750%'),
+    ('INDUSTRY', 'LOS ANGELES', '9.500%'),
+    ('LA CANADA FLINTRIDGE', 'LOS ANGELES', '9.500%'),
+    ('PASADENA', 'LOS ANGELES', '10.250%'),
+    ('LOS ANGELES COUNTY UNINCORPORATED', 'LOS ANGELES', '9.750%'),
+    ('LOS ANGELES COUNTY', 'LOS ANGELES', '9.000%'),
+    ('ALPINE COUNTY', 'ALPINE', '7.250%'),
+]
+
+
+@pytest.fixture
+def table():
+    return RateTable(ROWS)
+
+
+def test_exact_names_match_first(table):
+    assert table.match('ST. HELENA', 'NAPA') == ('8.250%', 'exact', 'ST. HELENA')
+    assert table.match('Pasadena', 'Los Angeles') == ('10.250%', 'exact', 'PASADENA')
+
+
+@pytest.mark.parametrize('city', ['SAINT HELENA', 'ST HELENA', 'Saint Helena'])
+def test_saint_and_st_are_the_same_name(table, city):
+    assert canonical_name(city) == canonical_name('ST. HELENA') == 'SAINT HELENA'
+    assert table.match(city, 'NAPA') == ('8.250%', 'normalized', 'ST. HELENA')
+
+
+def test_city_suffix_is_ignored(table):
+    assert table.match('SONOMA', 'SONOMA') == ('8.750%', 'normalized', 'SONOMA (CITY)')
+
+
+def test_aliases(table):
+    # From the ALIASES table
+    assert table.match('SAN BUENAVENTURA', 'VENTURA') == ('8.750%', 'alias', 'VENTURA')
+    # From the name in a location's parentheses
+    assert table.match('PASO ROBLES', 'SAN LUIS OBISPO') == ('8.750%', 'alias', 'EL PASO DE ROBLES (PASO ROBLES)')
+    # "CITY OF" is dropped by normalization before the alias tier is reached
+    assert table.match('CITY OF INDUSTRY', 'LOS ANGELES') == ('9.500%', 'normalized', 'INDUSTRY')
+
+
+def test_fuzzy_threshold(table):
+    # 20 characters: 3 edits is exactly the minimum similarity, 4 edits is below it
+    assert similarity('LA CANADA FLINTRIDGE', 'LA CANADA FLINTROOOE') == pytest.approx(FUZZY_MIN_SIMILARITY)
+    assert table.match('LA CANADA FLINTROOOE', 'LOS ANGELES') == ('9.500%', 'fuzzy', 'LA CANADA FLINTRIDGE')
+    assert table.match('LA CANADA FLINTOOOOE', 'LOS ANGELES').tier == 'unincorporated'
+    assert table.match('PASSADENA', 'LOS ANGELES') == ('10.250%', 'fuzzy', 'PASADENA')
+
+
+def test_matches_stay_in_the_same_county(table):
+    # Pasadena is in Los Angeles County; in Napa County only Napa's own rows can match
+    assert table.match('PASADENA', 'NAPA') == ('7.750%', 'unincorporated', None)
+    assert table.match('PASSADENA', 'NAPA').tier == 'unincorporated'
+    assert table.match('SAINT HELENA', 'SONOMA') == ('8.250%', 'unincorporated', None)
+
+
+def test_fallback_order(table):
+    # Unknown city: the county's unincorporated rate before its county-wide rate
+    assert table.match('NOWHERE', 'LOS ANGELES') == ('9.750%', 'unincorporated', None)
+    # No unincorporated row: the county-wide rate
+    assert table.match('MARKLEEVILLE', 'ALPINE') == ('7.250%', 'county', None)
+    # Unknown county: nothing, and the result is false
+    result = table.match('NOWHERE', 'ORANGE')
+    assert result == NO_MATCH and not result
+    assert table.resolve('NOWHERE', 'ORANGE') is None
+
+
+def test_batch_rows_report_the_tier(table):
+    row = price_row('99999', '100.00', Location('NOWHERE', 'LOS ANGELES', 'CALIFORNIA'), table)
+    assert (row['tax_rate'], row['match'], row['total_tax']) == ('9.750%', 'unincorporated', '9.75')
+    row = price_row('99999', '100.00', Location('NOWHERE', 'ORANGE', 'CALIFORNIA'), table)
+    assert row['match'] == '' and row['error'].startswith("No tax rate found")
+
+
+def test_service_results_report_the_tier():
+    service = TaxService(load_saved_page(DEFAULT_PAGE))
+    assert service.price_one('92019', '10.00')['match'] == 'exact'
+    assert service.price_one('94574', '10.00')['match'] == 'normalized'
+    assert [result['match'] for result in service.price_many([('94574', '10.00'), ('92019', '10.00')])] == ['normalized', 'exact']
+    assert 'match' not in service.price_one('10001', '10.00')
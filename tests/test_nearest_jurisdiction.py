@@ -0,0 +1,66 @@
+from mock_cdtfa_server import DEFAULT_PAGE
+from nearest_jurisdiction import NearestJurisdiction, build_nearest_jurisdiction, prefix_centroids
+from pipeline import items_from_rows, price_stream
+from rate_cache import load_saved_page
+from records import Location
+
+EL_CAJON = Location('EL CAJON', 'SAN DIEGO', 'CALIFORNIA')
+TRUCKEE = Location('TRUCKEE', None, 'CALIFORNIA')
+UNKNOWN = Location(None, None, None)
+
+
+# Resolver answering from fixed (location, coordinates) pairs
+class FixedResolver:
+    def __init__(self, places):
+        self.places = places
+
+    def resolve_many(self, zip_codes):
+        return [self.places.get(zip_code, (UNKNOWN, None))[0] for zip_code in zip_codes]
+
+    def coordinates_many(self, zip_codes):
+        return [self.places.get(zip_code, (UNKNOWN, None))[1] for zip_code in zip_codes]
+
+
+def build_index():
+    resolver = FixedResolver({
+        '92019': (EL_CAJON, (32.7795, -116.9325)),
+        '96162': (TRUCKEE, (39.3, -120.2)),
+        # Reno: coordinates but no county, and not in California
+        '89501': (Location('RENO', None, 'NEVADA'), (39.53, -119.81)),
+        # A Nevada ZIP that pgeocode files under a California prefix
+        '96199': (Location(None, None, 'NEVADA'), None),
+        # Coordinates but no state, outside every California prefix
+        '89599': (UNKNOWN, (39.5, -119.8)),
+    })
+    centroids = [('92019', 32.7795, -116.9325), ('96162', 39.3, -120.2)]
+    entries = [('92019', 32.7795, -116.9325, EL_CAJON, '8.250%')]
+    return NearestJurisdiction(entries, resolver, prefix_centroids(centroids))
+
+
+def test_only_california_or_unknown_zips_in_california_prefixes_fall_back():
+    matches = dict(zip(
+        ['96162', '96150', '89501', '96199', '89599', '10099'],
+        build_index().for_zips(['96162', '96150', '89501', '96199', '89599', '10099']),
+    ))
+    assert matches['96162'].source == 'zip'
+    assert matches['96150'].source == 'zip3'
+    assert matches['96162'].zip == matches['96150'].zip == '92019'
+    assert matches['89501'] is None
+    assert matches['96199'] is None
+    assert matches['89599'] is None
+    assert matches['10099'] is None
+
+
+def test_pipeline_keeps_error_rows_for_out_of_state_zips():
+    tax_data = load_saved_page(DEFAULT_PAGE)
+    rows = list(price_stream(items_from_rows([('89501', '100.00')]), tax_data, nearest=build_index(), max_distance_km=1000))
+    assert rows[0]['error'] == "No information found for ZIP code 89501"
+    assert rows[0]['matched_zip'] == ''
+
+
+def test_pipeline_prices_california_zips_without_a_county():
+    tax_data = load_saved_page(DEFAULT_PAGE)
+    nearest = build_nearest_jurisdiction(tax_data)
+    rows = list(price_stream(items_from_rows([('96162', '100.00')]), tax_data, nearest=nearest, max_distance_km=1000))
+    assert rows[0]['error'] == ''
+    assert rows[0]['matched_zip'] != ''
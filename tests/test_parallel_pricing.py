@@ -0,0 +1,89 @@
+import csv
+import os
+import signal
+import sys
+
+import pytest
+
+import final
+import parallel_pricing
+from batch_pricing import price_file
+from mock_cdtfa_server import DEFAULT_PAGE
+from parallel_pricing import price_file_parallel
+from rate_cache import load_saved_page
+from zip_rate_table import build_zip_rate_table
+
+ROWS = [
+    ('92019', '100.00'), ('92020', '42.20'), ('10001', '10.00'), ('96162', '10.00'), ('9201', '1'),
+    ('99999', '5'), ('94574', '12.34'), ('90001', '1'), ('95814', 'abc'), ('92019', '7.50'),
+] * 20
+
+pytestmark = pytest.mark.skipif(sys.platform == 'win32', reason="uses fork and SIGKILL")
+
+
+@pytest.fixture
+def setup(tmp_path):
+    tax_data = load_saved_page(DEFAULT_PAGE)
+    table_path = str(tmp_path / 'ca_zip_rates.bin')
+    build_zip_rate_table(tax_data, table_path)
+    input_path = tmp_path / 'invoices.csv'
+    with open(input_path, 'w', newline='') as handle:
+        writer = csv.writer(handle)
+        writer.writerow(['zip', 'payment'])
+        writer.writerows(ROWS)
+    return tax_data, table_path, str(input_path), tmp_path
+
+
+def read_rows(path):
+    with open(path, newline='') as handle:
+        return list(csv.DictReader(handle))
+
+
+def test_parallel_output_matches_batch_pricing(setup):
+    tax_data, table_path, input_path, tmp_path = setup
+    price_file(input_path, str(tmp_path / 'serial.csv'), tax_data, chunk_size=32)
+    totals = price_file_parallel(input_path, str(tmp_path / 'parallel.csv'), table_path, workers=3,
+                                 chunk_size=32, progress=False, tax_data=tax_data)
+    assert totals[0] == len(ROWS)
+    assert read_rows(tmp_path / 'parallel.csv') == read_rows(tmp_path / 'serial.csv')
+
+
+def test_zips_outside_the_table_are_resolved_in_the_parent(setup, monkeypatch):
+    tax_data, table_path, input_path, tmp_path = setup
+    queries = []
+    get_locations_from_zips = final.get_locations_from_zips
+
+    def counting(zip_codes):
+        queries.append(list(zip_codes))
+        return get_locations_from_zips(zip_codes)
+
+    monkeypatch.setattr(parallel_pricing, 'get_locations_from_zips', counting)
+    price_file_parallel(input_path, str(tmp_path / 'parallel.csv'), table_path, workers=2,
+                        chunk_size=1000, progress=False)
+    # 96162 has no county, so it is not in the table; the rest are California ZIPs it holds
+    assert queries == [['10001', '96162', '99999']]
+
+
+def test_stale_table_is_refused(setup):
+    tax_data, table_path, input_path, tmp_path = setup
+    newer = list(tax_data)
+    newer[0] = (newer[0][0], newer[0][1], '9.999%')
+    with pytest.raises(ValueError, match="rebuild it"):
+        price_file_parallel(input_path, str(tmp_path / 'parallel.csv'), table_path, workers=1,
+                            progress=False, tax_data=newer)
+
+
+def test_killed_worker_fails_the_run_instead_of_hanging(setup, monkeypatch):
+    tax_data, table_path, input_path, tmp_path = setup
+    price = parallel_pricing.ShardPricer.price
+
+    def die_on_sacramento(self, zip_code, payment, location_info=None):
+        if zip_code == '95814':
+            os.kill(os.getpid(), signal.SIGKILL)
+        return price(self, zip_code, payment, location_info)
+
+    monkeypatch.setattr(parallel_pricing.ShardPricer, 'price', die_on_sacramento)
+    monkeypatch.setattr(parallel_pricing, 'WORKER_POLL_INTERVAL', 0.1)
+    with pytest.raises(RuntimeError, match=r"exited with code -9"):
+        price_file_parallel(input_path, str(tmp_path / 'parallel.csv'), table_path, workers=2,
+                            chunk_size=32, progress=False)
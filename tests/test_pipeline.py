@@ -0,0 +1,47 @@
+import threading
+
+import pytest
+
+from pipeline import threaded
+
+
+# Function to list the running pipeline stage threads
+def stage_threads():
+    return [thread for thread in threading.enumerate() if thread.name == 'pipeline-stage']
+
+
+def test_producer_exception_reaches_the_consumer():
+    def producer():
+        yield 1
+        yield 2
+        raise ValueError("bad row")
+
+    received = []
+    with pytest.raises(ValueError, match="bad row"):
+        for item in threaded(producer()):
+            received.append(item)
+    assert received == [1, 2]
+    assert stage_threads() == []
+
+
+def test_stopping_early_shuts_the_stage_down():
+    produced = []
+    closed = threading.Event()
+
+    def producer():
+        try:
+            for number in range(1000000):
+                produced.append(number)
+                yield number
+        finally:
+            closed.set()
+
+    items = threaded(producer(), maxsize=2)
+    assert [next(items) for _ in range(3)] == [0, 1, 2]
+    items.close()
+
+    assert stage_threads() == []
+    assert closed.is_set()
+    # The bounded queue kept the producer at most a queue's length (plus the item it
+    # was offering) ahead of the consumer
+    assert len(produced) <= 3 + 2 + 1
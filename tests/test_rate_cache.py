@@ -0,0 +1,84 @@
+import sqlite3
+
+import pytest
+
+from mock_cdtfa_server import start_server
+from rate_cache import RateCache, load_tax_data
+
+
+@pytest.fixture
+def server():
+    server = start_server()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+# Function to serve a copy of the page with one rate changed
+def publish_new_rates(server):
+    body = server.page[0]
+    server.set_page(body.replace(b'9.500%', b'9.750%', 1))
+
+
+def test_refresh_is_conditional(server, tmp_path):
+    cache = RateCache(str(tmp_path / 'rates.sqlite'), url=server.url)
+    tax_data = cache.refresh()
+    snapshot = cache.load()
+    assert len(tax_data) > 0
+    assert snapshot['etag'] == server.page[1]
+    assert list(snapshot['tax_data']) == list(tax_data)
+
+    # Unchanged page: 304, nothing returned, the snapshot is only marked fresh again
+    assert cache.refresh(snapshot) is None
+    assert cache.load()['fetched_at'] >= snapshot['fetched_at']
+    assert cache.load()['version'] == snapshot['version']
+
+    publish_new_rates(server)
+    updated = cache.refresh(snapshot)
+    assert updated is not None and list(updated) != list(tax_data)
+    assert cache.load()['etag'] == server.page[1]
+
+
+def test_snapshot_goes_stale_after_the_ttl(server, tmp_path):
+    path = str(tmp_path / 'rates.sqlite')
+    RateCache(path, url=server.url).refresh()
+    assert not RateCache(path, url=server.url, ttl=3600).is_stale(RateCache(path, url=server.url).load())
+    assert RateCache(path, url=server.url, ttl=0).is_stale(RateCache(path, url=server.url).load())
+    assert RateCache(path, url=server.url).is_stale(None)
+
+
+def test_stale_snapshot_is_served_and_refreshed_in_the_background(server, tmp_path):
+    cache = RateCache(str(tmp_path / 'rates.sqlite'), url=server.url, ttl=0)
+    old_rows = list(cache.refresh())
+    publish_new_rates(server)
+
+    updates = []
+    threads = []
+    refresh_in_background = cache.refresh_in_background
+
+    def tracked(snapshot=None, on_update=None):
+        threads.append(refresh_in_background(snapshot, on_update))
+        return threads[-1]
+
+    cache.refresh_in_background = tracked
+    tax_data = load_tax_data(cache, on_update=updates.append)
+    assert list(tax_data) == old_rows
+    threads[0].join(5)
+    assert len(updates) == 1 and list(updates[0]) != old_rows
+
+
+def test_background_refresh_failure_keeps_the_old_snapshot(server, tmp_path, capsys, monkeypatch):
+    cache = RateCache(str(tmp_path / 'rates.sqlite'), url=server.url)
+    cache.refresh()
+    snapshot = cache.load()
+    publish_new_rates(server)
+
+    def fail(*args, **kwargs):
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(cache, 'save', fail)
+    updates = []
+    cache.refresh_in_background(snapshot, updates.append).join(5)
+    assert updates == []
+    assert "Background tax rate refresh failed: OperationalError: database is locked" in capsys.readouterr().out
+    assert cache.load()['version'] == snapshot['version']
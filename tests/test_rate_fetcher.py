@@ -0,0 +1,65 @@
+import pytest
+
+from mock_cdtfa_server import FaultPlan, start_server
+from rate_fetcher import RateSource, fetch_tax_data, parse_source
+
+
+@pytest.fixture
+def server():
+    server = start_server()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+# Function to serve a page body from a temporary file
+def serve_bytes(tmp_path, name, body):
+    path = tmp_path / name
+    path.write_bytes(body)
+    return start_server(str(path))
+
+
+def test_fetches_the_served_page(server):
+    tax_data, results = fetch_tax_data([RateSource('cdtfa', server.url, 'html')], retries=0)
+    assert results[0].ok and results[0].status == 200
+    assert len(tax_data) == len(results[0].tax_data) > 0
+
+
+def test_http_error_is_a_failed_result():
+    server = start_server(faults=FaultPlan(error_rate=1.0, error_status=404))
+    try:
+        tax_data, results = fetch_tax_data([RateSource('cdtfa', server.url, 'html')], retries=0)
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert not results[0].ok
+    assert results[0].error == "HTTP 404"
+    assert len(tax_data) == 0
+
+
+@pytest.mark.parametrize('name, body, url_format, error', [
+    # A two-cell row has no county cell and is skipped
+    ('short_row.html', b'<table><tr><td>EL CAJON</td><td>8.250%</td></tr></table>', 'html', "No tax data was extracted"),
+    ('not_utf8.csv', b'Location,Rate,County\n\xff\xfe\xfa,8.250%,X\n', 'csv', "Parse error: UnicodeDecodeError"),
+])
+def test_bad_page_is_a_failed_result_and_keeps_other_sources(server, tmp_path, name, body, url_format, error):
+    bad_server = serve_bytes(tmp_path, name, body)
+    try:
+        tax_data, results = fetch_tax_data([
+            RateSource('bad', bad_server.url, url_format),
+            RateSource('cdtfa', server.url, 'html'),
+        ], retries=0)
+    finally:
+        bad_server.shutdown()
+        bad_server.server_close()
+    bad, good = results
+    assert not bad.ok and bad.status == 200
+    assert bad.error.startswith(error)
+    assert good.ok
+    assert len(tax_data) == len(good.tax_data)
+
+
+def test_parse_source_format_suffix():
+    assert parse_source('rates=http://example.com/rates#csv') == RateSource('rates', 'http://example.com/rates', 'csv')
+    assert parse_source('rates=http://example.com/rates.csv').format == 'csv'
+    assert parse_source('rates=http://example.com/rates').format == 'html'
@@ -0,0 +1,97 @@
+import pytest
+
+import rate_history
+from rate_history import RateHistory
+
+Q1 = [
+    ('EL CAJON', 'SAN DIEGO', '8.250%'),
+    ('LA MESA', 'SAN DIEGO', '8.500%'),
+    ('SAN DIEGO COUNTY UNINCORPORATED', 'SAN DIEGO', '7.750%'),
+]
+Q2 = [
+    ('EL CAJON', 'SAN DIEGO', '8.500%'),
+    ('SAN DIEGO COUNTY UNINCORPORATED', 'SAN DIEGO', '7.750%'),
+]
+Q3 = [
+    ('EL CAJON', 'SAN DIEGO', '8.750%'),
+    ('LA MESA', 'SAN DIEGO', '9.000%'),
+    ('SAN DIEGO COUNTY UNINCORPORATED', 'SAN DIEGO', '7.750%'),
+]
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'history.sqlite')
+
+
+# Function to read every rate in force on each date
+def rates_on(history, dates):
+    return {
+        as_of: {city: history.rate_as_of(city, 'SAN DIEGO', as_of) for city in ('EL CAJON', 'LA MESA')}
+        for as_of in dates
+    }
+
+
+DATES = ['2024-01-01', '2024-03-31', '2024-04-01', '2024-06-30', '2024-07-01', '2025-01-01']
+
+
+def test_out_of_order_snapshots_give_the_same_history(path, tmp_path):
+    in_order = RateHistory(path)
+    for effective_date, tax_data in [('2024-01-01', Q1), ('2024-04-01', Q2), ('2024-07-01', Q3)]:
+        in_order.add_snapshot(effective_date, tax_data)
+
+    shuffled = RateHistory(str(tmp_path / 'shuffled.sqlite'))
+    for effective_date, tax_data in [('2024-07-01', Q3), ('2024-01-01', Q1), ('2024-04-01', Q2)]:
+        shuffled.add_snapshot(effective_date, tax_data)
+
+    assert shuffled.dates == in_order.dates == ['2024-01-01', '2024-04-01', '2024-07-01']
+    assert rates_on(shuffled, DATES) == rates_on(in_order, DATES)
+    assert rates_on(RateHistory(path), DATES) == rates_on(in_order, DATES)
+    assert in_order.rate_as_of('El Cajon', 'San Diego', '2024-06-30') == '8.500%'
+    assert in_order.rate_as_of('EL CAJON', 'SAN DIEGO', '2024-07-01') == '8.750%'
+
+
+def test_snapshot_on_the_same_date_replaces_it(path):
+    history = RateHistory(path)
+    history.add_snapshot('2024-01-01', Q1)
+    history.add_snapshot('2024-07-01', Q3)
+    history.add_snapshot('2024-01-01', Q2)
+    assert len(history) == 2
+    assert history.rate_as_of('EL CAJON', 'SAN DIEGO', '2024-03-31') == '8.500%'
+    # The next snapshot is still stored relative to the one before it
+    assert history.rate_as_of('LA MESA', 'SAN DIEGO', '2024-07-01') == '9.000%'
+    assert history.rate_as_of('EL CAJON', 'SAN DIEGO', '2024-07-01') == '8.750%'
+    assert RateHistory(path).rate_as_of('EL CAJON', 'SAN DIEGO', '2024-03-31') == '8.500%'
+
+
+def test_no_rate_before_the_first_snapshot(path):
+    history = RateHistory(path)
+    history.add_snapshot('2024-04-01', Q2)
+    assert history.snapshot_date('2024-03-31') is None
+    assert history.table_as_of('2024-03-31') is None
+    assert history.rate_as_of('EL CAJON', 'SAN DIEGO', '2024-03-31') is None
+    assert history.rate_as_of('EL CAJON', 'SAN DIEGO', '2024-04-01') == '8.500%'
+
+
+def test_removed_location_is_not_priced_at_its_old_rate(path):
+    history = RateHistory(path)
+    history.add_snapshot('2024-01-01', Q1)
+    history.add_snapshot('2024-04-01', Q2)
+    history.add_snapshot('2024-07-01', Q3)
+    assert history.rate_as_of('LA MESA', 'SAN DIEGO', '2024-03-31') == '8.500%'
+    # While it is missing the county's unincorporated rate applies, and the tier says so
+    assert history.match_as_of('LA MESA', 'SAN DIEGO', '2024-04-01') == ('7.750%', 'unincorporated', None)
+    assert history.rate_as_of('LA MESA', 'SAN DIEGO', '2024-07-01') == '9.000%'
+
+
+def test_snapshot_tables_are_evicted_least_recently_used_first(path, monkeypatch):
+    monkeypatch.setattr(rate_history, 'SNAPSHOT_TABLE_CACHE_SIZE', 2)
+    history = RateHistory(path)
+    history.add_snapshot('2024-01-01', Q1)
+    history.add_snapshot('2024-04-01', Q2)
+    history.add_snapshot('2024-07-01', Q3)
+    first = history.table_as_of('2024-01-01')
+    history.table_as_of('2024-04-01')
+    assert history.table_as_of('2024-02-01') is first
+    history.table_as_of('2024-07-01')
+    assert list(history._tables) == ['2024-01-01', '2024-07-01']
@@ -0,0 +1,48 @@
+import pytest
+
+from mock_cdtfa_server import DEFAULT_PAGE
+from rate_parser import ENGINES, iter_tax_rates
+
+ODD_ROWS_PAGE = b'''<html><body>
+<table>
+  <tr><th>Location</th><th>Rate</th><th>County</th></tr>
+  <tr><td>El Cajon</td><td>8.250%</td></tr>
+  <tr><td><a href="#note">Acton*</a></td><td>9.500%</td><td> Los Angeles </td></tr>
+  <tr>
+    <td>Outer<table><tr><td>Inner</td><td>1.000%</td><td>Napa</td></tr><tr><td>Short</td><td>2.000%</td></tr></table></td>
+    <td>7.250%</td>
+    <td>Napa</td>
+  </tr>
+  <tr><td>Alpine<script>var x = 1;</script></td><td>7.750%</td><td>San Diego</td></tr>
+</table>
+<tr><td>Outside</td><td>1.000%</td><td>Any</td></tr>
+</body></html>'''
+
+
+def read_page():
+    with open(DEFAULT_PAGE, 'rb') as handle:
+        return handle.read()
+
+
+@pytest.mark.parametrize('page', [read_page(), ODD_ROWS_PAGE], ids=['fixture', 'odd_rows'])
+def test_every_engine_extracts_the_same_rows(page):
+    results = {name: engine(page) for name, engine in ENGINES.items()}
+    reference = list(results.pop('bs4'))
+    assert reference
+    for name, rows in results.items():
+        assert list(rows) == reference, name
+
+
+def test_odd_rows_are_skipped_or_kept_whole():
+    assert list(ENGINES['bs4'](ODD_ROWS_PAGE)) == [
+        ('ACTON*', 'LOS ANGELES', '9.500%'),
+        ('OUTERINNER1.000%NAPASHORT2.000%', 'NAPA', '7.250%'),
+        ('INNER', 'NAPA', '1.000%'),
+        ('ALPINE', 'SAN DIEGO', '7.750%'),
+    ]
+
+
+def test_streaming_in_small_chunks_matches_one_chunk():
+    page = read_page() + ODD_ROWS_PAGE
+    chunks = [page[start:start + 7] for start in range(0, len(page), 7)]
+    assert list(iter_tax_rates(chunks)) == list(ENGINES['stream'](page))
@@ -0,0 +1,37 @@
+import threading
+
+from rate_reload import RateReloader
+
+OLD_ROWS = [('EL CAJON', 'SAN DIEGO', '8.250%'), ('SACRAMENTO', 'SACRAMENTO', '8.750%')]
+NEW_ROWS = [('EL CAJON', 'SAN DIEGO', '8.500%'), ('SACRAMENTO', 'SACRAMENTO', '8.750%')]
+
+
+def test_initial_load_waits_for_a_reload_in_progress_and_keeps_its_rates():
+    reloader = RateReloader()
+    startup = {}
+
+    def load_snapshot():
+        startup['report'] = reloader.reload_if_unset(OLD_ROWS)
+
+    def on_swap(rate_table, diff):
+        # The background reload holds the lock but has not set last_report yet
+        thread = threading.Thread(target=load_snapshot)
+        thread.start()
+        thread.join(0.2)
+        startup['blocked'] = thread.is_alive()
+        startup['thread'] = thread
+        return 0
+
+    reloader.reload(NEW_ROWS, on_swap)
+    startup['thread'].join(5)
+    assert startup['blocked']
+    assert startup['report'] is None
+    assert reloader.rate_table.lookup('EL CAJON', 'SAN DIEGO') == '8.500%'
+
+
+def test_initial_load_applies_when_nothing_was_loaded():
+    reloader = RateReloader()
+    report = reloader.reload_if_unset(OLD_ROWS)
+    assert report is not None and len(report['added']) == 2
+    assert reloader.reload_if_unset(NEW_ROWS) is None
+    assert reloader.rate_table.lookup('EL CAJON', 'SAN DIEGO') == '8.250%'
@@ -0,0 +1,46 @@
+import pytest
+
+from rate_reload import diff_tax_data
+from rate_table import RateTable
+
+OLD_ROWS = [
+    ('EL CAJON', 'SAN DIEGO', '8.250%'),
+    ('SAN DIEGO COUNTY UNINCORPORATED', 'SAN DIEGO', '7.750%'),
+    ('CITY OF LEMON GROVE', 'SAN DIEGO', '8.750%'),
+    ('LEMON GROVE', 'SAN DIEGO', '8.500%'),
+    ('SACRAMENTO', 'SACRAMENTO', '8.750%'),
+    ('SACRAMENTO COUNTY', 'SACRAMENTO', '7.750%'),
+]
+
+
+@pytest.mark.parametrize('new_rows', [
+    # A second unincorporated row added ahead of the existing one
+    [('UNINCORPORATED AREA', 'SAN DIEGO', '8.000%')] + OLD_ROWS,
+    # Same rows, with the duplicate names of each county swapped
+    [OLD_ROWS[0], OLD_ROWS[3], OLD_ROWS[2], OLD_ROWS[1], OLD_ROWS[5], OLD_ROWS[4]],
+    # A changed rate plus an added county row ahead of the existing one
+    [OLD_ROWS[0], ('LEMON GROVE', 'SAN DIEGO', '8.625%'), OLD_ROWS[2], OLD_ROWS[1],
+     ('SACRAMENTO', 'SACRAMENTO', '7.500%'), OLD_ROWS[4], OLD_ROWS[5]],
+    # Removed rows
+    OLD_ROWS[:2] + OLD_ROWS[3:5],
+])
+def test_updated_table_matches_a_fresh_build(new_rows):
+    table = RateTable(OLD_ROWS)
+    updated = table.updated(new_rows, diff_tax_data(table, new_rows))
+    fresh = RateTable(new_rows)
+
+    assert updated.version == fresh.version
+    assert list(updated.rows) == list(fresh.rows)
+    assert updated.by_city_county == fresh.by_city_county
+    assert updated.by_county == fresh.by_county
+    assert updated.unincorporated == fresh.unincorporated
+    assert updated.matcher.by_canonical == fresh.matcher.by_canonical
+    assert updated.matcher.by_alias == fresh.matcher.by_alias
+    assert updated.matcher.trigram_index == fresh.matcher.trigram_index
+    for city, county in [('Lemon Grove', 'San Diego'), ('Lemon Grov', 'San Diego'), ('Alpine', 'San Diego'),
+                         ('Sacramento', 'Sacramento'), ('Elk Grove', 'Sacramento')]:
+        assert updated.match(city, county) == fresh.match(city, county)
+
+    # The original table is left as it was
+    assert table.by_city_county == RateTable(OLD_ROWS).by_city_county
+    assert table.unincorporated == RateTable(OLD_ROWS).unincorporated
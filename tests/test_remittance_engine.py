@@ -0,0 +1,39 @@
+import pytest
+
+from remittance_engine import check_equivalence, compute_remittances, decimal_remittances, encode_payments, encode_rates, format_cents
+
+AMOUNTS = ('total_tax', 'state_remittance', 'city_remittance', 'county_remittance')
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_engine_matches_decimal_path(seed):
+    assert check_equivalence(samples=20000, seed=seed) == []
+
+
+# Payments whose tax or remittances land exactly on a half cent, so rounding must go to even
+@pytest.mark.parametrize('payment, tax_rate', [
+    ('0.20', '7.500%'),
+    ('1.00', '7.250%'),
+    ('6.00', '10.250%'),
+    ('0.60', '8.375%'),
+    ('0.10', '5.000%'),
+    ('0.30', '5.000%'),
+    ('1.00', '0.500%'),
+    ('3.00', '0.500%'),
+    ('100.00', '7.255%'),
+    ('0.00', '8.250%'),
+])
+def test_rounding_ties_match_decimal_path(payment, tax_rate):
+    results = compute_remittances(encode_payments([payment]), encode_rates([tax_rate]))
+    actual = tuple(format_cents(results[name])[0] for name in AMOUNTS)
+    assert actual == decimal_remittances(payment, tax_rate)
+
+
+def test_fractional_cents_are_rejected():
+    with pytest.raises(ValueError):
+        encode_payments(['10.005'])
+
+
+def test_payments_beyond_int64_range_raise():
+    with pytest.raises(OverflowError):
+        compute_remittances(encode_payments(['100000000000000000']), encode_rates(['10.000%']))
@@ -0,0 +1,77 @@
+import asyncio
+import json
+
+from mock_cdtfa_server import DEFAULT_PAGE
+from rate_cache import load_saved_page
+from records import Location
+from tax_service import TaxService
+
+
+# Function to send raw request bytes to a fresh service and return (status, JSON body)
+def exchange(service, request):
+    async def run():
+        server = await service.start('127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(request)
+        await writer.drain()
+        response = await asyncio.wait_for(reader.read(), 5)
+        writer.close()
+        server.close()
+        await server.wait_closed()
+        return response
+
+    head, _, body = asyncio.run(run()).partition(b'\r\n\r\n')
+    return int(head.split()[1]), json.loads(body)
+
+
+def test_unexpected_handler_error_returns_500(monkeypatch):
+    service = TaxService(load_saved_page(DEFAULT_PAGE))
+
+    def fail(zip_code, payment):
+        raise RuntimeError("pricing bug")
+
+    monkeypatch.setattr(service, 'price_one', fail)
+    status, payload = exchange(service, b'GET /tax?zip=92019&payment=10 HTTP/1.1\r\nConnection: close\r\n\r\n')
+    assert status == 500
+    assert payload == {'error': "Internal server error"}
+
+
+def test_pricing_value_error_is_not_reported_as_malformed(monkeypatch):
+    service = TaxService(load_saved_page(DEFAULT_PAGE))
+
+    def fail(zip_code, payment):
+        raise ValueError("bad rate")
+
+    monkeypatch.setattr(service, 'price_one', fail)
+    status, _ = exchange(service, b'GET /tax?zip=92019&payment=10 HTTP/1.1\r\nConnection: close\r\n\r\n')
+    assert status == 500
+
+
+def test_malformed_request_line_returns_400():
+    service = TaxService(load_saved_page(DEFAULT_PAGE))
+    status, payload = exchange(service, b'NONSENSE\r\n\r\n')
+    assert status == 400
+    assert payload == {'error': "Malformed HTTP request"}
+
+
+def test_overflowing_payment_is_a_priced_error(monkeypatch):
+    service = TaxService(load_saved_page(DEFAULT_PAGE))
+    monkeypatch.setattr(service.lookups, 'location', lambda zip_code: Location('EL CAJON', 'SAN DIEGO', 'CALIFORNIA'))
+    status, payload = exchange(service, b'GET /tax?zip=92019&payment=1e400000000 HTTP/1.1\r\nConnection: close\r\n\r\n')
+    assert status == 422
+    assert payload['error'] == "Invalid payment amount"
+
+
+def test_batch_pricing_goes_through_the_lookup_caches():
+    service = TaxService(load_saved_page(DEFAULT_PAGE))
+    items = [('92019', '100.00'), ('92020', '5'), ('92019', '7.50'), ('10001', '1'), ('9201', '1'), ('99999', '1')]
+    first = service.price_many(items)
+    assert first == [service.price_one(zip_code, payment) for zip_code, payment in items]
+
+    before = service.lookups.stats()
+    assert service.price_many(items) == first
+    after = service.lookups.stats()
+    assert after['locations']['misses'] == before['locations']['misses']
+    assert after['locations']['hits'] - before['locations']['hits'] == 4
+    assert after['rates']['hits'] - before['rates']['hits'] == 3
@@ -0,0 +1,38 @@
+import pytest
+
+from zip_index import ZipIndex, build_zip_index
+from zip_resolver import ZipResolver
+
+# Inputs int() would read as a ZIP that pgeocode does not find, and ones both normalize
+ODD_INPUTS = [' 92019', '92019 ', 92019, '92_019', '092019', '٩٢٠١٩', '９２０１９',
+              '9201', '+9201', '', 'ABCDE', '99999']
+
+
+@pytest.fixture
+def index(tmp_path):
+    path = str(tmp_path / 'zip_index.bin')
+    build_zip_index(path)
+    with ZipIndex(path) as index:
+        yield index
+
+
+def test_index_answers_like_zip_resolver(index):
+    resolver = ZipResolver('US')
+    zip_codes = index.postal_codes()
+    assert len(zip_codes) == len(index) > 0
+    for zip_code in zip_codes + ODD_INPUTS:
+        assert index.resolve(zip_code) == resolver.resolve(zip_code), zip_code
+        expected = resolver.coordinates(zip_code)
+        if expected is None:
+            assert index.coordinates(zip_code) is None, zip_code
+        else:
+            # Coordinates are stored as 32-bit floats
+            assert index.coordinates(zip_code) == pytest.approx(expected, abs=1e-4), zip_code
+    assert index.resolve_many(zip_codes + ODD_INPUTS) == resolver.resolve_many(zip_codes + ODD_INPUTS)
+
+
+@pytest.mark.parametrize('zip_code', ['92_019', '092019', '٩٢٠١٩'])
+def test_lookalike_zips_are_not_found(index, zip_code):
+    assert '92019' in index
+    assert zip_code not in index
+    assert index.resolve(zip_code)['city'] is None
@@ -0,0 +1,54 @@
+import pytest
+
+from final import get_location_from_zip, get_tax_rate, parse_tax_components
+from mock_cdtfa_server import DEFAULT_PAGE
+from rate_cache import load_saved_page
+from rate_table import RateTable, rate_to_units
+from zip_rate_table import ZipRateTable, build_zip_rate_table, rate_version
+from zip_resolver import list_postal_codes
+
+
+@pytest.fixture
+def built(tmp_path):
+    tax_data = load_saved_page(DEFAULT_PAGE)
+    path = str(tmp_path / 'ca_zip_rates.bin')
+    build_zip_rate_table(tax_data, path)
+    with ZipRateTable(path) as table:
+        yield tax_data, table
+
+
+def test_lookup_matches_the_per_zip_functions(built):
+    tax_data, table = built
+    rate_table = RateTable(tax_data)
+    zip_codes = sorted(code for code in list_postal_codes('CA') if code.isdigit() and len(code) == 5)
+    assert zip_codes
+    for zip_code in zip_codes:
+        location_info = get_location_from_zip(zip_code)
+        record = table.lookup(zip_code)
+        if location_info is None:
+            assert record is None
+            continue
+
+        assert [record[key] for key in ('city', 'county', 'state')] == [location_info[key] for key in ('city', 'county', 'state')]
+        tax_rate = get_tax_rate(location_info['city'], location_info['county'], rate_table)
+        assert record['tax_rate'] == tax_rate
+        if tax_rate:
+            state_rate, city_rate, county_rate = parse_tax_components(tax_rate)
+            assert rate_to_units(record['state_rate']) == rate_to_units(state_rate)
+            assert rate_to_units(record['city_rate']) == rate_to_units(city_rate)
+            assert rate_to_units(record['county_rate']) == rate_to_units(county_rate)
+    assert table.lookup('10001') is None
+    assert table.lookup(' 92019') == table.lookup('92019') is not None
+    for lookalike in ('92_019', '092019', '٩٢٠١٩'):
+        assert table.lookup(lookalike) is None
+
+
+def test_table_records_the_rates_it_was_built_from(built):
+    tax_data, table = built
+    assert table.rate_version == RateTable(tax_data).version == rate_version(tax_data)
+    table.require_rates(tax_data)
+
+    newer = list(tax_data)
+    newer[0] = (newer[0][0], newer[0][1], '9.999%')
+    with pytest.raises(ValueError, match="rebuild it"):
+        table.require_rates(newer)
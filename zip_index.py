@@ -0,0 +1,278 @@
+# Bundled binary ZIP -> city/county/state index, so pricing hosts need no pgeocode at runtime.
+# A build step (run once, where pgeocode and its GeoNames download are available)
+# writes every US postal code with the same cleaned city, county and state that
+# ZipResolver returns, and its latitude/longitude, as sorted integer and float columns
+# plus a string table. At runtime the file is memory-mapped and binary-searched: no
+# pandas import and no network access.
+import argparse
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+
+from records import Location
+from zip_rate_table import NO_STRING
+from zip_resolver import normalize_zip
+
+MAGIC = b'ZIPINDX1'
+FORMAT_VERSION = 2
+HEADER = struct.Struct('<8sIII4x')
+ROOT = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_INDEX_PATH = os.environ.get('ZIP_CODES_ZIP_INDEX', os.path.join(ROOT, 'data', 'us_zip_index.bin'))
+
+ID_COLUMNS = ('city', 'county', 'state', 'state_code')
+COORDINATE_COLUMNS = ('latitude', 'longitude')
+
+
+# Function to compute where each section starts for an index of the given size
+def section_offsets(record_count, string_count):
+    offsets = {}
+    position = HEADER.size
+    for name in ('zip',) + ID_COLUMNS + COORDINATE_COLUMNS:
+        offsets[name] = position
+        position += 4 * record_count
+    offsets['string_offsets'] = position
+    position += 4 * (string_count + 1)
+    offsets['strings'] = position
+    return offsets
+
+
+# Function to write (zip, city, county, state, state_code, latitude, longitude) records to the
+# index format; missing coordinates are stored as NaN
+def write_index(records, path=DEFAULT_INDEX_PATH):
+    if sys.byteorder != 'little':
+        raise RuntimeError("The ZIP index format is little-endian only")
+
+    records = sorted(records)
+    strings = []
+    string_ids = {}
+
+    def string_id(value):
+        if value is None:
+            return NO_STRING
+        if value not in string_ids:
+            string_ids[value] = len(strings)
+            strings.append(value)
+        return string_ids[value]
+
+    columns = [array('I', (record[0] for record in records))]
+    for position in range(1, len(ID_COLUMNS) + 1):
+        columns.append(array('I', (string_id(record[position]) for record in records)))
+    for position in range(len(ID_COLUMNS) + 1, len(ID_COLUMNS) + 1 + len(COORDINATE_COLUMNS)):
+        columns.append(array('f', (float('nan') if record[position] is None else record[position] for record in records)))
+
+    encoded = [value.encode('utf-8') for value in strings]
+    string_offsets = array('I', [0])
+    for value in encoded:
+        string_offsets.append(string_offsets[-1] + len(value))
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    temporary_path = path + '.tmp'
+    with open(temporary_path, 'wb') as handle:
+        handle.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(records), len(strings)))
+        for column in columns:
+            handle.write(column.tobytes())
+        handle.write(string_offsets.tobytes())
+        handle.write(b''.join(encoded))
+    os.replace(temporary_path, path)
+    return len(records)
+
+
+# Function to build the index from the pgeocode dataset for a country
+def build_zip_index(path=DEFAULT_INDEX_PATH, country='US'):
+    from zip_resolver import clean_column, coordinate_column, get_nominatim
+
+    frame = get_nominatim(country)._data_frame
+    frame = frame[frame['postal_code'].astype(str).str.isdigit()]
+    records = zip(
+        (int(code) for code in frame['postal_code'].tolist()),
+        clean_column(frame['place_name'], first_part=True),
+        clean_column(frame['county_name']),
+        clean_column(frame['state_name']),
+        clean_column(frame['state_code']),
+        coordinate_column(frame['latitude']),
+        coordinate_column(frame['longitude']),
+    )
+    return write_index(records, path)
+
+
+# Memory-mapped, read-only ZIP index answering the same questions as ZipResolver
+class ZipIndex:
+    def __init__(self, path=DEFAULT_INDEX_PATH):
+        self.path = path
+        with open(path, 'rb') as handle:
+            self._mmap = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, record_count, string_count = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            self._mmap.close()
+            raise ValueError(f"{path} is not a version {FORMAT_VERSION} ZIP index; rebuild it with: python zip_index.py build")
+
+        self.record_count = record_count
+        offsets = section_offsets(record_count, string_count)
+        view = memoryview(self._mmap)
+        self._views = [view]
+
+        def column(name, count=record_count, typecode='I'):
+            section = view[offsets[name]:offsets[name] + 4 * count].cast(typecode)
+            self._views.append(section)
+            return section
+
+        self.zips = column('zip')
+        self.ids = {name: column(name) for name in ID_COLUMNS}
+        self.latitudes = column('latitude', typecode='f')
+        self.longitudes = column('longitude', typecode='f')
+        self._string_offsets = column('string_offsets', string_count + 1)
+        self._strings_start = offsets['strings']
+        self._string_cache = {}
+
+    def __len__(self):
+        return self.record_count
+
+    def __contains__(self, zip_code):
+        return self.index_of(zip_code) is not None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        for view in reversed(self._views):
+            view.release()
+        self._views = []
+        self._mmap.close()
+
+    def string(self, string_id):
+        if string_id == NO_STRING:
+            return None
+        value = self._string_cache.get(string_id)
+        if value is None:
+            start = self._strings_start + self._string_offsets[string_id]
+            end = self._strings_start + self._string_offsets[string_id + 1]
+            value = sys.intern(self._mmap[start:end].decode('utf-8'))
+            self._string_cache[string_id] = value
+        return value
+
+    # Position of a ZIP in the sorted ZIP column, or None when it is not in the index.
+    # ZIPs are normalized as ZipResolver does and must then be five ASCII digits:
+    # int() alone would also take '92_019', '092019' or non-ASCII digits.
+    def index_of(self, zip_code):
+        code = normalize_zip(zip_code)
+        if len(code) != 5 or not (code.isascii() and code.isdigit()):
+            return None
+        key = int(code)
+        position = bisect_left(self.zips, key)
+        if position < self.record_count and self.zips[position] == key:
+            return position
+        return None
+
+    # City/county/state of a ZIP; all None when the ZIP is unknown, as with pgeocode
+    def resolve(self, zip_code):
+        position = self.index_of(zip_code)
+        if position is None:
+            return Location(None, None, None)
+        ids = self.ids
+        return Location(
+            self.string(ids['city'][position]),
+            self.string(ids['county'][position]),
+            self.string(ids['state'][position]),
+        )
+
+    def resolve_many(self, zip_codes):
+        return [self.resolve(zip_code) for zip_code in zip_codes]
+
+    # (latitude, longitude) of a ZIP, or None when it is unknown or has no coordinates
+    def coordinates(self, zip_code):
+        position = self.index_of(zip_code)
+        if position is None:
+            return None
+        latitude, longitude = self.latitudes[position], self.longitudes[position]
+        if latitude != latitude or longitude != longitude:
+            return None
+        return latitude, longitude
+
+    def coordinates_many(self, zip_codes):
+        return [self.coordinates(zip_code) for zip_code in zip_codes]
+
+    # (zip, latitude, longitude) of every postal code with coordinates, optionally for one state
+    def centroids(self, state_code=None):
+        state_codes = self.ids['state_code']
+        latitudes, longitudes = self.latitudes, self.longitudes
+        return [
+            (f'{self.zips[position]:05d}', latitudes[position], longitudes[position])
+            for position in range(self.record_count)
+            if latitudes[position] == latitudes[position] and longitudes[position] == longitudes[position]
+            and (state_code is None or self.string(state_codes[position]) == state_code.upper())
+        ]
+
+    # Ask the OS to read the whole file in now so the first lookups do not fault pages in
+    def warm_up(self):
+        if hasattr(mmap, 'MADV_WILLNEED'):
+            self._mmap.madvise(mmap.MADV_WILLNEED)
+
+    # Every postal code in the index as a 5-digit string, optionally for one state (e.g. 'CA')
+    def postal_codes(self, state_code=None):
+        state_codes = self.ids['state_code']
+        return [
+            f'{self.zips[position]:05d}' for position in range(self.record_count)
+            if state_code is None or self.string(state_codes[position]) == state_code.upper()
+        ]
+
+
+# Function to compare the index with pgeocode for every ZIP; returns the mismatching ZIPs
+def verify_zip_index(path=DEFAULT_INDEX_PATH, country='US'):
+    from zip_resolver import ZipResolver
+
+    resolver = ZipResolver(country)
+    with ZipIndex(path) as index:
+        zip_codes = index.postal_codes()
+        expected = resolver.resolve_many(zip_codes)
+        return [
+            zip_code for zip_code, location_info in zip(zip_codes, expected)
+            if index.resolve(zip_code) != location_info
+        ]
+
+
+# Main function
+def main():
+    parser = argparse.ArgumentParser(description="Build or query the bundled binary ZIP index.")
+    parser.add_argument('--index', default=DEFAULT_INDEX_PATH, help="path of the ZIP index file")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('build', help="build the index from the pgeocode US dataset")
+    commands.add_parser('verify', help="check every ZIP in the index against pgeocode")
+    lookup = commands.add_parser('lookup', help="look up one ZIP code")
+    lookup.add_argument('zip', help="5-digit ZIP code")
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        count = build_zip_index(args.index)
+        print(f"Wrote {count} ZIP codes to {args.index} ({os.path.getsize(args.index) / 1024:.0f} KiB).")
+        return 0
+
+    if not os.path.exists(args.index):
+        print(f"No ZIP index at {args.index}. Build it with: python zip_index.py build")
+        return 1
+
+    if args.command == 'verify':
+        mismatches = verify_zip_index(args.index)
+        print(f"{len(mismatches)} ZIP codes differ from pgeocode." + (f" First: {mismatches[:10]}" if mismatches else ""))
+        return 1 if mismatches else 0
+
+    with ZipIndex(args.index) as index:
+        location_info = index.resolve(args.zip)
+    if location_info['city'] is None:
+        print(f"No information found for ZIP code {args.zip}.")
+        return 1
+    print(f"City: {location_info['city']}, County: {location_info['county']}, State: {location_info['state']}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
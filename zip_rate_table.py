@@ -0,0 +1,265 @@
+# Precomputed ZIP -> rate table for California.
+# A build step resolves every California ZIP in the pgeocode dataset to its city,
+# county, CDTFA rate, the name_matching tier that found it and parsed state/city/county components and writes them to a
+# sorted, array-backed binary file. Lookups memory-map that file and binary-search
+# the ZIP column, so no pandas or pgeocode is needed at query time. The header records
+# the version of the rates the table was built from, so a table left over from older
+# rates can be detected and rebuilt.
+import argparse
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from decimal import Decimal
+
+from rate_table import RateTable, build_rate_table, rate_to_units, tax_data_version, units_to_rate
+from zip_resolver import normalize_zip
+
+MAGIC = b'ZIPRATE1'
+FORMAT_VERSION = 3
+# magic, format version, record count, string count, rate version (rate_table.tax_data_version)
+HEADER = struct.Struct('<8sIII16s4x')
+NO_STRING = 0xFFFFFFFF
+DEFAULT_TABLE_PATH = os.environ.get(
+    'ZIP_CODES_ZIP_RATE_TABLE',
+    os.path.join(os.path.expanduser('~'), '.cache', 'zip_codes', 'ca_zip_rates.bin')
+)
+
+ID_COLUMNS = ('city', 'county', 'state', 'tax_rate', 'match')
+UNIT_COLUMNS = ('total_rate', 'state_rate', 'city_rate', 'county_rate')
+
+
+# Function to round a byte offset up to the next 8-byte boundary
+def align8(offset):
+    return (offset + 7) & ~7
+
+
+# Function to compute where each section starts for a table of the given size
+def section_offsets(record_count, string_count):
+    offsets = {}
+    position = HEADER.size
+    offsets['zip'] = position
+    position += 4 * record_count
+    for name in ID_COLUMNS:
+        offsets[name] = position
+        position += 4 * record_count
+    position = align8(position)
+    for name in UNIT_COLUMNS:
+        offsets[name] = position
+        position += 8 * record_count
+    offsets['string_offsets'] = position
+    position += 4 * (string_count + 1)
+    offsets['strings'] = position
+    return offsets
+
+
+# Function to get the version of a set of rates, the same as RateTable.version
+def rate_version(tax_data):
+    if isinstance(tax_data, RateTable):
+        return tax_data.version
+    return tax_data_version(tax_data)
+
+
+# Function to write precomputed records to the binary table format
+def write_table(records, path, version=''):
+    if sys.byteorder != 'little':
+        raise RuntimeError("The ZIP rate table format is little-endian only")
+
+    records = sorted(records, key=lambda record: record['zip'])
+    strings = []
+    string_ids = {}
+
+    def string_id(value):
+        if value is None:
+            return NO_STRING
+        if value not in string_ids:
+            string_ids[value] = len(strings)
+            strings.append(value)
+        return string_ids[value]
+
+    columns = {'zip': array('I', (record['zip'] for record in records))}
+    for name in ID_COLUMNS:
+        columns[name] = array('I', (string_id(record[name]) for record in records))
+    for name in UNIT_COLUMNS:
+        columns[name] = array('q', (record[name] for record in records))
+
+    encoded = [value.encode('utf-8') for value in strings]
+    string_offsets = array('I', [0])
+    for value in encoded:
+        string_offsets.append(string_offsets[-1] + len(value))
+
+    offsets = section_offsets(len(records), len(strings))
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    temporary_path = path + '.tmp'
+    with open(temporary_path, 'wb') as handle:
+        handle.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(records), len(strings), version.encode('ascii')))
+        for name in ('zip',) + ID_COLUMNS + UNIT_COLUMNS:
+            handle.write(b'\0' * (offsets[name] - handle.tell()))
+            handle.write(columns[name].tobytes())
+        handle.write(string_offsets.tobytes())
+        handle.write(b''.join(encoded))
+    os.replace(temporary_path, path)
+    return len(records)
+
+
+# Function to resolve every California ZIP and build the precomputed table
+def build_zip_rate_table(tax_data, path=DEFAULT_TABLE_PATH, state_code='CA'):
+    from final import get_locations_from_zips, match_tax_rate, parse_tax_components
+    from zip_resolver import list_postal_codes
+
+    rate_table = build_rate_table(tax_data)
+    zip_codes = sorted({code for code in list_postal_codes(state_code) if code.isdigit() and len(code) == 5})
+
+    records = []
+    for zip_code, location_info in zip(zip_codes, get_locations_from_zips(zip_codes)):
+        if not location_info:
+            continue
+
+        record = dict(location_info, zip=int(zip_code), tax_rate=None, match=None)
+        record.update(dict.fromkeys(UNIT_COLUMNS, 0))
+
+        tax_rate, match, _ = match_tax_rate(location_info['city'], location_info['county'], rate_table)
+        if tax_rate:
+            state_rate, city_rate, county_rate = parse_tax_components(tax_rate)
+            if state_rate is not None:
+                record['tax_rate'] = tax_rate
+                record['match'] = match
+                record['total_rate'] = rate_to_units(Decimal(tax_rate.strip('%')) / 100)
+                record['state_rate'] = rate_to_units(state_rate)
+                record['city_rate'] = rate_to_units(city_rate)
+                record['county_rate'] = rate_to_units(county_rate)
+
+        records.append(record)
+
+    return write_table(records, path, rate_table.version)
+
+
+# Memory-mapped, read-only view of a built ZIP rate table
+class ZipRateTable:
+    def __init__(self, path=DEFAULT_TABLE_PATH):
+        self.path = path
+        with open(path, 'rb') as handle:
+            self._mmap = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, record_count, string_count, built_from = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            self._mmap.close()
+            raise ValueError(f"{path} is not a version {FORMAT_VERSION} ZIP rate table; rebuild it with: python zip_rate_table.py build")
+
+        self.record_count = record_count
+        # Version of the rates the table was built from
+        self.rate_version = built_from.rstrip(b'\0').decode('ascii') or None
+        offsets = section_offsets(record_count, string_count)
+        view = memoryview(self._mmap)
+        self._views = [view]
+
+        def column(name, typecode, size, count=record_count):
+            section = view[offsets[name]:offsets[name] + size * count].cast(typecode)
+            self._views.append(section)
+            return section
+
+        self.zips = column('zip', 'I', 4)
+        self.ids = {name: column(name, 'I', 4) for name in ID_COLUMNS}
+        self.units = {name: column(name, 'q', 8) for name in UNIT_COLUMNS}
+        self._string_offsets = column('string_offsets', 'I', 4, string_count + 1)
+        self._strings_start = offsets['strings']
+        self._string_cache = {}
+
+    def __len__(self):
+        return self.record_count
+
+    def __contains__(self, zip_code):
+        return self.index_of(zip_code) is not None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        for view in reversed(self._views):
+            view.release()
+        self._views = []
+        self._mmap.close()
+
+    def string(self, string_id):
+        if string_id == NO_STRING:
+            return None
+        value = self._string_cache.get(string_id)
+        if value is None:
+            start = self._strings_start + self._string_offsets[string_id]
+            end = self._strings_start + self._string_offsets[string_id + 1]
+            value = self._mmap[start:end].decode('utf-8')
+            self._string_cache[string_id] = value
+        return value
+
+    # Raise ValueError unless the table was built from these rates
+    def require_rates(self, tax_data):
+        current = rate_version(tax_data)
+        if self.rate_version != current:
+            raise ValueError(f"{self.path} was built from rates {self.rate_version}, but the current rates are {current}; "
+                             f"rebuild it with: python zip_rate_table.py build")
+
+    # Position of a ZIP in the sorted ZIP column, or None when it is not in the table.
+    # ZIPs are normalized as ZipResolver does and must then be five ASCII digits:
+    # int() alone would also take '92_019', '092019' or non-ASCII digits.
+    def index_of(self, zip_code):
+        code = normalize_zip(zip_code)
+        if len(code) != 5 or not (code.isascii() and code.isdigit()):
+            return None
+        key = int(code)
+        position = bisect_left(self.zips, key)
+        if position < self.record_count and self.zips[position] == key:
+            return position
+        return None
+
+    # Look up the precomputed location, rate and components for a ZIP
+    def lookup(self, zip_code):
+        position = self.index_of(zip_code)
+        if position is None:
+            return None
+
+        result = {'zip': f'{self.zips[position]:05d}'}
+        for name in ID_COLUMNS:
+            result[name] = self.string(self.ids[name][position])
+        for name in UNIT_COLUMNS:
+            result[name] = units_to_rate(self.units[name][position]) if result['tax_rate'] else None
+        return result
+
+
+# Main function
+def main():
+    parser = argparse.ArgumentParser(description="Build or query the precomputed California ZIP rate table.")
+    parser.add_argument('--table', default=DEFAULT_TABLE_PATH, help="path of the binary table")
+    parser.add_argument('--rates-page', help="build from a saved CDTFA page instead of the rate cache")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('build', help="resolve every California ZIP and write the table")
+    lookup_parser = commands.add_parser('lookup', help="look up ZIP codes in the table")
+    lookup_parser.add_argument('zip_codes', nargs='+')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        from rate_cache import load_saved_page, load_tax_data
+        tax_data = load_saved_page(args.rates_page) if args.rates_page else load_tax_data()
+        if not tax_data:
+            print("No tax data was extracted. Exiting...")
+            return 1
+        count = build_zip_rate_table(tax_data, args.table)
+        print(f"Wrote {count} California ZIP codes to {args.table} (rates {rate_version(tax_data)}).")
+        return 0
+
+    with ZipRateTable(args.table) as table:
+        print(f"Built from rates {table.rate_version}.")
+        for zip_code in args.zip_codes:
+            print(f"{zip_code}: {table.lookup(zip_code)}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
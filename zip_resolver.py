@@ -0,0 +1,145 @@
+# Shared ZIP code resolver backed by a single pgeocode Nominatim instance.
+# Building Nominatim reloads and re-indexes the whole US postal dataset, so it is
+# created once per process and reused by every lookup. When the bundled binary ZIP
+# index (zip_index.py) has been built, lookups read it instead and pgeocode is never loaded.
+import os
+import threading
+
+from records import Location
+
+_nominatim_lock = threading.Lock()
+_nominatims = {}
+_resolver = None
+
+
+# Function to get the process-wide Nominatim for a country, loading it on first use
+def get_nominatim(country='US'):
+    country = country.upper()
+    nomi = _nominatims.get(country)
+    if nomi is None:
+        with _nominatim_lock:
+            nomi = _nominatims.get(country)
+            if nomi is None:
+                # Imported here because pgeocode pulls in pandas, which is slow to import
+                import pgeocode
+
+                nomi = pgeocode.Nominatim(country)
+                _nominatims[country] = nomi
+    return nomi
+
+
+# Function to turn a ZIP given as a string or number into the 5-digit form pgeocode expects
+def normalize_zip(zip_code):
+    return str(zip_code).strip().zfill(5)
+
+
+# Function to convert a pgeocode field to an upper-cased string, mapping NaN and blanks to None
+def clean_field(value, first_part=False):
+    if not isinstance(value, str) or not value:
+        return None
+    if first_part:
+        value = value.split(',')[0]
+    return value.upper()
+
+
+# Function to clean a whole pgeocode column at once, mapping NaN and blanks to None
+def clean_column(column, first_part=False):
+    values = column.astype(object)
+    values = values.where(values.notna(), '').astype(str)
+    if first_part:
+        values = values.str.split(',').str[0]
+    values = values.str.upper()
+    return [value if value else None for value in values.tolist()]
+
+
+# Function to convert a pgeocode coordinate column to floats, mapping NaN to None
+def coordinate_column(column):
+    return [None if value != value else float(value) for value in column.tolist()]
+
+
+# Resolver answering ZIP -> city/county/state from one loaded postal dataset
+class ZipResolver:
+    def __init__(self, country='US'):
+        self.country = country
+
+    @property
+    def nominatim(self):
+        return get_nominatim(self.country)
+
+    # Load the postal dataset now so the first lookup does not pay for it
+    def warm_up(self):
+        self.nominatim
+
+    # Resolve a single ZIP code to a city/county/state Location
+    def resolve(self, zip_code):
+        location_info = self.nominatim.query_postal_code(normalize_zip(zip_code))
+        return Location(
+            clean_field(location_info.place_name, first_part=True),
+            clean_field(location_info.county_name),
+            clean_field(location_info.state_name)
+        )
+
+    # Resolve a list or array of ZIP codes with one vectorized pgeocode query
+    def resolve_many(self, zip_codes):
+        codes = [normalize_zip(zip_code) for zip_code in zip_codes]
+        if not codes:
+            return []
+
+        frame = self.nominatim.query_postal_code(codes)
+        cities = clean_column(frame['place_name'], first_part=True)
+        counties = clean_column(frame['county_name'])
+        states = clean_column(frame['state_name'])
+
+        return [Location(city, county, state) for city, county, state in zip(cities, counties, states)]
+
+    # (latitude, longitude) of a ZIP code, or None when pgeocode has no coordinates for it
+    def coordinates(self, zip_code):
+        return self.coordinates_many([zip_code])[0]
+
+    def coordinates_many(self, zip_codes):
+        codes = [normalize_zip(zip_code) for zip_code in zip_codes]
+        if not codes:
+            return []
+
+        frame = self.nominatim.query_postal_code(codes)
+        return [
+            None if latitude is None or longitude is None else (latitude, longitude)
+            for latitude, longitude in zip(coordinate_column(frame['latitude']), coordinate_column(frame['longitude']))
+        ]
+
+    # (zip, latitude, longitude) of every postal code with coordinates, optionally for one state
+    def centroids(self, state_code=None):
+        # pgeocode keeps its one-row-per-postal-code table on a private attribute
+        frame = self.nominatim._data_frame
+        if state_code is not None:
+            frame = frame[frame['state_code'] == state_code.upper()]
+        frame = frame[frame['latitude'].notna() & frame['longitude'].notna()]
+        return list(zip(
+            [normalize_zip(code) for code in frame['postal_code'].tolist()],
+            coordinate_column(frame['latitude']),
+            coordinate_column(frame['longitude']),
+        ))
+
+
+# Function to list every postal code in the loaded dataset, optionally for one state (e.g. 'CA')
+def list_postal_codes(state_code=None, country='US'):
+    resolver = get_resolver()
+    if country.upper() == 'US' and hasattr(resolver, 'postal_codes'):
+        return resolver.postal_codes(state_code)
+
+    # pgeocode keeps its one-row-per-postal-code table on a private attribute
+    frame = get_nominatim(country)._data_frame
+    if state_code is not None:
+        frame = frame[frame['state_code'] == state_code]
+    return frame['postal_code'].tolist()
+
+
+# Function to get the shared resolver used by the command-line apps: the bundled ZIP
+# index when it has been built, pgeocode otherwise
+def get_resolver():
+    global _resolver
+    if _resolver is None:
+        from zip_index import DEFAULT_INDEX_PATH, ZipIndex
+
+        _resolver = ZipIndex(DEFAULT_INDEX_PATH) if os.path.exists(DEFAULT_INDEX_PATH) else ZipResolver('US')
+    return _resolver